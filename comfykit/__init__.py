@@ -0,0 +1,17 @@
+"""
+comfykit - helpers for driving ComfyUI from Python scripts
+
+The test and batch scripts in this repository import from here instead of
+carrying their own copies of the workflow conversion and API code.
+"""
+
+from comfykit.compiler import WorkflowError, compile_workflow, dedupe_prompt, load_workflow
+from comfykit.schema import NodeSchema
+
+__all__ = [
+    "NodeSchema",
+    "WorkflowError",
+    "compile_workflow",
+    "dedupe_prompt",
+    "load_workflow",
+]
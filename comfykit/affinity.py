@@ -0,0 +1,111 @@
+"""
+Group jobs by the models they load, so servers don't swap checkpoints
+between every job.
+
+On a --lowvram 6 GB card, switching between the Realistic Vision checkpoint,
+the SD1.5 inpainting checkpoint and the GroundingDINO/SAM models costs
+seconds per switch. model_set() reads the loader widgets from a compiled
+prompt; AffinityQueue hands each server the next job that uses the models it
+already has loaded, with a fairness bound so no group of jobs waits forever.
+"""
+
+import collections
+import itertools
+
+# Loader node types and the inputs that name a model file.
+# Other node types ending in "Loader" are matched by their *_name inputs.
+MODEL_INPUTS = {
+    'CheckpointLoaderSimple': ('ckpt_name',),
+    'CheckpointLoader': ('ckpt_name', 'config_name'),
+    'UNETLoader': ('unet_name',),
+    'VAELoader': ('vae_name',),
+    'CLIPLoader': ('clip_name',),
+    'DualCLIPLoader': ('clip_name1', 'clip_name2'),
+    'LoraLoader': ('lora_name',),
+    'LoraLoaderModelOnly': ('lora_name',),
+    'ControlNetLoader': ('control_net_name',),
+    'UpscaleModelLoader': ('model_name',),
+    'GroundingDinoModelLoader (segment anything)': ('model_name',),
+    'SAMModelLoader (segment anything)': ('model_name',),
+}
+
+
+def model_set(prompt):
+    """Return a frozenset of (class_type, model name) loaded by a prompt"""
+    models = set()
+    for node in prompt.values():
+        class_type = node['class_type']
+        inputs = node['inputs']
+        names = MODEL_INPUTS.get(class_type)
+        if names is None:
+            if 'Loader' not in class_type:
+                continue
+            names = [k for k in inputs if k.endswith('_name')]
+        for name in names:
+            value = inputs.get(name)
+            if isinstance(value, str):
+                models.add((class_type, value))
+    return frozenset(models)
+
+
+class _Group:
+    def __init__(self):
+        self.items = collections.deque()
+        self.overtaken = 0
+
+
+class AffinityQueue:
+    """Pending jobs bucketed by model set.
+
+    pop(resident) returns the oldest job using `resident` models if there is
+    one, otherwise the oldest job overall. A group that has been overtaken
+    by `max_skips` later jobs from other groups is served next regardless,
+    which bounds how long any job can be starved.
+    """
+
+    def __init__(self, max_skips=8):
+        self.max_skips = max_skips
+        self._groups = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return sum(len(g.items) for g in self._groups.values())
+
+    def push(self, item, key):
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group()
+        group.items.append((next(self._seq), item))
+
+    def push_front(self, item, key):
+        """Put an item back at the head (e.g. after its host died)"""
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group()
+        group.items.appendleft((-1, item))
+
+    def _oldest(self):
+        return min(self._groups.items(), key=lambda kv: kv[1].items[0][0])
+
+    def pop(self, resident=None):
+        """Return (item, key) of the next job for a server with `resident`
+        models loaded, or None if the queue is empty"""
+        if not self._groups:
+            return None
+
+        starved = [kv for kv in self._groups.items() if kv[1].overtaken >= self.max_skips]
+        if starved:
+            key, group = min(starved, key=lambda kv: kv[1].items[0][0])
+        elif resident in self._groups:
+            key, group = resident, self._groups[resident]
+        else:
+            key, group = self._oldest()
+
+        seq, item = group.items.popleft()
+        group.overtaken = 0
+        for other_key, other in self._groups.items():
+            if other_key != key and other.items[0][0] < seq:
+                other.overtaken += 1
+        if not group.items:
+            del self._groups[key]
+        return item, key
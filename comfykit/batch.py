@@ -0,0 +1,404 @@
+"""
+Parameter-grid batch runs against a ComfyUI server.
+
+Jobs are fed to the server a few at a time: the runner keeps `depth` of its
+own prompts in the server queue, so the GPU always has the next job ready
+without the queue (and the server's memory of it) growing to the whole
+batch. Each of the `depth` lanes per host submits a job, waits for its
+completion event and immediately submits the next one; with several hosts
+the Scheduler places each job on the least-loaded one. Pending jobs are
+grouped by the models they load (see comfykit.affinity) so each server
+works through one checkpoint's jobs before switching to the next.
+
+With `pack` > 1, up to that many jobs that load the same models are fused
+into one prompt (see comfykit.packing) and their outputs split back per job.
+
+With `download_dir` set, each job's images are streamed down as soon as it
+finishes (see comfykit.outputs), alongside an index of their parameters.
+Such a job only counts (and is journaled) as done once its images are
+down; a failed download fails the job.
+
+With a `profiler` (comfykit.profiler), node timings of every prompt are
+collected from the hosts' event streams.
+
+With a `journal` (comfykit.journal), every job's progress is recorded as it
+happens and a rerun of the same batch resumes it: finished jobs are
+skipped, and prompts the previous run left on a server are picked up from
+its history or resubmitted. Jobs recorded as done without their images
+downloaded are fetched again from the server's history.
+
+With a `result_cache` (comfykit.resultcache) and `download_dir`, a job
+whose prompt has run before gets its images from the cache instead of the
+server, and the images of every job that does run are added to it.
+"""
+
+import asyncio
+import copy
+import itertools
+import time
+import zlib
+
+from comfykit.affinity import AffinityQueue, model_set
+from comfykit.client import ComfyError
+from comfykit.compiler import dedupe_prompt
+from comfykit.journal import DONE, SUBMITTED, batch_id
+from comfykit.outputs import OutputCollector, output_images, server_name
+from comfykit.packing import pack_prompts, split_result
+from comfykit.resultcache import prompt_keys
+from comfykit.scheduler import Scheduler
+from comfykit.tracker import history_result
+
+
+def expand_grid(seeds=(None,), denoise=(None,), cfg=(None,), steps=(None,), prompts=(None,),
+                checkpoints=(None,)):
+    """Return one params dict per combination. None values are left out so
+    the workflow's own setting is kept for that parameter."""
+    jobs = []
+    for seed, d, c, s, p, ckpt in itertools.product(seeds, denoise, cfg, steps, prompts, checkpoints):
+        params = {'seed': seed, 'denoise': d, 'cfg': c, 'steps': s, 'positive': p,
+                  'ckpt_name': ckpt}
+        jobs.append({k: v for k, v in params.items() if v is not None})
+    return jobs
+
+
+def job_label(params):
+    """Short filename-safe label for a params dict, e.g. s42_d0.3_c7.5"""
+    parts = []
+    for key, short in (('seed', 's'), ('denoise', 'd'), ('cfg', 'c'), ('steps', 'n')):
+        if key in params:
+            parts.append(f"{short}{params[key]}")
+    if 'positive' in params:
+        parts.append(f"p{zlib.crc32(params['positive'].encode()) % 10000:04d}")
+    return "_".join(parts) or "job"
+
+
+class BatchJob:
+    """One grid point: its params and what happened to it"""
+
+    def __init__(self, index, params):
+        self.index = index
+        self.params = params
+        self.prompt_id = None
+        self.host = None
+        self.outputs = {}
+        self.files = []
+        self.key = None
+        self.submitted_at = None
+        self.finished_at = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+
+class BatchProgress:
+    """Throughput and finish-time estimate for a running batch"""
+
+    def __init__(self, total_jobs, images_per_job=1):
+        self.total_jobs = total_jobs
+        self.images_per_job = images_per_job
+        self.started_at = time.time()
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    @property
+    def images_per_hour(self):
+        if self.completed == 0 or self.elapsed <= 0:
+            return 0.0
+        return self.completed * self.images_per_job * 3600 / self.elapsed
+
+    @property
+    def eta(self):
+        """Estimated finish time as a unix timestamp, or None before the first job"""
+        if self.completed == 0:
+            return None
+        remaining = self.total_jobs - self.completed - self.failed
+        return time.time() + remaining * self.elapsed / self.completed
+
+    def summary(self):
+        finished = self.completed + self.failed
+        line = f"{finished}/{self.total_jobs} jobs"
+        if self.failed:
+            line += f" ({self.failed} failed)"
+        line += f", {self.images_per_hour:.0f} images/hour"
+        if self.eta is not None:
+            line += f", ETA {time.strftime('%H:%M', time.localtime(self.eta))}"
+        return line
+
+
+class BatchRunner:
+    """Submit rendered template prompts, keeping `depth` of them queued"""
+
+    def __init__(self, template, jobs, urls, depth=2, prefix="batch", on_progress=None,
+                 max_skips=8, download_dir=None, pack=1, journal=None, profiler=None,
+                 result_cache=None, images=None):
+        outputs = template.outputs()
+        if len(outputs) > 1:
+            # Every slot would write to each branch: one grid point would
+            # render (and save under one label) one image per branch
+            raise ValueError(f"The workflow saves images from {len(outputs)} nodes "
+                             f"({', '.join(outputs)}); batch one branch of it "
+                             f"(PromptTemplate.branch, run-batch.py --output)")
+        self.template = template
+        self.jobs = [BatchJob(i, params) for i, params in enumerate(jobs)]
+        self.urls = [urls] if isinstance(urls, str) else list(urls)
+        self.depth = max(1, depth)
+        self.prefix = prefix
+        self.on_progress = on_progress
+        self.max_skips = max_skips
+        self.download_dir = download_dir
+        self.pack = max(1, pack)
+        self.journal = journal
+        self.profiler = profiler
+        # Cached images are only useful where the batch keeps its own copies
+        self.result_cache = result_cache if download_dir is not None else None
+        self.images = images
+        self.batch_id = batch_id(template.prompt, jobs, prefix)
+        self.resumed = 0
+        self.cached = 0
+        self.report = []
+        self._collectors = {}
+        self._downloads = set()
+
+        self.progress = BatchProgress(len(self.jobs))
+
+    def job_prefix(self, job):
+        return f"{self.prefix}/{job.index:05d}_{job_label(job.params)}"
+
+    def render(self, job):
+        params = dict(job.params)
+        if 'filename_prefix' in self.template.slots:
+            params.setdefault('filename_prefix', self.job_prefix(job))
+        return self.template.render(params)
+
+    def packed(self, items):
+        """Queue item for a list of (job, prompt): (jobs, prompt, owners)"""
+        if len(items) == 1:
+            job, prompt = items[0]
+            # Merged after rendering: nodes identical in the template may
+            # differ once their slots are filled in
+            prompt, _ = dedupe_prompt(prompt)
+            return [job], prompt, None
+        prompt, owners = pack_prompts([prompt for _, prompt in items])
+        return [job for job, _ in items], prompt, owners
+
+    async def download(self, scheduler, job, result):
+        collector = self._collectors.get(result.host)
+        if collector is None:
+            collector = OutputCollector(scheduler.client_for(result.host), self.download_dir)
+            self._collectors[result.host] = collector
+        try:
+            job.files = await collector.collect(result, {'index': job.index, **job.params})
+        except Exception as e:
+            job.error = f"download failed: {e}"
+            self._record(job)
+            return
+        if self.result_cache is not None and job.key is not None:
+            self.result_cache.put(job.key, job.files, result.outputs)
+        self._record(job)
+        if self.journal is not None:
+            for (_, image), path in zip(output_images(result.outputs), job.files):
+                self.journal.downloaded(self.batch_id, job.index, server_name(image), path)
+
+    def finish_job(self, scheduler, job, result, error):
+        job.finished_at = time.time()
+        if error is not None:
+            job.error = str(error)
+        else:
+            job.prompt_id = result.prompt_id
+            job.host = result.host
+            job.outputs = result.outputs
+            job.error = result.error
+
+        if self.download_dir is not None and job.error is None:
+            # In the background, so the host slot can take its next job now;
+            # the job is done once its images are
+            task = asyncio.ensure_future(self.download(scheduler, job, result))
+            self._downloads.add(task)
+            task.add_done_callback(self._downloads.discard)
+            return
+        self._record(job)
+
+    def _record(self, job):
+        """Journal and count a job whose outcome is final"""
+        if self.journal is not None:
+            self.journal.finished(self.batch_id, job.index, job.error, job.prompt_id, job.host,
+                                  job.outputs, job.submitted_at, job.finished_at)
+        if job.error is None:
+            self.progress.completed += 1
+        else:
+            self.progress.failed += 1
+        if self.on_progress:
+            self.on_progress(job, self.progress)
+
+    async def from_cache(self, scheduler, jobs, prompts):
+        """Finish the jobs whose prompts have run before from the result
+        cache; returns the (job, prompt) pairs that still have to run"""
+        keys = await prompt_keys(scheduler.hosts[0].client, prompts, self.images)
+        remaining = []
+        for job, prompt, key in zip(jobs, prompts, keys):
+            job.key = key
+            paths = None if key is None else self.result_cache.restore(key, self.download_dir)
+            if paths is None:
+                remaining.append((job, prompt))
+                continue
+            job.files = paths
+            job.host = 'cache'
+            job.submitted_at = job.finished_at = time.time()
+            self.cached += 1
+            if self.journal is not None:
+                self.journal.finished(self.batch_id, job.index, None, None, job.host, None,
+                                      job.submitted_at, job.finished_at)
+                for path in paths:
+                    self.journal.downloaded(self.batch_id, job.index, path.name, path)
+        self.result_cache.save()
+        # Only the jobs left count towards throughput; keep what resume()
+        # already counted
+        self.progress.total_jobs -= len(jobs) - len(remaining)
+        return remaining
+
+    def submitted(self, item, host, prompt_id):
+        if self.profiler is not None:
+            self.profiler.register(prompt_id, item[1])
+        if self.journal is not None:
+            for job in item[0]:
+                self.journal.submitted(self.batch_id, job.index, prompt_id, host.url, job.submitted_at)
+
+    async def resume(self, scheduler):
+        """Settle the batch against the journal; returns the jobs left to run.
+
+        Jobs recorded as done are skipped. Jobs a previous run submitted but
+        never saw finish are adopted if the server's history has them
+        finished, and otherwise removed from its queue and run again. With
+        a download_dir, so are done jobs whose images were never
+        downloaded.
+        """
+        rows = self.journal.begin(self.batch_id, [job.params for job in self.jobs],
+                                  {'prefix': self.prefix})
+        downloaded = self.journal.downloads(self.batch_id)
+        saves = self.download_dir is not None and bool(self.template.outputs())
+        remaining, in_flight = [], []
+        for job in self.jobs:
+            row = rows[job.index]
+            missing = saves and not downloaded.get(job.index)
+            if row['status'] == DONE and missing and row['prompt_id']:
+                in_flight.append((job, row))
+            elif row['status'] == DONE and missing:
+                remaining.append(job)
+            elif row['status'] == DONE:
+                job.files = downloaded.get(job.index, [])
+                job.prompt_id, job.host = row['prompt_id'], row['host']
+                job.submitted_at, job.finished_at = row['submitted_at'], row['finished_at']
+                self.resumed += 1
+            elif row['status'] == SUBMITTED and row['prompt_id']:
+                in_flight.append((job, row))
+            else:
+                remaining.append(job)
+        self.progress = BatchProgress(len(self.jobs) - self.resumed, self.progress.images_per_job)
+
+        settled = {}
+        for job, row in in_flight:
+            prompt_id = row['prompt_id']
+            if prompt_id not in settled:
+                settled[prompt_id] = await self._settle(scheduler, row['host'], prompt_id)
+            result = settled[prompt_id]
+            if result is None:
+                self.journal.requeued(self.batch_id, job.index)
+                remaining.append(job)
+                continue
+            job.submitted_at = row['submitted_at']
+            self.finish_job(scheduler, job, self._own_outputs(job, result), None)
+        return sorted(remaining, key=lambda job: job.index)
+
+    async def _settle(self, scheduler, url, prompt_id):
+        """The finished result of a prompt from an earlier run, or None
+        (after taking it off the server's queue) if it must run again"""
+        try:
+            client = scheduler.client_for(url)
+            history = await client.history(prompt_id)
+        except (KeyError, ComfyError):
+            return None
+        result = history_result(prompt_id, history.get(prompt_id))
+        if result is None or not result.ok:
+            try:
+                await client.delete_queued([prompt_id])
+            except ComfyError:
+                pass
+            return None
+        result.host = client.url
+        return result
+
+    def _own_outputs(self, job, result):
+        """A job's share of a (possibly packed) prompt's outputs, told apart
+        by its filename prefix"""
+        if 'filename_prefix' not in self.template.slots:
+            return result
+        prefix = self.job_prefix(job)
+        outputs = {}
+        for node_id, output in result.outputs.items():
+            images = [image for image in (output or {}).get('images', [])
+                      if server_name(image).startswith(prefix)]
+            if images:
+                outputs[node_id] = {**output, 'images': images}
+        part = copy.copy(result)
+        part.outputs = outputs
+        return part
+
+    async def run(self, scheduler=None):
+        """Run every job; returns the list of BatchJob records"""
+        if scheduler is None:
+            async with Scheduler(self.urls, per_host_depth=self.depth) as scheduler:
+                return await self.run(scheduler)
+
+        if self.profiler is not None:
+            for host in scheduler.hosts:
+                tracker = await host.client.tracker()
+                tracker.add_listener(self.profiler.on_event)
+
+        jobs = self.jobs
+        if self.journal is not None:
+            jobs = await self.resume(scheduler)
+        pending = [(job, self.render(job)) for job in jobs]
+        if self.result_cache is not None and pending:
+            pending = await self.from_cache(scheduler, *zip(*pending))
+
+        queue = AffinityQueue(self.max_skips)
+        open_packs = {}
+        for job, prompt in pending:
+            models = model_set(prompt)
+            items = open_packs.setdefault(models, [])
+            items.append((job, prompt))
+            if len(items) == self.pack:
+                queue.push(self.packed(open_packs.pop(models)), models)
+        for models, items in open_packs.items():
+            queue.push(self.packed(items), models)
+
+        def prompt_of(item):
+            jobs, prompt, _ = item
+            now = time.time()
+            for job in jobs:
+                if job.submitted_at is None:
+                    job.submitted_at = now
+            return prompt
+
+        def on_done(item, result, error):
+            jobs, _, owners = item
+            if error is None and len(jobs) > 1:
+                results = split_result(result, owners, len(jobs))
+            else:
+                results = [result] * len(jobs)
+            for job, part in zip(jobs, results):
+                self.finish_job(scheduler, job, part, error)
+
+        await scheduler.drain(queue, prompt_of, on_done, self.submitted)
+        if self._downloads:
+            await asyncio.gather(*self._downloads)
+        if self.result_cache is not None:
+            self.result_cache.save()
+        self.report = scheduler.report()
+        return self.jobs
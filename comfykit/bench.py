@@ -0,0 +1,269 @@
+"""
+Benchmarks of the client-side pipeline, no GPU or network needed.
+
+Everything runs against FakeComfyServer on localhost, so the numbers are
+comfykit's own overhead, separate from GPU time:
+
+    convert   compile_workflow / dedupe / template render throughput for
+              each bundled workflow, replicated to growing graph sizes
+    submit    prompts/s through ComfyClient.submit at growing batch sizes
+    complete  delay from the server announcing completion to wait()
+              returning, over a batch of prompts
+    download  /view bandwidth streaming images of growing sizes to disk
+    upload    /upload/image bandwidth
+
+Results are saved as JSON (bench-results/<time>-<commit>.json by default)
+so runs from different commits can be compared:
+
+    python3 -m comfykit.bench
+    python3 -m comfykit.bench --quick --compare bench-results/old.json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from comfykit.client import ComfyClient
+from comfykit.compiler import compile_workflow, dedupe_prompt, load_workflow
+from comfykit.fakeserver import FakeComfyServer
+from comfykit.template import PromptTemplate
+
+WORKFLOWS = [
+    "img2img-workflow.json",
+    "inpainting-workflow.json",
+    "auto-mask-inpainting-workflow.json",
+    "batch-overnight-workflow.json",
+]
+RESULTS_DIR = Path("bench-results")
+
+# Graph copies / batch sizes / image sizes per mode
+SIZES = {
+    'full': {'copies': (1, 10, 100, 1000), 'batch': (10, 100, 1000),
+             'images_mb': (1, 16, 64), 'latency_batch': 200},
+    'quick': {'copies': (1, 10, 100), 'batch': (10, 100),
+              'images_mb': (1, 8), 'latency_batch': 50},
+}
+
+
+def scale_workflow(workflow, copies):
+    """The workflow's graph repeated `copies` times with fresh node/link ids"""
+    if copies == 1:
+        return workflow
+    node_step = max(n['id'] for n in workflow['nodes']) + 1
+    link_step = max((link[0] for link in workflow['links']), default=0) + 1
+    nodes, links = [], []
+    for k in range(copies):
+        for node in workflow['nodes']:
+            inputs = [{**inp, 'link': None if inp.get('link') is None else inp['link'] + k * link_step}
+                      for inp in node.get('inputs') or []]
+            nodes.append({**node, 'id': node['id'] + k * node_step, 'inputs': inputs})
+        for link in workflow['links']:
+            link_id, src, src_slot, dst, dst_slot, kind = link
+            links.append([link_id + k * link_step,
+                          None if src is None else src + k * node_step, src_slot,
+                          None if dst is None else dst + k * node_step, dst_slot, kind])
+    return {**workflow, 'nodes': nodes, 'links': links}
+
+
+def _best_of(fn, repeat=3, min_time=0.2):
+    """Best seconds per call of fn(), calling it enough times to measure"""
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or calls >= 1 << 20:
+            break
+        calls *= 4
+    best = elapsed / calls
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def _params(template, i):
+    """Per-job parameters the template has slots for"""
+    params = {'seed': 1000 + i, 'denoise': 0.4}
+    return {k: v for k, v in params.items() if k in template.slots}
+
+
+def bench_convert(sizes, workflow_dir="."):
+    results = []
+    for name in WORKFLOWS:
+        base = load_workflow(Path(workflow_dir) / name)
+        for copies in sizes['copies']:
+            workflow = scale_workflow(base, copies)
+            nodes = len(workflow['nodes'])
+            compile_s = _best_of(lambda: compile_workflow(workflow))
+            prompt = compile_workflow(workflow)
+            dedupe_s = _best_of(lambda: dedupe_prompt(prompt))
+            template = PromptTemplate(prompt)
+            params = _params(template, 0)
+            render_s = _best_of(lambda: template.render(params))
+            results.append({'bench': 'convert', 'workflow': name, 'nodes': nodes,
+                            'compile_nodes_per_s': nodes / compile_s,
+                            'dedupe_nodes_per_s': nodes / dedupe_s,
+                            'renders_per_s': 1 / render_s})
+    return results
+
+
+async def bench_submit(sizes, workflow_dir="."):
+    results = []
+    async with FakeComfyServer(exec_time=0) as server:
+        async with ComfyClient(server.url) as client:
+            for name in WORKFLOWS:
+                template = PromptTemplate(compile_workflow(load_workflow(Path(workflow_dir) / name)))
+                for batch in sizes['batch']:
+                    prompts = [template.render(_params(template, i)) for i in range(batch)]
+                    start = time.perf_counter()
+                    await asyncio.gather(*(client.submit(p) for p in prompts))
+                    elapsed = time.perf_counter() - start
+                    results.append({'bench': 'submit', 'workflow': name, 'batch': batch,
+                                    'prompts_per_s': batch / elapsed})
+                    await client.request('POST', '/queue', json={'clear': True}, read='text')
+    return results
+
+
+async def bench_complete(sizes, workflow_dir="."):
+    results = []
+    batch = sizes['latency_batch']
+    async with FakeComfyServer(exec_time=0.002) as server:
+        async with ComfyClient(server.url) as client:
+            for name in WORKFLOWS:
+                template = PromptTemplate(compile_workflow(load_workflow(Path(workflow_dir) / name)))
+                seen = {}
+
+                async def one(i):
+                    prompt_id = await client.submit(template.render(_params(template, i)))
+                    await client.wait(prompt_id)
+                    seen[prompt_id] = time.time()
+
+                start = time.perf_counter()
+                await asyncio.gather(*(one(i) for i in range(batch)))
+                elapsed = time.perf_counter() - start
+                delays = sorted(seen[p] - server.finished_at[p] for p in seen)
+                results.append({'bench': 'complete', 'workflow': name, 'batch': batch,
+                                'prompts_per_s': batch / elapsed,
+                                'latency_ms_p50': delays[len(delays) // 2] * 1000,
+                                'latency_ms_p99': delays[int(len(delays) * 0.99)] * 1000,
+                                'latency_ms_max': delays[-1] * 1000})
+    return results
+
+
+async def bench_transfer(sizes):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mb in sizes['images_mb']:
+            size = mb * 1024 * 1024
+            async with FakeComfyServer(image_bytes=size) as server:
+                async with ComfyClient(server.url) as client:
+                    dest = Path(tmp) / "image.png"
+                    count = max(2, 64 // mb)
+                    start = time.perf_counter()
+                    for i in range(count):
+                        await client.download(dest, f"bench_{i:05d}_.png")
+                    elapsed = time.perf_counter() - start
+                    results.append({'bench': 'download', 'image_mb': mb, 'files': count,
+                                    'mb_per_s': mb * count / elapsed})
+
+                    data = os.urandom(size)
+                    start = time.perf_counter()
+                    for i in range(count):
+                        await client.upload_image(data, f"bench_{i}.png", overwrite=True)
+                    elapsed = time.perf_counter() - start
+                    results.append({'bench': 'upload', 'image_mb': mb, 'files': count,
+                                    'mb_per_s': mb * count / elapsed})
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(mode='full', only=None, workflow_dir="."):
+    sizes = SIZES[mode]
+    benches = {
+        'convert': lambda: bench_convert(sizes, workflow_dir),
+        'submit': lambda: asyncio.run(bench_submit(sizes, workflow_dir)),
+        'complete': lambda: asyncio.run(bench_complete(sizes, workflow_dir)),
+        'transfer': lambda: asyncio.run(bench_transfer(sizes)),
+    }
+    results = []
+    for name, bench in benches.items():
+        if only and name not in only:
+            continue
+        print(f"⏱️  {name}...")
+        rows = bench()
+        for row in rows:
+            print(f"   {_describe(row)}")
+        results.extend(rows)
+    return {
+        'meta': {'commit': _commit(), 'time': time.time(), 'mode': mode,
+                 'python': platform.python_version(), 'machine': platform.machine(),
+                 'cpus': os.cpu_count()},
+        'results': results,
+    }
+
+
+def _key(row):
+    return tuple((k, v) for k, v in row.items() if not isinstance(v, float))
+
+
+def _describe(row):
+    return "  ".join(f"{k}={v:,.1f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items())
+
+
+def compare(old, new):
+    """Lines of new/old ratios for every metric present in both runs"""
+    before = {_key(row): row for row in old['results']}
+    lines = []
+    for row in new['results']:
+        prev = before.get(_key(row))
+        if prev is None:
+            continue
+        for metric, value in row.items():
+            if isinstance(value, float) and prev.get(metric):
+                ratio = value / prev[metric]
+                # Latencies are better when lower
+                better = ratio < 1 if metric.startswith('latency') else ratio > 1
+                flag = "  " if abs(ratio - 1) < 0.1 else ("✅" if better else "❌")
+                label = "  ".join(f"{k}={v}" for k, v in _key(row))
+                lines.append(f"   {flag} {label} {metric}: {prev[metric]:,.1f} → {value:,.1f} ({ratio:.2f}×)")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark comfykit against a fake ComfyUI server")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes (about a minute)")
+    parser.add_argument("--only", nargs="+", choices=['convert', 'submit', 'complete', 'transfer'])
+    parser.add_argument("--workflows", default=".", help="directory with the bundled workflows")
+    parser.add_argument("--out", help="results file (default: bench-results/<time>-<commit>.json)")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    args = parser.parse_args()
+
+    report = run('quick' if args.quick else 'full', args.only, args.workflows)
+    out = Path(args.out) if args.out else RESULTS_DIR / (
+        time.strftime('%Y%m%d-%H%M%S') + f"-{report['meta']['commit'] or 'nogit'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Saved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), report)) or "   nothing to compare")
@@ -0,0 +1,547 @@
+"""
+Local broker in front of a ComfyUI server, so interactive prompts don't
+wait behind an overnight batch.
+
+ComfyUI runs its queue first come, first served: once run-batch.py has put
+hours of work in it, a prompt from the iPhone (Comfy Portal) waits for all
+of it. The broker speaks the same HTTP + websocket API, but keeps the
+backlog itself and hands the server at most `depth` prompts at a time:
+
+- two priority classes: prompts sent to the broker's root URL are
+  interactive, prompts sent under /batch are batch. The server only gets a
+  batch prompt when no interactive one is waiting,
+- within a class, clients (by client_id) take turns, so one client's
+  thousand-job batch doesn't starve another's,
+- when an interactive prompt arrives, batch prompts already handed to the
+  server but not started are taken back from its queue, so the wait is at
+  most the one job that is running,
+- POST /queue {"delete": [...]} cancels prompts still in the backlog (or in
+  the server queue), and {"clear": true} clears the caller's class.
+
+Every other request (/view, /upload/image, /history, /object_info, the web
+UI, ...) is passed through to the server. Websocket events for a prompt are
+forwarded to the client that submitted it (to every socket if it came
+without a client_id), and status events report the broker's backlog as the
+queue size.
+
+    python3 -m comfykit.broker --upstream http://127.0.0.1:8188 --port 8190
+
+    Comfy Portal:   http://10.0.0.21:8190
+    run-batch.py:   --url http://127.0.0.1:8190/batch
+"""
+
+import asyncio
+import contextlib
+import functools
+import itertools
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import aiohttp
+from aiohttp import WSMsgType, web
+
+from comfykit.client import ComfyClient, ComfyError, PromptRejected
+from comfykit.config import COMFY_URL
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)  # highest first
+PREFIXES = {INTERACTIVE: '', BATCH: '/batch'}
+
+DEFAULT_DEPTH = 2
+# How many finished prompts to remember the submitting client of
+OWNER_MEMORY = 1024
+
+# Headers that describe one hop, not the resource
+HOP_HEADERS = {'host', 'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer',
+               'upgrade', 'content-length', 'content-encoding', 'proxy-authorization'}
+
+
+class BrokerJob:
+    """A prompt held by the broker until it is handed to the server"""
+
+    __slots__ = ('prompt_id', 'prompt', 'client_id', 'sender', 'extra', 'priority', 'number',
+                 'queued_at', 'dispatched_at')
+
+    def __init__(self, prompt_id, prompt, client_id, extra, priority, number, sender=None):
+        self.prompt_id = prompt_id
+        self.prompt = prompt
+        self.client_id = client_id  # None: events go to every socket
+        self.sender = sender or client_id or 'anonymous'  # whose turn it is in FairQueue
+        self.extra = extra
+        self.priority = priority
+        self.number = number
+        self.queued_at = time.time()
+        self.dispatched_at = None
+
+    def queue_item(self):
+        """The job as a /queue entry: [number, prompt_id, prompt, extra, outputs]"""
+        return [self.number, self.prompt_id, self.prompt, {**self.extra, 'client_id': self.client_id}, []]
+
+
+class FairQueue:
+    """Jobs per priority class, and per client (sender) within a class,
+    served round-robin between clients"""
+
+    def __init__(self):
+        self.classes = {priority: OrderedDict() for priority in PRIORITIES}
+
+    def __len__(self):
+        return sum(len(jobs) for clients in self.classes.values() for jobs in clients.values())
+
+    def push(self, job, front=False):
+        jobs = self.classes[job.priority].setdefault(job.sender, deque())
+        if front:
+            jobs.appendleft(job)
+        else:
+            jobs.append(job)
+
+    def pop(self):
+        """Next job: highest class first, then the client whose turn it is"""
+        for clients in self.classes.values():
+            while clients:
+                client_id, jobs = next(iter(clients.items()))
+                if not jobs:
+                    del clients[client_id]
+                    continue
+                job = jobs.popleft()
+                # This client goes to the back of the line
+                clients.move_to_end(client_id)
+                if not jobs:
+                    del clients[client_id]
+                return job
+        return None
+
+    def remove(self, prompt_ids, priority=None):
+        """Drop jobs by id (or every job of a class with prompt_ids None);
+        returns the jobs removed"""
+        removed = []
+        for cls, clients in self.classes.items():
+            if priority is not None and cls != priority:
+                continue
+            for client_id in list(clients):
+                keep = deque()
+                for job in clients[client_id]:
+                    if prompt_ids is None or job.prompt_id in prompt_ids:
+                        removed.append(job)
+                    else:
+                        keep.append(job)
+                if keep:
+                    clients[client_id] = keep
+                else:
+                    del clients[client_id]
+        return removed
+
+    def in_order(self):
+        """Every job in the order pop() would hand them out"""
+        order = []
+        for clients in self.classes.values():
+            order.extend(job for turn in itertools.zip_longest(*clients.values())
+                         for job in turn if job is not None)
+        return order
+
+
+class PromptBroker:
+    """Priority queue + pass-through proxy in front of one ComfyUI server"""
+
+    def __init__(self, upstream=COMFY_URL, host='127.0.0.1', port=8190, depth=DEFAULT_DEPTH,
+                 on_dispatch=None):
+        self.upstream = upstream.rstrip('/')
+        self.host = host
+        self.port = port
+        self.depth = max(1, depth)
+        self.on_dispatch = on_dispatch
+
+        self.backlog = FairQueue()
+        self.in_flight = {}      # prompt_id -> BrokerJob handed to the server
+        self.dispatching = set() # prompt_ids in flight whose submit hasn't returned yet
+        self.running = None      # prompt_id the server is executing
+        self.rejected = {}       # prompt_id -> /history entry for prompts the server refused
+        self.owners = OrderedDict()  # prompt_id -> client_id, for routing events
+        self.stats = {priority: {'queued': 0, 'dispatched': 0, 'finished': 0, 'preempted': 0,
+                                 'cancelled': 0, 'wait': 0.0}
+                      for priority in PRIORITIES}
+
+        self.client = None
+        self._sockets = {}       # client_id -> set of websockets
+        self._numbers = itertools.count()
+        self._watchers = {}      # prompt_id -> task waiting for it to finish
+        self._changed = None
+        self._preempting = 0     # preempt() calls under way; the feeder waits for them
+        self._feeder = None
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # -- lifecycle --------------------------------------------------------
+
+    def make_app(self):
+        app = web.Application(client_max_size=1024**3)
+        # /batch/... first, so the catch-all at the root doesn't take it
+        for priority in reversed(PRIORITIES):
+            prefix = PREFIXES[priority]
+            app.add_routes([
+                web.post(f'{prefix}/prompt', functools.partial(self.post_prompt, priority=priority)),
+                web.get(f'{prefix}/queue', self.get_queue),
+                web.post(f'{prefix}/queue', functools.partial(self.post_queue, priority=priority)),
+                web.get(f'{prefix}/history/{{prompt_id}}', self.get_history),
+                web.get(f'{prefix}/ws', self.websocket),
+                web.route('*', f'{prefix}/{{tail:.*}}', self.proxy),
+            ])
+        return app
+
+    async def start(self):
+        self._changed = asyncio.Condition()
+        self.client = await ComfyClient(self.upstream).open()
+        tracker = await self.client.tracker()
+        tracker.add_listener(self.on_upstream_event)
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._feeder = asyncio.ensure_future(self._feed())
+        return self
+
+    async def stop(self):
+        """Stop taking prompts; the backlog is dropped, prompts already on
+        the server keep running there"""
+        tasks = [t for t in (self._feeder, *self._watchers.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        for sockets in list(self._sockets.values()):
+            for ws in list(sockets):
+                await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self.client is not None:
+            await self.client.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # -- dispatch ---------------------------------------------------------
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+        await self.broadcast_status()
+
+    async def _feed(self):
+        """Hand the server the next job whenever it holds fewer than depth"""
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: (not self._preempting and len(self.in_flight) < self.depth
+                             and len(self.backlog)))
+                job = self.backlog.pop()
+                self.in_flight[job.prompt_id] = job
+                self.dispatching.add(job.prompt_id)
+            await self.dispatch(job)
+
+    async def dispatch(self, job):
+        job.dispatched_at = time.time()
+        stats = self.stats[job.priority]
+        try:
+            await self.client.submit(job.prompt, extra_data=job.extra or None,
+                                     prompt_id=job.prompt_id)
+        except ComfyError as e:
+            self.in_flight.pop(job.prompt_id, None)
+            self.dispatching.discard(job.prompt_id)  # before _notify() wakes preempt()
+            await self.reject(job, e)
+            await self._notify()
+            return
+        finally:
+            self.dispatching.discard(job.prompt_id)
+        stats['dispatched'] += 1
+        stats['wait'] += job.dispatched_at - job.queued_at
+        self._watchers[job.prompt_id] = asyncio.ensure_future(self._watch(job))
+        async with self._changed:
+            self._changed.notify_all()  # a preempt() may be waiting for this submit
+        if self.on_dispatch is not None:
+            self.on_dispatch(job)
+
+    async def _watch(self, job):
+        try:
+            await self.client.wait(job.prompt_id)
+        finally:
+            self._watchers.pop(job.prompt_id, None)
+        if self.in_flight.pop(job.prompt_id, None) is not None:
+            self.stats[job.priority]['finished'] += 1
+        if self.running == job.prompt_id:
+            self.running = None
+        await self._notify()
+
+    async def reject(self, job, error):
+        """Report a prompt the server refused the way ComfyUI reports a
+        failed one: an execution_error event and a /history entry"""
+        message = error.body if isinstance(error, PromptRejected) else str(error)
+        data = {'prompt_id': job.prompt_id, 'node_id': None, 'node_type': 'PromptRejected',
+                'exception_message': message, 'exception_type': type(error).__name__}
+        self.rejected[job.prompt_id] = {
+            'prompt': job.queue_item(),
+            'outputs': {},
+            'status': {'status_str': 'error', 'completed': False,
+                       'messages': [['execution_error', data]]},
+        }
+        await self.send(job.client_id, 'execution_error', data)
+        await self.send(job.client_id, 'executing', {'node': None, 'prompt_id': job.prompt_id})
+
+    async def withdraw(self, jobs):
+        """Take prompts the server hasn't started off its queue; returns
+        the jobs withdrawn (the others stay in flight).
+
+        Jobs still being submitted stay too: until the POST returns they
+        are in neither the server's queue nor its history, and would look
+        withdrawn while the submit still goes through.
+        """
+        jobs = [job for job in jobs
+                if job.prompt_id != self.running and job.prompt_id not in self.dispatching]
+        if not jobs:
+            return []
+        try:
+            await self.client.delete_queued([job.prompt_id for job in jobs])
+            queue = await self.client.queue()
+        except ComfyError:
+            return []
+        # Whatever started in the meantime stays where it is
+        still_there = {item[1] for key in ('queue_running', 'queue_pending')
+                       for item in queue.get(key, [])}
+        withdrawn = []
+        for job in jobs:
+            if job.prompt_id in still_there or job.prompt_id == self.running:
+                continue
+            # Not queued any more, but it may have finished in between
+            try:
+                history = await self.client.history(job.prompt_id)
+            except ComfyError:
+                continue
+            if history.get(job.prompt_id):
+                continue
+            watcher = self._watchers.pop(job.prompt_id, None)
+            if watcher is not None:
+                watcher.cancel()
+            self.in_flight.pop(job.prompt_id, None)
+            withdrawn.append(job)
+        return withdrawn
+
+    async def preempt(self, job=None, front=False):
+        """Take batch prompts the server hasn't started back into the
+        backlog, so an interactive prompt (`job`, if given) is next.
+
+        The feeder is held off until the withdrawn prompts are back in the
+        backlog: otherwise it refills each freed slot with another batch
+        prompt while withdraw() is still talking to the server. Submits
+        already under way are waited for, so their prompts can be taken
+        back too.
+        """
+        withdrawn = []
+        async with self._changed:
+            self._preempting += 1
+            if job is not None:
+                self.backlog.push(job, front)
+        try:
+            async with self._changed:
+                await self._changed.wait_for(lambda: not self.dispatching)
+            waiting = [j for j in self.in_flight.values() if j.priority == BATCH]
+            withdrawn = await self.withdraw(waiting)
+        finally:
+            async with self._changed:
+                for j in reversed(withdrawn):
+                    self.backlog.push(j, front=True)
+                    self.stats[BATCH]['preempted'] += 1
+                self._preempting -= 1
+                self._changed.notify_all()
+
+    # -- events -----------------------------------------------------------
+
+    def on_upstream_event(self, event_type, data, timestamp):
+        prompt_id = data.get('prompt_id') if isinstance(data, dict) else None
+        if event_type == 'execution_start' and prompt_id in self.in_flight:
+            self.running = prompt_id
+        if event_type == 'status':
+            return  # the broker reports its own queue instead
+        if prompt_id is not None and prompt_id not in self.owners:
+            return  # not ours
+        client_id = self.owners.get(prompt_id)
+        asyncio.ensure_future(self.send(client_id, event_type, data))
+
+    async def send(self, client_id, event_type, data):
+        """Send an event to one client's sockets (None = everyone)"""
+        if client_id is None:
+            targets = [ws for sockets in self._sockets.values() for ws in sockets]
+        else:
+            targets = list(self._sockets.get(client_id, ()))
+        for ws in targets:
+            with contextlib.suppress(ConnectionError, RuntimeError):
+                await ws.send_json({'type': event_type, 'data': data})
+
+    def queue_remaining(self):
+        return len(self.backlog) + len(self.in_flight)
+
+    async def broadcast_status(self, client_id=None, sid=None):
+        status = {'status': {'exec_info': {'queue_remaining': self.queue_remaining()}}}
+        if sid is not None:
+            status['sid'] = sid
+        await self.send(client_id, 'status', status)
+
+    # -- HTTP handlers ----------------------------------------------------
+
+    async def post_prompt(self, request, priority):
+        body = await request.json()
+        prompt = body.get('prompt')
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({'error': {'type': 'invalid_prompt',
+                                                'message': 'Cannot execute because no prompt'},
+                                      'node_errors': {}}, status=400)
+        prompt_id = body.get('prompt_id') or str(uuid.uuid4())
+        # Without a client_id nobody's socket is registered for the prompt:
+        # its events go to every socket, like ComfyUI does
+        client_id = body.get('client_id') or None
+        front = bool(body.get('front'))
+        number = -next(self._numbers) if front else next(self._numbers)
+        job = BrokerJob(prompt_id, prompt, client_id, body.get('extra_data') or {}, priority, number,
+                        sender=client_id or request.remote)
+
+        self.owners[prompt_id] = client_id
+        while len(self.owners) > OWNER_MEMORY + self.queue_remaining():
+            self.owners.popitem(last=False)
+        self.stats[priority]['queued'] += 1
+
+        if priority == INTERACTIVE:
+            await self.preempt(job, front)
+        else:
+            async with self._changed:
+                self.backlog.push(job, front)
+                self._changed.notify_all()
+        await self.broadcast_status()
+        return web.json_response({'prompt_id': prompt_id, 'number': number, 'node_errors': {}})
+
+    async def get_queue(self, request):
+        try:
+            upstream = await self.client.queue()
+        except ComfyError:
+            upstream = {'queue_running': [], 'queue_pending': []}
+        return web.json_response({
+            'queue_running': upstream.get('queue_running', []),
+            'queue_pending': upstream.get('queue_pending', []) +
+                             [job.queue_item() for job in self.backlog.in_order()],
+        })
+
+    async def post_queue(self, request, priority):
+        body = await request.json()
+        delete = set(body.get('delete') or [])
+        async with self._changed:
+            removed = self.backlog.remove(delete)
+            if body.get('clear'):
+                removed += self.backlog.remove(None, priority)
+        # Prompts already handed over come off the server's queue
+        on_server = [job for pid, job in self.in_flight.items()
+                     if pid in delete or (body.get('clear') and job.priority == priority)]
+        removed += await self.withdraw(on_server)
+        for job in removed:
+            self.stats[job.priority]['cancelled'] += 1
+        await self._notify()
+        return web.Response(status=200)
+
+    async def get_history(self, request):
+        prompt_id = request.match_info['prompt_id']
+        if prompt_id in self.rejected:
+            return web.json_response({prompt_id: self.rejected[prompt_id]})
+        return await self.proxy(request)
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        client_id = request.query.get('clientId') or uuid.uuid4().hex
+        self._sockets.setdefault(client_id, set()).add(ws)
+        await self.broadcast_status(client_id, sid=client_id)
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            sockets = self._sockets.get(client_id)
+            if sockets is not None:
+                sockets.discard(ws)
+                if not sockets:
+                    del self._sockets[client_id]
+        return ws
+
+    async def proxy(self, request):
+        """Pass a request through to the server unchanged"""
+        path = request.rel_url.path
+        prefix = PREFIXES[BATCH]
+        if path == prefix or path.startswith(prefix + '/'):
+            path = path[len(prefix):] or '/'
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+        data = await request.read() if request.body_exists else None
+        try:
+            upstream = await self.client.session.request(
+                request.method, f"{self.upstream}{path}", params=request.rel_url.query,
+                headers=headers, data=data, allow_redirects=False,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=300))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return web.Response(status=502, text=f"ComfyUI at {self.upstream}: {e!r}")
+        async with upstream:
+            response = web.StreamResponse(status=upstream.status, headers={
+                k: v for k, v in upstream.headers.items() if k.lower() not in HOP_HEADERS})
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_chunked(256 * 1024):
+                await response.write(chunk)
+            await response.write_eof()
+        return response
+
+    def report(self):
+        """Per-class counts and average wait in the backlog"""
+        lines = []
+        for priority, stats in self.stats.items():
+            average = stats['wait'] / stats['dispatched'] if stats['dispatched'] else 0.0
+            lines.append(f"   {priority:<12} {stats['queued']:5d} queued  {stats['finished']:5d} done  "
+                         f"{stats['preempted']:4d} preempted  {stats['cancelled']:4d} cancelled  "
+                         f"avg wait {average:.1f}s")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Priority broker in front of ComfyUI: interactive prompts go first",
+        epilog="Interactive clients use http://HOST:PORT, batches http://HOST:PORT/batch")
+    parser.add_argument("--upstream", default=COMFY_URL, help=f"ComfyUI server (default: {COMFY_URL})")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on (default: all)")
+    parser.add_argument("--port", type=int, default=8190)
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH,
+                        help=f"prompts to hand the server at a time (default: {DEFAULT_DEPTH})")
+    args = parser.parse_args()
+
+    def show(job):
+        icon = "⚡" if job.priority == INTERACTIVE else "🌙"
+        print(f"   {icon} {job.prompt_id[:8]} from {job.sender[:8]} "
+              f"after {job.dispatched_at - job.queued_at:.1f}s")
+
+    async def main():
+        async with PromptBroker(args.upstream, args.host, args.port, args.depth, show) as broker:
+            print(f"🚦 Broker for {broker.upstream} on port {broker.port} "
+                  f"(depth {broker.depth})")
+            print(f"   Interactive: http://<this machine>:{broker.port}")
+            print(f"   Batch:       http://<this machine>:{broker.port}/batch")
+            try:
+                await asyncio.Event().wait()
+            finally:
+                print(broker.report())
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Broker stopped")
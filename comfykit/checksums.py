@@ -0,0 +1,206 @@
+"""
+SHA-256 index of model files, for catching truncated or corrupted downloads.
+
+Hashing a few GB of checkpoints takes a while, so digests are kept in an
+index under CACHE_DIR keyed by (path, size, mtime): only new or changed
+files are read again, several at a time in a process pool. The digests are
+compared with model-checksums.json, the checked-in list of expected hashes
+for the models the download scripts fetch, so a `wget -c` that stopped
+halfway shows up here instead of as a load error in ComfyUI:
+
+    python3 -m comfykit.checksums                  # check the known models
+    python3 -m comfykit.checksums --all            # hash every model file
+    python3 -m comfykit.checksums pin FILE...      # record a known-good hash
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from comfykit.config import CACHE_DIR, MODELS_DIR
+from comfykit.inventory import ModelInventory
+
+INDEX_FILE = CACHE_DIR / "checksums.json"
+EXPECTED_FILE = Path(__file__).resolve().parent.parent / "model-checksums.json"
+CHUNK_SIZE = 8 * 1024 * 1024
+
+OK = 'ok'
+CORRUPT = 'corrupt'
+UNPINNED = 'unpinned'  # present, but no expected hash to compare with
+
+
+def sha256_file(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 of a file, read in chunks into one reused buffer"""
+    sha = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            sha.update(view[:n])
+    return sha.hexdigest()
+
+
+def load_expected(path=EXPECTED_FILE):
+    """{path relative to the models folder: expected entry} from the manifest"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('models', {})
+    except FileNotFoundError:
+        return {}
+
+
+class ChecksumIndex:
+    """Cached file digests, recomputed only when size or mtime change"""
+
+    def __init__(self, path=INDEX_FILE, workers=None):
+        self.path = Path(path)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.files = {}
+        self.hashed = 0
+        self._dirty = False
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.files = json.load(f).get('files', {})
+
+    def digests(self, paths):
+        """{path: sha256} for existing files, hashing the stale ones in parallel"""
+        result, stale = {}, []
+        for path in paths:
+            key = os.path.abspath(path)
+            try:
+                stat = os.stat(key)
+            except OSError:
+                continue
+            cached = self.files.get(key)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                result[path] = cached[2]
+            else:
+                stale.append((path, key, stat))
+
+        if len(stale) > 1 and self.workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(stale))) as pool:
+                digests = list(pool.map(sha256_file, [key for _, key, _ in stale]))
+        else:
+            digests = [sha256_file(key) for _, key, _ in stale]
+
+        for (path, key, stat), digest in zip(stale, digests):
+            self.files[key] = [stat.st_size, stat.st_mtime_ns, digest]
+            result[path] = digest
+            self.hashed += 1
+            self._dirty = True
+        return result
+
+    def record(self, path, digest):
+        """Store a digest computed elsewhere (e.g. while downloading)"""
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        self.files[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'files': self.files}, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def verify_models(models_dir=MODELS_DIR, expected=None, index=None, extra=()):
+    """Check the manifest's models (plus `extra` paths relative to
+    models_dir) against their expected hashes.
+
+    Returns a list of {'name', 'status', 'expected', 'actual'} with status
+    ok, corrupt or unpinned, for the files that are present.
+    """
+    models_dir = Path(models_dir)
+    expected = load_expected() if expected is None else expected
+    index = index if index is not None else ChecksumIndex()
+
+    names = sorted(name for name in set(expected) | set(extra) if (models_dir / name).is_file())
+    digests = index.digests([models_dir / name for name in names])
+    index.save()
+
+    results = []
+    for name in names:
+        want = (expected.get(name) or {}).get('sha256')
+        actual = digests.get(models_dir / name)
+        if actual is None:
+            continue
+        if want is None:
+            status = UNPINNED
+        else:
+            status = OK if actual == want.lower() else CORRUPT
+        results.append({'name': name, 'status': status, 'expected': want, 'actual': actual})
+    return results
+
+
+def model_files(models_dir=MODELS_DIR):
+    """Every model file under models_dir, relative to it"""
+    inventory = ModelInventory(models_dir)
+    models = inventory.scan()
+    inventory.save()
+    return [os.path.relpath(m['path'], inventory.models_dir).replace(os.sep, '/') for m in models]
+
+
+def pin(models_dir, paths, expected_file=EXPECTED_FILE, index=None):
+    """Record the current hash of known-good files as their expected hash"""
+    index = index if index is not None else ChecksumIndex()
+    try:
+        with open(expected_file, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {'models': {}}
+    root = Path(models_dir).resolve()
+    digests = index.digests(paths)
+    index.save()
+    pinned = {}
+    for path, digest in digests.items():
+        name = Path(path).resolve().relative_to(root).as_posix()
+        manifest['models'].setdefault(name, {})['sha256'] = digest
+        pinned[name] = digest
+    manifest['models'] = dict(sorted(manifest['models'].items()))
+    with open(expected_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    return pinned
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Check model files against their expected SHA-256")
+    parser.add_argument("--models", default=str(MODELS_DIR), help="ComfyUI models folder")
+    parser.add_argument("--expected", default=str(EXPECTED_FILE), help="manifest of expected hashes")
+    parser.add_argument("--all", action="store_true", help="also hash models the manifest doesn't list")
+    parser.add_argument("command", nargs="?", choices=["verify", "pin"], default="verify")
+    parser.add_argument("files", nargs="*", help="(pin) known-good model files")
+    args = parser.parse_args()
+
+    if args.command == "pin":
+        for name, digest in pin(args.models, args.files, args.expected).items():
+            print(f"📌 {name}: {digest}")
+        sys.exit(0)
+
+    index = ChecksumIndex()
+    start = time.perf_counter()
+    extra = model_files(args.models) if args.all else ()
+    results = verify_models(args.models, load_expected(args.expected), index, extra)
+    icons = {OK: "✅", CORRUPT: "❌", UNPINNED: "❔"}
+    for r in results:
+        line = f"   {icons[r['status']]} {r['name']}: {r['status']}"
+        if r['status'] == CORRUPT:
+            line += f" (sha256 {r['actual'][:16]}…, expected {r['expected'][:16]}…)"
+        print(line)
+    print(f"\n{len(results)} model(s) checked in {time.perf_counter() - start:.1f}s "
+          f"({index.hashed} hashed, {len(results) - index.hashed} from the index)")
+    sys.exit(1 if any(r['status'] == CORRUPT for r in results) else 0)
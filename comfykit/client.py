@@ -0,0 +1,264 @@
+"""
+asyncio client for the ComfyUI HTTP API.
+
+One ComfyClient holds a single pooled keep-alive session. Every call has a
+timeout, the number of requests in flight is bounded by a semaphore, and
+connection errors / 5xx responses are retried with exponential backoff.
+Submission, completion tracking, uploads and downloads all go through it:
+
+    async with ComfyClient(url) as client:
+        prompt_id = await client.submit(prompt)
+        result = await client.wait(prompt_id)
+        data = await client.view(**result.outputs['8']['images'][0])
+"""
+
+import asyncio
+import os
+import random
+
+import aiohttp
+
+from comfykit.config import COMFY_URL
+from comfykit.tracker import CompletionTracker
+
+# Status codes worth retrying: the server is restarting or overloaded
+RETRY_STATUSES = {429, 502, 503, 504}
+
+DOWNLOAD_CHUNK = 256 * 1024
+
+
+class ComfyError(Exception):
+    """A request to the ComfyUI server failed"""
+
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class PromptRejected(ComfyError):
+    """The server refused a prompt (validation failed)"""
+
+
+class ComfyClient:
+    """Pooled, bounded, retrying async client for one ComfyUI server"""
+
+    def __init__(self, url=COMFY_URL, max_concurrency=64, timeout=30.0,
+                 retries=3, backoff=0.25, client_id=None):
+        self.url = url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.client_id = client_id
+
+        self._session = None
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._tracker = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def close(self):
+        if self._tracker is not None:
+            await self._tracker.close()
+            self._tracker = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            raise RuntimeError("ComfyClient is not open (use 'async with ComfyClient(...)')")
+        return self._session
+
+    async def tracker(self):
+        """The websocket completion tracker for this client, started on first use"""
+        if self._tracker is None:
+            self._tracker = CompletionTracker(self.url, self.client_id, session=self.session)
+            self.client_id = self._tracker.client_id
+            await self._tracker.start()
+        return self._tracker
+
+    # -- plumbing ---------------------------------------------------------
+
+    async def request(self, method, path, *, timeout=None, read='json', **kwargs):
+        """Send a request with retries. `read` is 'json', 'bytes' or 'text'.
+
+        `data` may be a callable building the body, for bodies (multipart
+        forms) that can't be sent twice.
+        """
+        url = f"{self.url}{path}"
+        make_data = kwargs.pop('data', None)
+        timeout = aiohttp.ClientTimeout(total=timeout) if timeout else self.timeout
+        attempt = 0
+        while True:
+            try:
+                if make_data is not None:
+                    kwargs['data'] = make_data() if callable(make_data) else make_data
+                async with self._limit:
+                    async with self.session.request(method, url, timeout=timeout, **kwargs) as response:
+                        if response.status in RETRY_STATUSES and attempt < self.retries:
+                            raise _Retry(response.status)
+                        if response.status >= 400:
+                            body = await response.text()
+                            raise ComfyError(f"{method} {path}: HTTP {response.status}",
+                                             response.status, body)
+                        if read == 'json':
+                            return await response.json(content_type=None)
+                        if read == 'bytes':
+                            return await response.read()
+                        return await response.text()
+            except (_Retry, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise ComfyError(f"{method} {path}: {e!r} after {attempt + 1} attempts") from e
+                await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+                attempt += 1
+
+    # -- API --------------------------------------------------------------
+
+    async def submit(self, prompt, front=False, extra_data=None, prompt_id=None):
+        """Queue an API prompt and return its prompt_id (`prompt_id` picks
+        it instead of the server)"""
+        if self._tracker is None:
+            await self.tracker()
+        body = {'prompt': prompt, 'client_id': self.client_id}
+        if prompt_id is not None:
+            body['prompt_id'] = prompt_id
+        if front:
+            body['front'] = True
+        if extra_data:
+            body['extra_data'] = extra_data
+        try:
+            result = await self.request('POST', '/prompt', json=body)
+        except ComfyError as e:
+            if e.status == 400:
+                raise PromptRejected(f"Prompt rejected: {e.body}", e.status, e.body) from e
+            raise
+        return result['prompt_id']
+
+    async def wait(self, prompt_id, timeout=None):
+        """Wait for a prompt to finish and return its PromptResult"""
+        tracker = await self.tracker()
+        return await tracker.wait(prompt_id, timeout)
+
+    async def run(self, prompt, timeout=None):
+        """Submit a prompt and wait for it"""
+        prompt_id = await self.submit(prompt)
+        return await self.wait(prompt_id, timeout)
+
+    async def queue(self):
+        return await self.request('GET', '/queue')
+
+    async def queue_depth(self):
+        """Number of prompts running or pending on the server"""
+        data = await self.queue()
+        return len(data.get('queue_running', [])) + len(data.get('queue_pending', []))
+
+    async def delete_queued(self, prompt_ids):
+        """Remove pending prompts from the server queue"""
+        await self.request('POST', '/queue', json={'delete': list(prompt_ids)}, read='text')
+
+    async def interrupt(self):
+        await self.request('POST', '/interrupt', read='text')
+
+    async def history(self, prompt_id=None):
+        path = f"/history/{prompt_id}" if prompt_id else "/history"
+        return await self.request('GET', path)
+
+    async def system_stats(self):
+        return await self.request('GET', '/system_stats')
+
+    async def object_info(self):
+        return await self.request('GET', '/object_info', timeout=120)
+
+    async def view(self, filename, subfolder='', type='output'):
+        """Download an output image into memory"""
+        params = {'filename': filename, 'subfolder': subfolder, 'type': type}
+        return await self.request('GET', '/view', params=params, read='bytes')
+
+    async def download(self, dest, filename, subfolder='', type='output',
+                       chunk_size=DOWNLOAD_CHUNK):
+        """Stream an output image to `dest` without holding it in memory.
+
+        Writes to dest + '.part' and renames on success, so a partial file
+        never has the final name. Returns the number of bytes written.
+        """
+        params = {'filename': filename, 'subfolder': subfolder, 'type': type}
+        part = f"{dest}.part"
+        attempt = 0
+        while True:
+            try:
+                async with self._limit:
+                    async with self.session.get(f"{self.url}/view", params=params,
+                                                timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as response:
+                        if response.status in RETRY_STATUSES and attempt < self.retries:
+                            raise _Retry(response.status)
+                        if response.status >= 400:
+                            raise ComfyError(f"GET /view {filename}: HTTP {response.status}",
+                                             response.status, await response.text())
+                        size = 0
+                        with open(part, 'wb') as f:
+                            async for chunk in response.content.iter_chunked(chunk_size):
+                                f.write(chunk)
+                                size += len(chunk)
+                os.replace(part, dest)
+                return size
+            except (_Retry, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise ComfyError(f"GET /view {filename}: {e!r} after {attempt + 1} attempts") from e
+                await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+                attempt += 1
+
+    async def upload_image(self, data, filename, subfolder='', type='input', overwrite=False):
+        """Upload image bytes to the server's input folder.
+
+        Returns the server's {'name', 'subfolder', 'type'} reply; the name can
+        differ from `filename` if a file of that name already existed.
+        """
+        def form():
+            form = aiohttp.FormData()
+            form.add_field('image', data, filename=filename, content_type='image/png')
+            form.add_field('subfolder', subfolder)
+            form.add_field('type', type)
+            form.add_field('overwrite', 'true' if overwrite else 'false')
+            return form
+
+        return await self.request('POST', '/upload/image', data=form, timeout=300)
+
+
+def run_prompt(prompt, url=COMFY_URL, timeout=None, on_event=None, on_queued=None):
+    """Blocking helper for scripts: queue one prompt and wait for its result.
+
+    The event socket is open before the prompt is queued, under the
+    client_id it is queued with, so no progress event is missed.
+    `on_queued(prompt_id)` is called once the server accepts it and
+    `on_event(event_type, data, timestamp)` for every event.
+    """
+    async def _run():
+        async with ComfyClient(url) as client:
+            tracker = await client.tracker()
+            if on_event is not None:
+                tracker.add_listener(on_event)
+            prompt_id = await client.submit(prompt)
+            if on_queued is not None:
+                on_queued(prompt_id)
+            return await client.wait(prompt_id, timeout)
+    return asyncio.run(_run())
+
+
+class _Retry(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
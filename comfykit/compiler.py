@@ -0,0 +1,288 @@
+"""
+Convert ComfyUI workflows from the UI format (what the web interface saves)
+to the API prompt format accepted by POST /prompt.
+
+The graph is indexed once (nodes by id, links by target slot), so compiling
+is linear in the number of nodes and links. Muted nodes are dropped,
+bypassed nodes and Reroute nodes are wired through to their upstream source,
+the same way the web interface does it before queueing.
+
+dedupe_prompt() is an optional pass over the result that merges nodes with
+the same class_type and inputs, so e.g. two VAEEncode nodes fed the same
+pixels and VAE encode once.
+"""
+
+import json
+
+from comfykit.schema import default_schema
+
+# Node modes as stored in the UI format
+MODE_ALWAYS = 0
+MODE_NEVER = 2      # "Mute" in the web interface
+MODE_BYPASS = 4
+
+# Nodes that only exist in the editor and are never sent to the server
+REROUTE_TYPES = {"Reroute"}
+UI_ONLY_TYPES = {"Note", "MarkdownNote", "PrimitiveNode"} | REROUTE_TYPES
+
+# Output nodes write files or previews: never merged, even when identical
+OUTPUT_PREFIXES = ("Save", "Preview")
+
+
+class WorkflowError(Exception):
+    """Raised when a workflow cannot be converted to an API prompt"""
+
+
+def load_workflow(path):
+    """Load a UI-format workflow JSON file"""
+    with open(path, 'r') as f:
+        workflow = json.load(f)
+    if 'nodes' not in workflow or 'links' not in workflow:
+        raise WorkflowError(f"{path}: not a UI-format workflow (missing nodes/links)")
+    return workflow
+
+
+def _link_fields(link):
+    """Return (link_id, src, src_slot, dst, dst_slot) for list or dict links"""
+    if isinstance(link, dict):
+        return (link.get('id'), link.get('origin_id'), link.get('origin_slot'),
+                link.get('target_id'), link.get('target_slot'))
+    return link[0], link[1], link[2], link[3], link[4]
+
+
+class WorkflowGraph:
+    """Node and link indexes over a UI-format workflow"""
+
+    def __init__(self, workflow):
+        self.nodes = {}
+        for node in workflow['nodes']:
+            self.nodes[node['id']] = node
+
+        # Links are resolved by target slot first: saved workflows can carry
+        # duplicate link ids (see batch-overnight-workflow.json), but a target
+        # slot only ever has one incoming link.
+        self.links_by_id = {}
+        self.links_by_target = {}
+        for link in workflow['links']:
+            link_id, src, src_slot, dst, dst_slot = _link_fields(link)
+            if src is None:
+                continue
+            self.links_by_id.setdefault(link_id, (src, src_slot))
+            if dst is not None:
+                self.links_by_target[(dst, dst_slot)] = (src, src_slot)
+
+        self._resolved = {}
+
+    def incoming(self, node, slot):
+        """Return the (src, src_slot) feeding input `slot` of `node`, or None"""
+        inp = node['inputs'][slot]
+        if inp.get('link') is None:
+            return None
+        source = self.links_by_target.get((node['id'], slot))
+        if source is None:
+            source = self.links_by_id.get(inp['link'])
+        return source
+
+    def resolve(self, src, src_slot):
+        """Follow Reroute and bypassed nodes back to the node that really
+        produces the value. Returns (node_id, slot), a literal widget value
+        from a PrimitiveNode as ('value', v), or None if the source is muted
+        or dangling."""
+        key = (src, src_slot)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        self._resolved[key] = None  # guards against reroute cycles
+        result = self._resolve(src, src_slot)
+        self._resolved[key] = result
+        return result
+
+    def _resolve(self, src, src_slot):
+        node = self.nodes.get(src)
+        if node is None:
+            return None
+
+        node_type = node['type']
+        mode = node.get('mode', MODE_ALWAYS)
+
+        if mode == MODE_NEVER:
+            return None
+
+        if node_type == 'PrimitiveNode':
+            values = node.get('widgets_values') or []
+            return ('value', values[0]) if values else None
+
+        if node_type in REROUTE_TYPES:
+            upstream = self.incoming(node, 0) if node.get('inputs') else None
+            return self.resolve(*upstream) if upstream else None
+
+        if mode == MODE_BYPASS:
+            return self._resolve_bypass(node, src_slot)
+
+        return (str(src), src_slot)
+
+    def _resolve_bypass(self, node, src_slot):
+        # A bypassed node passes through the input whose type matches the
+        # requested output, preferring the input in the same position.
+        outputs = node.get('outputs') or []
+        inputs = node.get('inputs') or []
+        if src_slot >= len(outputs):
+            return None
+        wanted = outputs[src_slot].get('type')
+
+        candidates = list(range(len(inputs)))
+        if src_slot < len(inputs):
+            candidates.remove(src_slot)
+            candidates.insert(0, src_slot)
+
+        for slot in candidates:
+            if inputs[slot].get('type') != wanted:
+                continue
+            upstream = self.incoming(node, slot)
+            if upstream:
+                return self.resolve(*upstream)
+        return None
+
+
+def _widget_inputs(node, widget_names):
+    """Map a node's widgets_values onto named inputs"""
+    values = node.get('widgets_values')
+    if not values:
+        return {}
+
+    # Some custom nodes save widgets as a dict already keyed by name
+    if isinstance(values, dict):
+        return dict(values)
+
+    names = widget_names.get(node['type'])
+    if names is None:
+        raise WorkflowError(
+            f"Node {node['id']} ({node['type']}): unknown widget names, "
+            f"cannot map {len(values)} widget value(s) "
+            f"(run: python3 -m comfykit.schema --url <server>)"
+        )
+
+    inputs = {}
+    for name, value in zip(names, values):
+        if name is not None:
+            inputs[name] = value
+    return inputs
+
+
+def compile_workflow(workflow, widget_names=None, dedupe=False):
+    """Convert a UI-format workflow to an API prompt dict.
+
+    `widget_names` maps node types to widget names in widgets_values order,
+    usually a NodeSchema. Defaults to the offline schema cache. Raises
+    WorkflowError if an executed node has widget values for a type that has
+    no mapping. With dedupe=True identical nodes are merged (see
+    dedupe_prompt).
+    """
+    if widget_names is None:
+        widget_names = default_schema()
+
+    graph = WorkflowGraph(workflow)
+    prompt = {}
+
+    for node in workflow['nodes']:
+        if node['type'] in UI_ONLY_TYPES:
+            continue
+        if node.get('mode', MODE_ALWAYS) != MODE_ALWAYS:
+            continue
+
+        inputs = _widget_inputs(node, widget_names)
+
+        for slot, inp in enumerate(node.get('inputs') or []):
+            upstream = graph.incoming(node, slot)
+            if upstream is None:
+                continue
+            source = graph.resolve(*upstream)
+            if source is None:
+                # Muted or dangling source: leave a converted widget's value
+                # in place, otherwise drop the input like the web UI does.
+                continue
+            if source[0] == 'value':
+                inputs[inp['name']] = source[1]
+            else:
+                inputs[inp['name']] = list(source)
+
+        prompt[str(node['id'])] = {
+            "inputs": inputs,
+            "class_type": node['type'],
+        }
+
+    if dedupe:
+        prompt, _ = dedupe_prompt(prompt)
+    return prompt
+
+
+def is_link(value, prompt):
+    """Whether an API input value is a [node_id, slot] reference"""
+    return (isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], str) and value[0] in prompt)
+
+
+def _topological_order(prompt):
+    """Node ids with every node after the nodes it reads from"""
+    order = []
+    state = {}  # node id -> 1 while on the stack, 2 when done
+    for root in prompt:
+        if root in state:
+            continue
+        stack = [(root, iter(prompt[root]['inputs'].values()))]
+        state[root] = 1
+        while stack:
+            node_id, values = stack[-1]
+            for value in values:
+                if not is_link(value, prompt):
+                    continue
+                src = value[0]
+                if state.get(src) == 1:
+                    raise WorkflowError(f"Cycle in prompt through node {src}")
+                if src not in state:
+                    state[src] = 1
+                    stack.append((src, iter(prompt[src]['inputs'].values())))
+                    break
+            else:
+                stack.pop()
+                state[node_id] = 2
+                order.append(node_id)
+    return order
+
+
+def dedupe_prompt(prompt, keep=()):
+    """Merge nodes that have the same class_type and inputs.
+
+    Nodes are compared after their own inputs have been merged, so whole
+    identical chains collapse, not just their first node. Output nodes and
+    the node ids in `keep` are never merged away. Returns (prompt, merged)
+    where `merged` maps each removed node id to the id of the node that
+    replaces it. Unchanged nodes are shared with the input prompt.
+    """
+    canonical = {}
+    seen = {}
+    for node_id in _topological_order(prompt):
+        node = prompt[node_id]
+        if node['class_type'].startswith(OUTPUT_PREFIXES) or node_id in keep:
+            canonical[node_id] = node_id
+            continue
+        inputs = {name: [canonical[v[0]], v[1]] if is_link(v, prompt) else v
+                  for name, v in node['inputs'].items()}
+        key = json.dumps([node['class_type'], inputs], sort_keys=True, default=str)
+        canonical[node_id] = seen.setdefault(key, node_id)
+
+    merged = {node_id: kept for node_id, kept in canonical.items() if kept != node_id}
+    if not merged:
+        return prompt, merged
+
+    result = {}
+    for node_id, node in prompt.items():
+        if node_id in merged:
+            continue
+        inputs = node['inputs']
+        if any(is_link(v, prompt) and v[0] in merged for v in inputs.values()):
+            inputs = {name: [merged.get(v[0], v[0]), v[1]] if is_link(v, prompt) else v
+                      for name, v in inputs.items()}
+            node = {**node, 'inputs': inputs}
+        result[node_id] = node
+    return result, merged
@@ -0,0 +1,21 @@
+"""
+Shared settings for comfykit
+
+Every value can be overridden from the environment so the scripts work
+against another ComfyUI host without editing them.
+"""
+
+import os
+from pathlib import Path
+
+COMFY_URL = os.environ.get("COMFY_URL", "http://10.0.0.21:8188")
+
+# Local state (schema cache, manifests, journals) lives next to the scripts
+CACHE_DIR = Path(os.environ.get("COMFYKIT_CACHE", ".comfykit"))
+
+# Model folders of the local ComfyUI install (checkpoints/, vae/, loras/, ...)
+MODELS_DIR = Path(os.environ.get("COMFY_MODELS", "ComfyUI/models"))
+
+# Longest side local input photos are scaled down to before upload
+# (SD1.5 works at 512-768; 0 keeps the original resolution)
+INPUT_MAX_SIDE = int(os.environ.get("COMFYKIT_MAX_SIDE", "768"))
@@ -0,0 +1,262 @@
+"""
+Crop-and-stitch inpainting: only the masked region goes through the model.
+
+The inpainting workflows encode, sample and decode the whole input image,
+so a 4032x3024 phone photo with a small masked area costs as much as
+inpainting all of it (and may not fit in VRAM at all). Instead:
+
+1. plan_crop() takes the mask's bounding box plus a context margin, and
+   picks a generation size for it near the model's native resolution
+   (prompt_native() reads it from the checkpoint's architecture: 512 for
+   SD1.5, 1024 for SDXL), each side a multiple of 8 (the VAE's downscale
+   factor),
+2. crop_prompt() uploads that crop (and the matching piece of the mask) and
+   points the workflow's LoadImage nodes at it,
+3. stitch() scales the generated crop back and alpha-blends it into the
+   original through a feathered copy of the mask. Pixels outside the crop
+   box are never touched.
+
+Sampling cost then follows the masked area (up to the native size)
+instead of the photo's resolution.
+
+    plan = plan_crop(mask, native=prompt_native(prompt))
+    prompt, plan = cropped_prompt(prompt, url, image, mask, image_node='1', plan=plan)
+    ... run prompt, download the result ...
+    stitch(image, Image.open(result_path), mask, plan).save("out.png")
+"""
+
+import asyncio
+import io
+import math
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from comfykit.client import ComfyClient
+from comfykit.config import MODELS_DIR
+from comfykit.inventory import inspect
+from comfykit.masks import feather, grow
+from comfykit.uploads import InputUploader, UploadManifest
+
+# Resolution each architecture was trained at (see comfykit.inventory)
+NATIVE_SIZES = {'SD1.5': 512, 'SD2.x': 768, 'SDXL': 1024, 'SDXL Refiner': 1024,
+                'SD3': 1024, 'Flux': 1024}
+DEFAULT_NATIVE = 512
+
+# Model-name inputs that pick the diffusion model, and its models/ folder
+DIFFUSION_MODEL_INPUTS = {'ckpt_name': 'checkpoints', 'unet_name': 'unet'}
+
+
+class CropPlan:
+    """Where the crop sits in the original and the size it is generated at"""
+
+    __slots__ = ('box', 'size', 'margin')
+
+    def __init__(self, box, size, margin):
+        self.box = box        # (x0, y0, x1, y1) in the original image
+        self.size = size      # (width, height) sent to the model
+        self.margin = margin  # context pixels around the mask
+
+    @property
+    def crop_size(self):
+        x0, y0, x1, y1 = self.box
+        return x1 - x0, y1 - y0
+
+    def __repr__(self):
+        return f"CropPlan(box={self.box}, size={self.size})"
+
+
+def native_size(arch):
+    """Native generation size for an architecture name from comfykit.inventory"""
+    return NATIVE_SIZES.get(arch, DEFAULT_NATIVE)
+
+
+def prompt_native(prompt, models_dir=MODELS_DIR):
+    """Native size of the model a prompt samples with, from the architecture
+    in its checkpoint's safetensors header; DEFAULT_NATIVE if the file isn't
+    under models_dir or its architecture can't be told"""
+    for node in prompt.values():
+        for name, folder in DIFFUSION_MODEL_INPUTS.items():
+            value = node['inputs'].get(name)
+            if not isinstance(value, str):
+                continue
+            path = Path(models_dir) / folder / value
+            if path.is_file():
+                arch = inspect(path)['arch']
+                if arch is not None:
+                    return native_size(arch)
+    return DEFAULT_NATIVE
+
+
+def _as_mask(mask):
+    """uint8 array (255 = inpaint) from an array or a PIL image"""
+    if isinstance(mask, Image.Image):
+        mask = np.asarray(mask.convert('L'))
+    return np.asarray(mask)
+
+
+def plan_crop(mask, native=DEFAULT_NATIVE, margin=0.25, min_margin=32, multiple=8,
+              max_upscale=2.0):
+    """Crop box and generation size for a mask, or None if it is empty.
+
+    The box is the mask's bounding box grown by `margin` (a fraction of its
+    larger side, at least `min_margin` pixels) for context, clipped to the
+    image. It is scaled towards native x native pixels (small crops by at
+    most `max_upscale`, so a tiny mask isn't blown up to the full native
+    size), with each side rounded to a multiple of `multiple`.
+    """
+    mask = _as_mask(mask)
+    height, width = mask.shape
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+
+    pad = max(min_margin, int(round(margin * max(x1 - x0, y1 - y0))))
+    box = (max(0, x0 - pad), max(0, y0 - pad), min(width, x1 + pad), min(height, y1 + pad))
+    crop_w, crop_h = box[2] - box[0], box[3] - box[1]
+
+    scale = min(max_upscale, native / math.sqrt(crop_w * crop_h))
+    size = (max(multiple, int(round(crop_w * scale / multiple)) * multiple),
+            max(multiple, int(round(crop_h * scale / multiple)) * multiple))
+    return CropPlan(tuple(int(v) for v in box), size, pad)
+
+
+def crop_image(image, plan):
+    """The crop of an image, resized to the generation size (RGB)"""
+    return image.convert('RGB').crop(plan.box).resize(plan.size, Image.LANCZOS)
+
+
+def crop_mask(mask, plan):
+    """The crop of a mask at the generation size, as an RGBA image whose
+    LoadImage MASK output is the mask (LoadImage reads it as 1 - alpha)"""
+    x0, y0, x1, y1 = plan.box
+    part = Image.fromarray(np.ascontiguousarray(_as_mask(mask)[y0:y1, x0:x1]), mode='L')
+    part = part.resize(plan.size, Image.BILINEAR)
+    black = Image.new('L', plan.size, 0)
+    return Image.merge('RGBA', (black, black, black, Image.eval(part, lambda v: 255 - v)))
+
+
+def crop_with_mask(image, mask, plan):
+    """Image crop carrying its mask in the alpha channel, for workflows that
+    take both from one LoadImage"""
+    crop = crop_image(image, plan)
+    crop.putalpha(crop_mask(mask, plan).getchannel('A'))
+    return crop
+
+
+def stitch(image, generated, mask, plan, feather_by=None):
+    """Blend a generated crop back into the original image.
+
+    The blend weight is the mask inside the crop, grown by the feather
+    radius and then feathered, so the masked area comes entirely from the
+    model and the seam fades out within the context margin.
+    """
+    if feather_by is None:
+        feather_by = max(4, plan.margin // 2)
+    x0, y0, x1, y1 = plan.box
+    crop_w, crop_h = plan.crop_size
+
+    result = np.array(image.convert('RGB'))
+    generated = np.asarray(generated.convert('RGB').resize((crop_w, crop_h), Image.LANCZOS),
+                           dtype=np.float32)
+    inside = _as_mask(mask)[y0:y1, x0:x1] >= 128
+    alpha = feather(grow(inside, feather_by), feather_by)[..., None]
+
+    region = result[y0:y1, x0:x1].astype(np.float32)
+    region += (generated - region) * alpha
+    result[y0:y1, x0:x1] = np.clip(np.round(region), 0, 255).astype(np.uint8)
+    return Image.fromarray(result)
+
+
+def loader_mask(image):
+    """The MASK a LoadImage node outputs for an image: 1 - alpha (uint8,
+    255 = inpaint), empty without an alpha channel"""
+    if 'A' not in image.getbands():
+        return np.zeros((image.height, image.width), dtype=np.uint8)
+    return 255 - np.asarray(image.getchannel('A'))
+
+
+async def input_image(client, name):
+    """An image from the server's input folder, as a PIL image"""
+    subfolder, _, filename = name.rpartition('/')
+    data = await client.view(filename, subfolder, 'input')
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        return image.copy()
+
+
+def fetch_inputs(url, prompt, image_node, mask_node=None):
+    """Blocking helper: (image, mask) that a prompt's LoadImage nodes read
+    from the server, for crop_prompt() and stitch()"""
+    async def _fetch():
+        async with ComfyClient(url) as client:
+            image = await input_image(client, prompt[image_node]['inputs']['image'])
+            source = image
+            if mask_node is not None:
+                source = await input_image(client, prompt[mask_node]['inputs']['image'])
+            return image, loader_mask(source)
+    return asyncio.run(_fetch())
+
+
+def _png(image):
+    out = io.BytesIO()
+    image.save(out, format='PNG', compress_level=1)
+    return out.getvalue()
+
+
+async def crop_prompt(clients, prompt, image, mask, image_node, mask_node=None, plan=None,
+                      native=None, manifest=None):
+    """Upload the crop of `image` (and `mask`) to every client and point
+    the prompt's LoadImage nodes at it; returns (prompt, plan).
+
+    With only `image_node`, the mask travels in that image's alpha channel
+    (as in inpainting-workflow.json). With `mask_node` too, that LoadImage
+    gets the mask and `image_node` the plain crop (as in the auto-mask
+    workflow once comfykit.maskcache has swapped the detector out).
+    `native` defaults to the prompt's checkpoint's (prompt_native).
+    Returns (prompt, None) unchanged if the mask is empty.
+    """
+    if isinstance(clients, ComfyClient):
+        clients = [clients]
+    plan = plan or plan_crop(mask, native or prompt_native(prompt))
+    if plan is None:
+        return prompt, None
+    manifest = manifest if manifest is not None else UploadManifest()
+    uploads = {}
+    if mask_node is None:
+        uploads[image_node] = _png(crop_with_mask(image, mask, plan))
+    else:
+        uploads[image_node] = _png(crop_image(image, plan))
+        uploads[mask_node] = _png(crop_mask(mask, plan))
+
+    prompt = dict(prompt)
+    for node_id, data in uploads.items():
+        names = await asyncio.gather(*(InputUploader(client, manifest).upload_bytes(data, '.png')
+                                       for client in clients))
+        node = prompt[node_id]
+        prompt[node_id] = {**node, 'inputs': {**node['inputs'], 'image': names[0]}}
+    manifest.save()
+    return prompt, plan
+
+
+def cropped_prompt(prompt, urls, image, mask, image_node, mask_node=None, plan=None,
+                   native=None):
+    """Blocking helper for scripts; returns (prompt, plan)"""
+    if isinstance(urls, str):
+        urls = [urls]
+
+    async def _crop():
+        clients = [ComfyClient(url) for url in urls]
+        try:
+            for client in clients:
+                await client.open()
+            return await crop_prompt(clients, prompt, image, mask, image_node, mask_node,
+                                     plan, native)
+        finally:
+            for client in clients:
+                await client.close()
+    return asyncio.run(_crop())
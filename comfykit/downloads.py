@@ -0,0 +1,367 @@
+"""
+Parallel, resumable model downloads.
+
+The models and where they come from are declared in model-checksums.json:
+a download URL and the expected SHA-256 for each path under
+ComfyUI/models. Each file is fetched in CHUNK_SIZE byte ranges by several
+workers at once and written in place into <name>.part. A <name>.part.json
+file beside it lists the finished chunks, so an interrupted download picks
+up where it stopped. The SHA-256 is computed as the chunks come in (in
+file order, reading back any that arrived early), and the file only gets
+its final name once the digest matches; on a mismatch the partial file is
+deleted. Servers without range support get one plain streamed GET.
+
+    python3 -m comfykit.downloads v1-5-pruned-emaonly.safetensors
+    python3 -m comfykit.downloads --all
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+from pathlib import Path
+
+import aiohttp
+
+from comfykit.checksums import EXPECTED_FILE, ChecksumIndex, load_expected
+from comfykit.client import RETRY_STATUSES
+from comfykit.config import MODELS_DIR
+
+CHUNK_SIZE = 16 * 1024 * 1024
+WORKERS = 4          # ranged requests in flight per file
+PARALLEL_FILES = 2   # files downloading at once
+RETRIES = 5
+
+DOWNLOADED = 'downloaded'
+PRESENT = 'present'
+MANUAL = 'manual'
+FAILED = 'failed'
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _NoRanges(Exception):
+    """The server answered a range request with the whole file"""
+
+
+class _Transient(Exception):
+    """A failure worth retrying (overloaded server, cut-off response)"""
+
+
+def find_models(manifest, names):
+    """Manifest entries for the given file names or paths, or every entry
+    with a URL if names is empty: {path: entry}"""
+    if not names:
+        return {path: entry for path, entry in manifest.items() if entry.get('url')}
+    found = {}
+    for name in names:
+        matches = {path: entry for path, entry in manifest.items()
+                   if path == name or Path(path).name == name}
+        if not matches:
+            raise KeyError(f"{name} is not in the model manifest")
+        found.update(matches)
+    return found
+
+
+class Download:
+    """One URL to one file, in parallel ranges with a resumable .part file"""
+
+    def __init__(self, session, url, dest, sha256=None, chunk_size=CHUNK_SIZE,
+                 workers=WORKERS, retries=RETRIES, backoff=1.0, on_progress=None):
+        self.session = session
+        self.url = url
+        self.dest = Path(dest)
+        self.sha256 = sha256.lower() if sha256 else None
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.on_progress = on_progress
+        self.part = Path(f"{dest}.part")
+        self.state_file = Path(f"{dest}.part.json")
+        self.name = self.dest.name
+        self.size = None
+        self.received = 0
+        self.resumed = 0  # bytes already there from an earlier attempt
+
+    async def run(self):
+        """Download, verify and rename into place; returns the SHA-256"""
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        size, etag, ranges = await self._probe()
+        self.size = size
+        digest = None
+        if ranges and size:
+            try:
+                digest = await self._ranged(size, etag)
+            except _NoRanges:
+                pass
+        if digest is None:
+            self._discard()
+            self.received = self.resumed = 0
+            digest = await self._stream()
+
+        if self.sha256 is not None and digest != self.sha256:
+            self._discard()
+            raise DownloadError(f"{self.dest.name}: SHA-256 {digest} does not match "
+                                f"the expected {self.sha256}")
+        os.replace(self.part, self.dest)
+        self.state_file.unlink(missing_ok=True)
+        return digest
+
+    def _discard(self):
+        self.part.unlink(missing_ok=True)
+        self.state_file.unlink(missing_ok=True)
+
+    def _progress(self, n):
+        self.received += n
+        if self.on_progress:
+            self.on_progress(self, self.received, self.size)
+
+    async def _retrying(self, what, attempt, error):
+        if attempt >= self.retries:
+            raise DownloadError(f"{self.dest.name}: {what}: {error!r} after {attempt + 1} attempts")
+        await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    async def _probe(self):
+        """(size, etag, supports ranges) from a HEAD request"""
+        attempt = 0
+        while True:
+            try:
+                async with self.session.head(self.url, allow_redirects=True) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise _Transient(f"HTTP {response.status}")
+                    if response.status >= 400:
+                        return None, None, False  # some hosts refuse HEAD; just GET
+                    ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+                    return response.content_length, response.headers.get('ETag'), ranges
+            except (_Transient, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                await self._retrying("HEAD", attempt, e)
+                attempt += 1
+
+    def _load_state(self, size, etag):
+        """Chunks finished by an earlier run, if it was the same file"""
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+            if (state['url'] == self.url and state['size'] == size and state['etag'] == etag
+                    and state['chunk_size'] == self.chunk_size
+                    and self.part.stat().st_size == size):
+                return set(state['done'])
+        except (OSError, ValueError, KeyError):
+            pass
+        return set()
+
+    def _save_state(self, size, etag, done):
+        tmp = self.state_file.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'url': self.url, 'size': size, 'etag': etag,
+                       'chunk_size': self.chunk_size, 'done': sorted(done)}, f)
+        os.replace(tmp, self.state_file)
+
+    async def _ranged(self, size, etag):
+        loop = asyncio.get_running_loop()
+        count = -(-size // self.chunk_size)
+        done = self._load_state(size, etag)
+        if not done:
+            self._discard()
+        self.resumed = sum(self._length(k, size) for k in done)
+        self._progress(self.resumed)
+        todo = [k for k in range(count) if k not in done]
+        todo.reverse()  # pop() from the end hands chunks out in file order
+
+        sha = hashlib.sha256()
+        hashed = 0   # chunks [0, hashed) are in the digest
+        held = {}    # finished chunks kept in memory until their turn to be hashed
+        hash_lock = asyncio.Lock()
+
+        fd = os.open(self.part, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+
+            async def advance():
+                nonlocal hashed
+                async with hash_lock:
+                    while hashed < count and hashed in done:
+                        data = held.pop(hashed, None)
+                        if data is None:
+                            data = await loop.run_in_executor(
+                                None, os.pread, fd, self._length(hashed, size), hashed * self.chunk_size)
+                        await loop.run_in_executor(None, sha.update, data)
+                        hashed += 1
+
+            async def worker():
+                while todo:
+                    k = todo.pop()
+                    data = await self._fetch(k * self.chunk_size, self._length(k, size), size)
+                    await loop.run_in_executor(None, os.pwrite, fd, data, k * self.chunk_size)
+                    done.add(k)
+                    if k - hashed < 2 * self.workers:
+                        held[k] = data  # else it is read back from disk later
+                    self._save_state(size, etag, done)
+                    await advance()
+
+            tasks = [asyncio.ensure_future(worker()) for _ in range(min(self.workers, len(todo)))]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            await advance()
+        finally:
+            os.close(fd)
+        return sha.hexdigest()
+
+    def _length(self, k, size):
+        return min(self.chunk_size, size - k * self.chunk_size)
+
+    async def _fetch(self, start, length, size):
+        """Bytes [start, start + length) of the file"""
+        headers = {'Range': f"bytes={start}-{start + length - 1}"}
+        attempt = 0
+        while True:
+            data = bytearray()
+            try:
+                async with self.session.get(self.url, headers=headers) as response:
+                    if response.status == 200 and length < size:
+                        raise _NoRanges()
+                    self._check(response)
+                    async for block in response.content.iter_chunked(1024 * 1024):
+                        data += block
+                        self._progress(len(block))
+                if len(data) != length:
+                    raise _Transient(f"short read ({len(data)} of {length} bytes)")
+                return bytes(data)
+            except (_Transient, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._progress(-len(data))
+                await self._retrying(f"bytes {start}-{start + length - 1}", attempt, e)
+                attempt += 1
+
+    async def _stream(self):
+        """Plain GET of the whole file, hashed as it is written"""
+        attempt = 0
+        while True:
+            sha = hashlib.sha256()
+            written = 0
+            try:
+                async with self.session.get(self.url) as response:
+                    self._check(response)
+                    self.size = response.content_length
+                    with open(self.part, 'wb') as f:
+                        async for block in response.content.iter_chunked(1024 * 1024):
+                            f.write(block)
+                            sha.update(block)
+                            written += len(block)
+                            self._progress(len(block))
+                if self.size is not None and written != self.size:
+                    raise _Transient(f"short read ({written} of {self.size} bytes)")
+                return sha.hexdigest()
+            except (_Transient, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._progress(-written)
+                await self._retrying("GET", attempt, e)
+                attempt += 1
+
+    def _check(self, response):
+        if response.status in RETRY_STATUSES:
+            raise _Transient(f"HTTP {response.status}")
+        if response.status >= 400:
+            raise DownloadError(f"{self.dest.name}: HTTP {response.status} for {self.url}")
+
+
+async def download_models(models, models_dir=MODELS_DIR, index=None, workers=WORKERS,
+                          parallel_files=PARALLEL_FILES, on_progress=None, on_done=None):
+    """Download manifest entries ({path: entry}) that are missing or don't
+    match their expected hash; returns {path: (status, detail)}.
+
+    Files already present are checked through the checksum index, so an
+    unchanged file is not hashed again.
+    """
+    models_dir = Path(models_dir)
+    index = index if index is not None else ChecksumIndex()
+    limit = asyncio.Semaphore(parallel_files)
+    results = {}
+
+    async def fetch(session, name, entry):
+        dest = models_dir / name
+        expected = entry.get('sha256')
+        if dest.exists():
+            digest = index.digests([dest])[dest]
+            if expected is None or digest == expected.lower():
+                return PRESENT, digest
+        if not entry.get('url'):
+            return MANUAL, entry.get('source')
+        async with limit:
+            download = Download(session, entry['url'], dest, expected, workers=workers,
+                                on_progress=on_progress)
+            download.name = name
+            try:
+                digest = await download.run()
+            except DownloadError as e:
+                return FAILED, str(e)
+        index.record(dest, digest)
+        return DOWNLOADED, digest
+
+    async def one(session, name, entry):
+        results[name] = await fetch(session, name, entry)
+        if on_done:
+            on_done(name, *results[name])
+
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        await asyncio.gather(*(one(session, name, entry) for name, entry in models.items()))
+    index.save()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Download models listed in the model manifest")
+    parser.add_argument("models", nargs="*", help="file names or paths from the manifest")
+    parser.add_argument("--all", action="store_true", help="every model with a download URL")
+    parser.add_argument("--models-dir", default=str(MODELS_DIR), help="ComfyUI models folder")
+    parser.add_argument("--manifest", default=str(EXPECTED_FILE))
+    parser.add_argument("--workers", type=int, default=WORKERS, help="connections per file")
+    parser.add_argument("--list", action="store_true", help="list the manifest and exit")
+    args = parser.parse_args()
+
+    manifest = load_expected(args.manifest)
+    if args.list or not (args.models or args.all):
+        for path, entry in manifest.items():
+            print(f"   {'📥' if entry.get('url') else '🖐️ '} {path}")
+        sys.exit(0)
+    try:
+        models = find_models(manifest, [] if args.all else args.models)
+    except KeyError as e:
+        print(f"❌ {e.args[0]}")
+        sys.exit(2)
+
+    started = time.monotonic()
+    shown = {}
+
+    def progress(download, received, total):
+        if not total:
+            return
+        step = int(received * 10 / total)
+        if step > shown.get(download.name, -1):
+            shown[download.name] = step
+            rate = (received - download.resumed) / max(time.monotonic() - started, 1e-3) / 1024**2
+            print(f"   ⬇️  {download.name}: {received * 100 // total}% "
+                  f"of {total / 1024**3:.2f}GB ({rate:.0f}MB/s)")
+
+    def done(name, status, detail):
+        icons = {DOWNLOADED: "✅", PRESENT: "✓ ", MANUAL: "🖐️ ", FAILED: "❌"}
+        text = {DOWNLOADED: "downloaded and verified", PRESENT: "already there",
+                MANUAL: f"download it by hand from {detail}", FAILED: detail}[status]
+        print(f"   {icons[status]} {name}: {text}")
+
+    results = asyncio.run(download_models(models, args.models_dir, workers=args.workers,
+                                          on_progress=progress, on_done=done))
+    sys.exit(1 if any(status == FAILED for status, _ in results.values()) else 0)
@@ -0,0 +1,463 @@
+"""
+In-process stand-in for a ComfyUI server, for exercising comfykit without a
+GPU or network.
+
+It accepts prompts on /prompt, "executes" them one at a time with
+configurable delays (per prompt, per node, per /prompt and /view request),
+and reports progress the way ComfyUI does: /queue,
+/history and the /ws event stream. Nothing is rendered; SaveImage and
+PreviewImage nodes report made-up output filenames, and /view serves a
+real (uncompressed, so about `image_bytes` long) gray PNG for them, its
+level taken from the seed of the sampler the image came from, so code that
+decodes or scores outputs has something to work on. Files sent to
+/upload/image are kept in memory and served back by /view.
+
+    async with FakeComfyServer(exec_time=0.1) as server:
+        ... point a client at server.url ...
+
+Synchronous code can run it on a background thread:
+
+    with FakeComfyServer().running() as server:
+        ...
+
+FakeFileServer does the same for plain file downloads (see
+comfykit.downloads).
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import io
+import itertools
+import math
+import threading
+import time
+import uuid
+
+from aiohttp import WSMsgType, web
+from PIL import Image
+
+from comfykit.schema import BUILTIN_WIDGET_NAMES
+
+OUTPUT_NODES = {'SaveImage', 'PreviewImage'}
+# Gray level of outputs that no seeded node feeds
+DEFAULT_SHADE = 128
+# Encoded output images kept, one per gray level
+FILLER_MEMORY = 16
+
+
+class FakeComfyServer:
+    """Fake ComfyUI HTTP + websocket API"""
+
+    def __init__(self, exec_time=0.05, node_time=0.0, submit_latency=0.0,
+                 fail_types=(), host='127.0.0.1', port=0, vram_total=6 * 1024**3,
+                 image_bytes=64 * 1024, view_latency=0.0):
+        self.exec_time = exec_time
+        self.node_time = node_time
+        self.submit_latency = submit_latency
+        self.fail_types = set(fail_types)
+        self.host = host
+        self.port = port
+        self.vram_total = vram_total
+        self.image_bytes = image_bytes
+        self.view_latency = view_latency
+        self.files = {}
+        self.shades = {}       # (type, subfolder, filename) of an output -> gray level
+        self.finished_at = {}  # prompt_id -> when completion was announced
+
+        self.history = {}
+        self.pending = []
+        self.running_item = None
+        self.submitted = 0
+        self._numbers = itertools.count()
+        self._sockets = {}
+        self._wakeup = None
+        self._runner = None
+        self._worker = None
+        self._image_counter = itertools.count(1)
+        self._fillers = {}
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # -- lifecycle --------------------------------------------------------
+
+    def make_app(self):
+        app = web.Application(client_max_size=1024**3)
+        app.add_routes([
+            web.post('/prompt', self.post_prompt),
+            web.get('/queue', self.get_queue),
+            web.post('/queue', self.post_queue),
+            web.post('/interrupt', self.post_interrupt),
+            web.get('/history', self.get_history),
+            web.get('/history/{prompt_id}', self.get_history),
+            web.get('/system_stats', self.get_system_stats),
+            web.get('/object_info', self.get_object_info),
+            web.get('/view', self.get_view),
+            web.post('/upload/image', self.post_upload),
+            web.get('/ws', self.websocket),
+        ])
+        return app
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._worker = asyncio.ensure_future(self._work())
+        return self
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+        await self.drop_websockets()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    @contextlib.contextmanager
+    def running(self):
+        """Run the server on its own event loop in a background thread"""
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self.stop())
+            loop.close()
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        ready.wait()
+        try:
+            yield self
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+    async def drop_websockets(self):
+        """Close every open websocket (to exercise reconnect handling)"""
+        for ws in list(self._sockets.values()):
+            await ws.close()
+        self._sockets.clear()
+
+    # -- events -----------------------------------------------------------
+
+    async def send(self, event_type, data, client_id):
+        if client_id is None:
+            targets = list(self._sockets.values())
+        else:
+            ws = self._sockets.get(client_id)
+            targets = [ws] if ws is not None else []
+        for ws in targets:
+            with contextlib.suppress(ConnectionError, RuntimeError):
+                await ws.send_json({'type': event_type, 'data': data})
+
+    async def _work(self):
+        while True:
+            while not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self.running_item = self.pending.pop(0)
+            await self.execute(*self.running_item)
+            self.running_item = None
+
+    async def execute(self, number, prompt_id, prompt, extra, outputs):
+        client_id = extra.get('client_id')
+        started = time.time()
+        await self.send('execution_start', {'prompt_id': prompt_id}, client_id)
+
+        results = {}
+        error = None
+        per_node = self.exec_time / max(1, len(prompt))
+        for node_id, node in prompt.items():
+            class_type = node.get('class_type')
+            await self.send('executing', {'node': node_id, 'display_node': node_id,
+                                          'prompt_id': prompt_id}, client_id)
+            await asyncio.sleep(per_node + self.node_time)
+
+            if class_type in self.fail_types:
+                error = {'prompt_id': prompt_id, 'node_id': node_id, 'node_type': class_type,
+                         'exception_message': 'fake failure', 'exception_type': 'RuntimeError'}
+                break
+
+            if class_type == 'KSampler':
+                steps = node['inputs'].get('steps', 1)
+                await self.send('progress', {'value': steps, 'max': steps, 'node': node_id,
+                                             'prompt_id': prompt_id}, client_id)
+
+            if class_type in OUTPUT_NODES:
+                output = {'images': [self.output_image(node, _seed_of(prompt, node_id))]}
+                results[node_id] = output
+                await self.send('executed', {'node': node_id, 'display_node': node_id,
+                                             'output': output, 'prompt_id': prompt_id}, client_id)
+
+        messages = [['execution_start', {'prompt_id': prompt_id, 'timestamp': started}]]
+        if error is not None:
+            messages.append(['execution_error', error])
+            status = {'status_str': 'error', 'completed': False, 'messages': messages}
+        else:
+            status = {'status_str': 'success', 'completed': True, 'messages': messages}
+
+        # History first, so a client reacting to the event can read it
+        self.history[prompt_id] = {
+            'prompt': [number, prompt_id, prompt, extra, outputs],
+            'outputs': results,
+            'status': status,
+        }
+        self.finished_at[prompt_id] = time.time()
+        if error is not None:
+            await self.send('execution_error', error, client_id)
+        else:
+            await self.send('execution_success', {'prompt_id': prompt_id}, client_id)
+        await self.send('executing', {'node': None, 'prompt_id': prompt_id}, client_id)
+
+    def output_image(self, node, seed=None):
+        prefix = node['inputs'].get('filename_prefix', 'ComfyUI')
+        temp = node.get('class_type') == 'PreviewImage'
+        subfolder, _, name = str(prefix).rpartition('/')
+        filename = f"{name or 'ComfyUI'}_{next(self._image_counter):05d}_.png"
+        image = {'filename': filename, 'subfolder': subfolder,
+                 'type': 'temp' if temp else 'output'}
+        if seed is not None:
+            self.shades[(image['type'], subfolder, filename)] = seed % 256
+        return image
+
+    # -- HTTP handlers ----------------------------------------------------
+
+    async def post_prompt(self, request):
+        if self.submit_latency:
+            await asyncio.sleep(self.submit_latency)
+        body = await request.json()
+        prompt = body.get('prompt')
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({'error': {'type': 'invalid_prompt',
+                                                'message': 'Cannot execute because no prompt'},
+                                      'node_errors': {}}, status=400)
+
+        prompt_id = body.get('prompt_id') or str(uuid.uuid4())
+        number = next(self._numbers)
+        outputs = [n for n, node in prompt.items() if node.get('class_type') in OUTPUT_NODES]
+        extra = {'client_id': body.get('client_id')}
+        self.pending.append((number, prompt_id, prompt, extra, outputs))
+        self.submitted += 1
+        self._wakeup.set()
+        return web.json_response({'prompt_id': prompt_id, 'number': number, 'node_errors': {}})
+
+    async def get_queue(self, request):
+        running = [list(self.running_item)] if self.running_item else []
+        return web.json_response({'queue_running': running,
+                                  'queue_pending': [list(item) for item in self.pending]})
+
+    async def post_queue(self, request):
+        body = await request.json()
+        if body.get('clear'):
+            self.pending.clear()
+        delete = set(body.get('delete') or [])
+        self.pending = [item for item in self.pending if item[1] not in delete]
+        return web.Response(status=200)
+
+    async def post_interrupt(self, request):
+        return web.Response(status=200)
+
+    async def get_history(self, request):
+        prompt_id = request.match_info.get('prompt_id')
+        if prompt_id is not None:
+            entry = self.history.get(prompt_id)
+            return web.json_response({prompt_id: entry} if entry else {})
+        return web.json_response(self.history)
+
+    async def get_system_stats(self, request):
+        busy = 1 if self.running_item else 0
+        return web.json_response({
+            'system': {'os': 'fake', 'python_version': '3', 'comfyui_version': 'fake',
+                       'pytorch_version': 'none'},
+            'devices': [{'name': 'fake', 'type': 'cpu', 'index': 0,
+                         'vram_total': self.vram_total,
+                         'vram_free': self.vram_total // (2 if busy else 1)}],
+        })
+
+    async def get_object_info(self, request):
+        info = {}
+        for node_type, names in BUILTIN_WIDGET_NAMES.items():
+            required = {name: ['STRING', {}] for name in names if name is not None}
+            info[node_type] = {'input': {'required': required}, 'output': [],
+                               'name': node_type, 'category': 'fake'}
+        return web.json_response(info)
+
+    async def get_view(self, request):
+        if self.view_latency:
+            await asyncio.sleep(self.view_latency)
+        key = (request.query.get('type', 'output'), request.query.get('subfolder', ''),
+               request.query.get('filename', ''))
+        data = self.files.get(key)
+        if data is None:
+            if key[0] == 'input' or not key[2]:
+                return web.Response(status=404)
+            data = self.filler(self.shades.get(key, DEFAULT_SHADE))
+        return web.Response(body=data, content_type='image/png')
+
+    def filler(self, shade=DEFAULT_SHADE):
+        """A gray PNG of about image_bytes standing in for a generated image,
+        encoded once per gray level"""
+        data = self._fillers.get(shade)
+        if data is None:
+            # Stored uncompressed: 3 bytes a pixel plus a filter byte a row
+            side = max(8, math.isqrt(max(0, self.image_bytes) // 3) // 8 * 8)
+            buffer = io.BytesIO()
+            Image.new('RGB', (side, side), (shade,) * 3).save(buffer, format='PNG',
+                                                             compress_level=0)
+            data = buffer.getvalue()
+            if len(self._fillers) >= FILLER_MEMORY:
+                self._fillers.pop(next(iter(self._fillers)))
+            self._fillers[shade] = data
+        return data
+
+    async def post_upload(self, request):
+        form = await request.post()
+        field = form.get('image')
+        if field is None or not hasattr(field, 'file'):
+            return web.Response(status=400)
+        kind = form.get('type', 'input') or 'input'
+        subfolder = form.get('subfolder', '') or ''
+        overwrite = str(form.get('overwrite', '')).lower() in ('true', '1')
+
+        # Same renaming rule as ComfyUI: "name (1).png" if it exists
+        name = field.filename
+        stem, dot, ext = name.rpartition('.')
+        counter = 1
+        while not overwrite and (kind, subfolder, name) in self.files:
+            name = f"{stem} ({counter}).{ext}" if dot else f"{ext} ({counter})"
+            counter += 1
+
+        self.files[(kind, subfolder, name)] = field.file.read()
+        return web.json_response({'name': name, 'subfolder': subfolder, 'type': kind})
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get('clientId') or uuid.uuid4().hex
+        self._sockets[client_id] = ws
+        await ws.send_json({'type': 'status', 'data': {'status': {'exec_info': {
+            'queue_remaining': len(self.pending) + (1 if self.running_item else 0)}},
+            'sid': client_id}})
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            if self._sockets.get(client_id) is ws:
+                del self._sockets[client_id]
+        return ws
+
+
+def _seed_of(prompt, node_id):
+    """Seed of the nearest node upstream of `node_id` that has one"""
+    seen, frontier = set(), [node_id]
+    while frontier:
+        upstream = []
+        for current in frontier:
+            node = prompt.get(current)
+            if node is None or current in seen:
+                continue
+            seen.add(current)
+            seed = node.get('inputs', {}).get('seed')
+            if isinstance(seed, int):
+                return seed
+            upstream.extend(v[0] for v in node.get('inputs', {}).values()
+                            if isinstance(v, list) and v and isinstance(v[0], str))
+        frontier = upstream
+    return None
+
+
+class FakeFileServer:
+    """Stand-in for a model host (Hugging Face, a CDN) serving `files`
+    ({url path: bytes}) with HEAD, ETag and single-range GET support.
+
+    `ranges=False` ignores Range headers like a server without them would,
+    and `fail_after` bytes cuts the next `failures` responses short, for
+    exercising resumes and retries.
+    """
+
+    def __init__(self, files=None, ranges=True, fail_after=None, failures=0,
+                 host='127.0.0.1', port=0):
+        self.files = dict(files or {})
+        self.ranges = ranges
+        self.fail_after = fail_after
+        self.failures = failures
+        self.host = host
+        self.port = port
+        self.requests = []  # (method, path, Range header)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.serve)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    running = FakeComfyServer.running
+
+    async def serve(self, request):
+        path = '/' + request.match_info['path']
+        self.requests.append((request.method, path, request.headers.get('Range')))
+        data = self.files.get(path)
+        if data is None or request.method not in ('GET', 'HEAD'):
+            return web.Response(status=404)
+        # A content digest, so the tag is the same in every process
+        headers = {'ETag': f'"{hashlib.sha256(data).hexdigest()[:32]}"'}
+        if self.ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        if request.method == 'HEAD':
+            headers['Content-Length'] = str(len(data))
+            return web.Response(status=200, headers=headers)
+
+        status, body = 200, data
+        if self.ranges and request.http_range.start is not None:
+            start = request.http_range.start
+            stop = min(request.http_range.stop or len(data), len(data))
+            status, body = 206, data[start:stop]
+            headers['Content-Range'] = f"bytes {start}-{stop - 1}/{len(data)}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        if self.failures and self.fail_after is not None and self.fail_after < len(body):
+            self.failures -= 1
+            await response.write(body[:self.fail_after])
+            request.transport.close()
+            return response
+        await response.write(body)
+        await response.write_eof()
+        return response
@@ -0,0 +1,326 @@
+"""
+Inventory of the model files under ComfyUI/models.
+
+A .safetensors file starts with an 8-byte little-endian length and a JSON
+header listing every tensor's name, dtype and shape. Only that header is
+read (through a memory map, so just its pages come off the disk) and the
+architecture is told from the tensor layout instead of the file size:
+
+    model.diffusion_model.*        checkpoint (UNet + CLIP + VAE) or
+    input_blocks.* / double_blocks UNet / diffusion model on its own
+    ...attn2.to_k.weight [_, 768]  SD1.5   (1024 SD2.x, 2048 SDXL, 1280
+                                   SDXL refiner: the text context width)
+    input_blocks.0.0.weight [_, 9] inpainting UNet (4 latent + 4 masked
+                                   latent + 1 mask channels)
+    lora_down / lora_A             LoRA, with the same context-width rule
+    encoder.* + decoder.*          VAE
+
+Folders are scanned with a thread pool and every result is cached by
+(path, size, mtime), so rescanning a few hundred GB of models only costs
+the directory listing:
+
+    inventory = ModelInventory()
+    for model in inventory.scan():
+        print(model['folder'], model['name'], model['arch'])
+    inventory.save()
+
+    python3 -m comfykit.inventory [--models DIR] [--json]
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from comfykit.config import CACHE_DIR, MODELS_DIR
+
+INVENTORY_FILE = CACHE_DIR / "inventory.json"
+MODEL_EXTENSIONS = {'.safetensors', '.sft', '.ckpt', '.pt', '.pth', '.bin'}
+MAX_HEADER = 100 * 1024 * 1024  # the format's own limit
+
+# Width of the text conditioning the UNet cross-attends to
+CONTEXT_ARCH = {768: 'SD1.5', 1024: 'SD2.x', 1280: 'SDXL Refiner', 2048: 'SDXL'}
+
+# Latent channels of a VAE decoder
+VAE_ARCH = {4: 'SD/SDXL', 16: 'SD3/Flux'}
+
+# modelspec.architecture metadata prefixes, for files whose tensor layout
+# doesn't settle it
+MODELSPEC_ARCH = {
+    'stable-diffusion-v1': 'SD1.5',
+    'stable-diffusion-v2': 'SD2.x',
+    'stable-diffusion-xl-v1-refiner': 'SDXL Refiner',
+    'stable-diffusion-xl': 'SDXL',
+    'stable-diffusion-v3': 'SD3',
+    'flux': 'Flux',
+}
+
+
+class HeaderError(ValueError):
+    """A file that isn't a readable safetensors file"""
+
+
+def read_header(path):
+    """The JSON header of a .safetensors file, without reading the tensors"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 8:
+            raise HeaderError(f"{path}: too small for a safetensors file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            (length,) = struct.unpack('<Q', data[:8])
+            if length > min(MAX_HEADER, size - 8):
+                raise HeaderError(f"{path}: bad header length {length}")
+            try:
+                return json.loads(data[8:8 + length])
+            except (UnicodeDecodeError, ValueError) as e:
+                raise HeaderError(f"{path}: unreadable header ({e})") from e
+
+
+def _find(keys, suffix, contains=None):
+    for key in keys:
+        if key.endswith(suffix) and (contains is None or contains in key):
+            return key
+    return None
+
+
+def _context_arch(tensors, key):
+    """Architecture from the text-context width of a cross-attention weight"""
+    if key is None:
+        return None
+    shape = tensors[key].get('shape') or []
+    return CONTEXT_ARCH.get(shape[-1]) if len(shape) >= 2 else None
+
+
+def classify(header):
+    """{'kind', 'arch', 'inpaint'} of a model from its safetensors header.
+
+    kind is checkpoint, unet, lora, controlnet, vae, text_encoder,
+    clip_vision or unknown; arch is None when it can't be told.
+    """
+    tensors = {k: v for k, v in header.items() if k != '__metadata__'}
+    keys = list(tensors)
+    metadata = header.get('__metadata__') or {}
+    kind, arch, inpaint = 'unknown', None, False
+
+    def has(part):
+        return any(part in key for key in keys)
+
+    if has('lora_down') or has('lora_A') or has('lora_up') or has('hada_w1') or has('lokr_w1'):
+        kind = 'lora'
+        if has('double_blocks'):
+            arch = 'Flux'
+        elif has('lora_te2_') or has('lora_te1_'):
+            arch = 'SDXL'
+        else:
+            arch = _context_arch(tensors, _find(keys, 'lora_down.weight', 'attn2_to_k')
+                                 or _find(keys, 'lora_A.weight', 'attn2.to_k'))
+    elif has('control_model.') or has('input_hint_block') or has('controlnet_cond_embedding'):
+        kind = 'controlnet'
+        arch = _context_arch(tensors, _find(keys, 'attn2.to_k.weight'))
+    elif has('double_blocks.'):
+        kind, arch = ('checkpoint' if has('model.diffusion_model.') else 'unet'), 'Flux'
+    elif has('joint_blocks.'):
+        kind, arch = ('checkpoint' if has('model.diffusion_model.') else 'unet'), 'SD3'
+    elif has('input_blocks.') or (has('down_blocks.') and has('attn2.to_k')):
+        prefix = 'model.diffusion_model.' if has('model.diffusion_model.') else ''
+        kind = 'checkpoint' if prefix and has('first_stage_model.') else 'unet'
+        arch = _context_arch(tensors, _find(keys, 'attn2.to_k.weight'))
+        conv_in = tensors.get(prefix + 'input_blocks.0.0.weight') or tensors.get('conv_in.weight')
+        shape = (conv_in or {}).get('shape') or []
+        inpaint = len(shape) > 1 and shape[1] == 9
+    elif has('encoder.conv_in.') and has('decoder.conv_out.'):
+        kind = 'vae'
+        decoder_in = _find(keys, 'decoder.conv_in.weight')
+        shape = tensors[decoder_in].get('shape') if decoder_in else None
+        arch = VAE_ARCH.get(shape[1]) if shape and len(shape) > 1 else None
+    elif has('vision_model.'):
+        kind = 'clip_vision'
+    elif has('text_model.encoder.') or has('encoder.block.'):
+        kind = 'text_encoder'
+        arch = 'T5' if has('encoder.block.') else 'CLIP'
+
+    if arch is None:
+        spec = str(metadata.get('modelspec.architecture', ''))
+        for prefix, name in MODELSPEC_ARCH.items():
+            if spec.startswith(prefix):
+                arch = name
+                break
+    return {'kind': kind, 'arch': arch, 'inpaint': inpaint}
+
+
+def describe_header(header):
+    """classify() plus tensor count, parameter count and main dtype"""
+    tensors = [v for k, v in header.items() if k != '__metadata__']
+    dtypes = {}
+    params = 0
+    for tensor in tensors:
+        count = math.prod(tensor.get('shape') or [])
+        params += count
+        dtype = tensor.get('dtype')
+        dtypes[dtype] = dtypes.get(dtype, 0) + count
+    return {
+        **classify(header),
+        'tensors': len(tensors),
+        'params': params,
+        'dtype': max(dtypes, key=dtypes.get) if dtypes else None,
+    }
+
+
+def inspect(path):
+    """Inventory entry for one file (its header parsed if it's safetensors)"""
+    path = str(path)
+    stat = os.stat(path)
+    entry = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+             'kind': 'unknown', 'arch': None, 'inpaint': False, 'error': None}
+    if Path(path).suffix.lower() in ('.safetensors', '.sft'):
+        try:
+            entry.update(describe_header(read_header(path)))
+        except (OSError, HeaderError) as e:
+            entry['error'] = str(e)
+    return entry
+
+
+def _walk(root):
+    """Model files under root, following symlinked folders once each"""
+    found, seen, stack = [], set(), [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            real = os.path.realpath(folder)
+            if real in seen:
+                continue
+            seen.add(real)
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in MODEL_EXTENSIONS:
+                        found.append(entry)
+        except OSError:
+            continue
+    return found
+
+
+class ModelInventory:
+    """Model files per ComfyUI model folder, cached by (path, size, mtime)"""
+
+    def __init__(self, models_dir=MODELS_DIR, path=INVENTORY_FILE, workers=8):
+        self.models_dir = Path(models_dir).absolute()
+        self.path = Path(path)
+        self.workers = workers
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f).get('entries', {})
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def scan(self, folders=None):
+        """Entries for every model file in the given folders (default: all
+        of them), each with 'folder' and 'name' added; sorted by path"""
+        if folders is None:
+            try:
+                folders = sorted(e.name for e in os.scandir(self.models_dir) if e.is_dir())
+            except OSError:
+                folders = []
+        roots = [self.models_dir / folder for folder in folders]
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            listings = list(pool.map(_walk, [str(root) for root in roots]))
+            stale = []
+            for root, listing in zip(roots, listings):
+                for dir_entry in listing:
+                    try:
+                        stat = dir_entry.stat()
+                    except OSError:
+                        continue
+                    cached = self.entries.get(dir_entry.path)
+                    if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+                        self.hits += 1
+                        results.append((root, cached))
+                    else:
+                        stale.append((root, dir_entry.path))
+            for (root, _), entry in zip(stale, pool.map(inspect, [path for _, path in stale])):
+                self.misses += 1
+                self.entries[entry['path']] = entry
+                self._dirty = True
+                results.append((root, entry))
+
+        # Forget files that are gone from the folders just scanned
+        listed = {entry['path'] for _, entry in results}
+        for path in [p for p in self.entries if p not in listed]:
+            if any(Path(path).is_relative_to(root) for root in roots):
+                del self.entries[path]
+                self._dirty = True
+
+        models = []
+        for root, entry in results:
+            models.append({**entry, 'folder': root.name,
+                           'name': os.path.relpath(entry['path'], root).replace(os.sep, '/')})
+        models.sort(key=lambda m: m['path'])
+        return models
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'entries': self.entries}, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def model_label(model):
+    """Short description, e.g. "SDXL checkpoint, fp16, 2.6B params" """
+    if model.get('error'):
+        return f"unreadable: {model['error']}"
+    if model['kind'] == 'unknown' and model['arch'] is None:
+        return Path(model['path']).suffix.lstrip('.') + " (not inspected)"
+    parts = [" ".join(p for p in (model['arch'], "inpainting" if model['inpaint'] else None,
+                                  model['kind']) if p)]
+    if model.get('dtype'):
+        dtype = model['dtype'].lower()  # F16, BF16, F32, F8_E4M3, ...
+        parts.append('fp' + dtype[1:] if dtype.startswith('f') else dtype)
+    if model.get('params'):
+        parts.append(f"{model['params'] / 1e9:.2f}B params" if model['params'] >= 1e8
+                     else f"{model['params'] / 1e6:.0f}M params")
+    return ", ".join(parts)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="List model files and their architectures")
+    parser.add_argument("--models", default=str(MODELS_DIR), help="ComfyUI models folder")
+    parser.add_argument("--folder", nargs="+", help="only these folders (checkpoints, loras, ...)")
+    parser.add_argument("--json", action="store_true", help="print the inventory as JSON")
+    args = parser.parse_args()
+
+    inventory = ModelInventory(args.models)
+    start = time.perf_counter()
+    models = inventory.scan(args.folder)
+    elapsed = time.perf_counter() - start
+    inventory.save()
+
+    if args.json:
+        print(json.dumps(models, indent=2))
+    else:
+        folder = None
+        for model in models:
+            if model['folder'] != folder:
+                folder = model['folder']
+                print(f"\n📁 {folder}/")
+            print(f"   • {model['name']} ({model['size'] / 1024**3:.1f}GB - {model_label(model)})")
+        total = sum(m['size'] for m in models) / 1024**3
+        print(f"\n✅ {len(models)} model(s), {total:.1f}GB, scanned in {elapsed * 1000:.0f}ms "
+              f"({inventory.hits} cached, {inventory.misses} read)")
@@ -0,0 +1,214 @@
+"""
+Persistent record of batch jobs, so an interrupted batch can be resumed.
+
+Every job of a batch is written to a SQLite journal with its parameters,
+and updated as it is submitted (prompt_id, host) and as it finishes
+(status, timings, error, output files). The journal is committed after
+every change, so after a ComfyUI restart, an OOM or a reboot a rerun of
+the same batch only runs what hadn't finished.
+
+The same journal answers "which parameters produced this file" for any
+batch, without scanning output folders:
+
+    python3 -m comfykit.journal which batch/00042_s1041_d0.3_00001_.png
+    python3 -m comfykit.journal status
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from comfykit.config import CACHE_DIR
+from comfykit.outputs import output_images, server_name
+
+JOURNAL_FILE = CACHE_DIR / "journal.sqlite"
+
+PENDING = 'pending'
+SUBMITTED = 'submitted'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    created REAL,
+    total INTEGER,
+    meta TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    batch TEXT,
+    idx INTEGER,
+    params TEXT,
+    status TEXT,
+    prompt_id TEXT,
+    host TEXT,
+    submitted_at REAL,
+    finished_at REAL,
+    error TEXT,
+    PRIMARY KEY (batch, idx)
+);
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT,
+    local TEXT,
+    batch TEXT,
+    idx INTEGER,
+    prompt_id TEXT,
+    node TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_local ON files (local);
+"""
+
+
+def batch_id(*parts):
+    """Stable id for a batch from whatever defines it (prompt, grid, ...)"""
+    blob = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+class JobJournal:
+    """SQLite-backed job states and output files of batch runs"""
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def begin(self, batch, params_list, meta=None):
+        """Register a batch (if new) and return {index: job row} for it"""
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO batches VALUES (?, ?, ?, ?)",
+                            (batch, time.time(), len(params_list), json.dumps(meta or {})))
+            self.db.executemany(
+                "INSERT OR IGNORE INTO jobs (batch, idx, params, status) VALUES (?, ?, ?, ?)",
+                [(batch, i, json.dumps(params), PENDING) for i, params in enumerate(params_list)])
+        rows = self.db.execute("SELECT * FROM jobs WHERE batch = ?", (batch,))
+        return {row['idx']: dict(row) for row in rows}
+
+    def reset(self, batch):
+        """Forget a batch so it runs from scratch"""
+        with self.db:
+            self.db.execute("DELETE FROM files WHERE batch = ?", (batch,))
+            self.db.execute("DELETE FROM jobs WHERE batch = ?", (batch,))
+            self.db.execute("DELETE FROM batches WHERE id = ?", (batch,))
+
+    def submitted(self, batch, index, prompt_id, host, at=None):
+        with self.db:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, prompt_id = ?, host = ?, submitted_at = ?, "
+                "finished_at = NULL, error = NULL WHERE batch = ? AND idx = ?",
+                (SUBMITTED, prompt_id, host, at or time.time(), batch, index))
+
+    def requeued(self, batch, index):
+        with self.db:
+            self.db.execute("UPDATE jobs SET status = ?, prompt_id = NULL WHERE batch = ? AND idx = ?",
+                            (PENDING, batch, index))
+
+    def finished(self, batch, index, error=None, prompt_id=None, host=None, outputs=None,
+                 submitted_at=None, finished_at=None):
+        """Record a job's outcome and the server-side names of its images"""
+        with self.db:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, prompt_id = COALESCE(?, prompt_id), "
+                "host = COALESCE(?, host), submitted_at = COALESCE(?, submitted_at), "
+                "finished_at = ?, error = ? WHERE batch = ? AND idx = ?",
+                (FAILED if error else DONE, prompt_id, host, submitted_at,
+                 finished_at or time.time(), error, batch, index))
+            self.db.execute("DELETE FROM files WHERE batch = ? AND idx = ?", (batch, index))
+            self.db.executemany(
+                "INSERT INTO files (name, batch, idx, prompt_id, node) VALUES (?, ?, ?, ?, ?)",
+                [(server_name(image), batch, index, prompt_id, node_id)
+                 for node_id, image in output_images(outputs)])
+
+    def downloaded(self, batch, index, image_name, local):
+        """Record where a job's image was downloaded to"""
+        with self.db:
+            updated = self.db.execute(
+                "UPDATE files SET local = ? WHERE batch = ? AND idx = ? AND name = ?",
+                (str(local), batch, index, image_name)).rowcount
+            if not updated:
+                self.db.execute("INSERT INTO files (name, local, batch, idx) VALUES (?, ?, ?, ?)",
+                                (image_name, str(local), batch, index))
+
+    def downloads(self, batch):
+        """{index: [local paths]} of the images downloaded for a batch"""
+        files = {}
+        for idx, local in self.db.execute(
+                "SELECT idx, local FROM files WHERE batch = ? AND local IS NOT NULL "
+                "ORDER BY rowid", (batch,)):
+            files.setdefault(idx, []).append(Path(local))
+        return files
+
+    def which(self, path):
+        """Jobs that produced a file, matched by server name (subfolder/file),
+        local path or bare file name"""
+        path = str(path)
+        name = Path(path).name
+        rows = self.db.execute(
+            "SELECT files.name, files.local, files.node, jobs.* FROM files "
+            "JOIN jobs ON jobs.batch = files.batch AND jobs.idx = files.idx "
+            "WHERE files.name = ? OR files.local = ? OR files.name = ? OR files.name LIKE ? "
+            "OR files.local LIKE ?",
+            (path, path, name, f"%/{name}", f"%/{name}"))
+        matches = []
+        for row in rows:
+            match = dict(row)
+            match['params'] = json.loads(match['params'])
+            matches.append(match)
+        return matches
+
+    def status(self, batch=None):
+        """{batch: {status: count}} for one or every batch"""
+        query = "SELECT batch, status, COUNT(*) FROM jobs"
+        args = ()
+        if batch is not None:
+            query += " WHERE batch = ?"
+            args = (batch,)
+        counts = {}
+        for b, status, n in self.db.execute(query + " GROUP BY batch, status", args):
+            counts.setdefault(b, {})[status] = n
+        return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the batch job journal")
+    parser.add_argument("--journal", default=str(JOURNAL_FILE))
+    sub = parser.add_subparsers(dest="command", required=True)
+    which = sub.add_parser("which", help="parameters that produced a file")
+    which.add_argument("files", nargs="+")
+    sub.add_parser("status", help="job counts per batch")
+    args = parser.parse_args()
+
+    with JobJournal(args.journal) as journal:
+        if args.command == "which":
+            for path in args.files:
+                matches = journal.which(path)
+                if not matches:
+                    print(f"❌ {path}: not in the journal")
+                for match in matches:
+                    print(f"📄 {path}")
+                    print(f"   batch {match['batch']} job #{match['idx']} ({match['status']}) "
+                          f"on {match['host']}, prompt {match['prompt_id']}")
+                    print(f"   params: {json.dumps(match['params'])}")
+        else:
+            for batch, counts in journal.status().items():
+                total = sum(counts.values())
+                parts = ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))
+                print(f"   {batch}: {total} jobs - {parts}")
@@ -0,0 +1,291 @@
+"""
+Run GroundingDINO + SAM once per image and detection prompt.
+
+In the auto-mask workflow the detector runs on every queue, even when only
+the seed or the inpaint prompt changed, and on a 6 GB card detection is a
+large share of each job. apply_mask_cache() instead:
+
+1. keys the detector by (image hash, detection prompt, threshold, models),
+2. on a miss, runs just the detector branch (plus MaskToImage/PreviewImage)
+   and stores the mask as a PNG in .comfykit/masks/, evicting the least
+   recently used masks past a size limit,
+3. uploads the mask as the alpha channel of an RGBA image (content
+   addressed, so once per server) and rewrites the prompt so the mask comes
+   from that LoadImage's MASK output. The detector and its model loaders
+   drop out of the graph.
+
+    async with ComfyClient(url) as client:
+        prompt = await apply_mask_cache(client, prompt)
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from comfykit.client import ComfyClient, ComfyError
+from comfykit.config import CACHE_DIR
+from comfykit.uploads import InputUploader, UploadManifest, digest_bytes
+
+MASK_DIR = CACHE_DIR / "masks"
+MAX_BYTES = 256 * 1024 * 1024
+
+# Detector node types: input carrying the image, output slot of the MASK
+DETECTORS = {
+    'GroundingDinoSAMSegment (segment anything)': ('image', 1),
+}
+
+_MASK_NODE = "comfykit_mask"
+_PREVIEW_NODE = "comfykit_mask_preview"
+
+
+class MaskCache:
+    """Detected masks on disk, evicted least-recently-used by total size.
+
+    Recency is the file's mtime, refreshed on every hit, so the cache needs
+    no index file.
+    """
+
+    def __init__(self, path=MASK_DIR, max_bytes=MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_digest, params):
+        blob = json.dumps([image_digest, params], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def path_for(self, key):
+        return self.path / f"{key[:32]}.png"
+
+    def get(self, key):
+        """PNG bytes of a cached mask, or None"""
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(key)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Delete the oldest masks until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and os.path.samefile(path, keep):
+                continue
+            os.remove(path)
+            total -= size
+
+
+def detectors(prompt):
+    """Node ids of detector nodes in a compiled prompt"""
+    return [node_id for node_id, node in prompt.items() if node['class_type'] in DETECTORS]
+
+
+def ancestors(prompt, node_id, skip=()):
+    """node_id and every node it reads from, not following `skip` inputs"""
+    seen = set()
+    stack = [node_id]
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        for name, value in prompt[current]['inputs'].items():
+            if current == node_id and name in skip:
+                continue
+            if isinstance(value, list):
+                stack.append(value[0])
+    return seen
+
+
+def detector_params(prompt, node_id):
+    """Everything besides the image that decides a detector's mask: its own
+    widgets and those of its model loaders"""
+    image_input, _ = DETECTORS[prompt[node_id]['class_type']]
+    params = []
+    for upstream in ancestors(prompt, node_id, skip=(image_input,)):
+        node = prompt[upstream]
+        widgets = {k: v for k, v in node['inputs'].items() if not isinstance(v, list)}
+        params.append([node['class_type'], widgets])
+    # Node ids differ between workflows; the key shouldn't
+    return sorted(params, key=lambda p: json.dumps(p, sort_keys=True))
+
+
+def detection_prompt(prompt, node_id):
+    """Just the detector branch, with its MASK sent to a PreviewImage"""
+    _, mask_slot = DETECTORS[prompt[node_id]['class_type']]
+    detect = {n: prompt[n] for n in ancestors(prompt, node_id)}
+    detect[_MASK_NODE] = {'inputs': {'mask': [node_id, mask_slot]}, 'class_type': 'MaskToImage'}
+    detect[_PREVIEW_NODE] = {'inputs': {'images': [_MASK_NODE, 0]}, 'class_type': 'PreviewImage'}
+    return detect
+
+
+def mask_loader(node_id):
+    """Id of the LoadImage that substitute_mask() puts in a detector's place"""
+    return f"{node_id}_mask"
+
+
+def substitute_mask(prompt, node_id, image_name):
+    """Replace a detector with a LoadImage of `image_name` feeding its MASK
+    consumers; nodes that used its other outputs (previews) are dropped, and
+    so are loaders nothing reads from any more"""
+    _, mask_slot = DETECTORS[prompt[node_id]['class_type']]
+    referenced = {v[0] for node in prompt.values() for v in node['inputs'].values()
+                  if isinstance(v, list)}
+    sinks = set(prompt) - referenced
+
+    load_id = mask_loader(node_id)
+    result = {}
+    for nid, node in prompt.items():
+        if nid == node_id:
+            continue
+        inputs = node['inputs']
+        if any(isinstance(v, list) and v[0] == node_id for v in inputs.values()):
+            inputs = {k: ([load_id, 1] if isinstance(v, list) and v == [node_id, mask_slot] else v)
+                      for k, v in inputs.items()}
+            node = {**node, 'inputs': inputs}
+        result[nid] = node
+    result[load_id] = {'inputs': {'image': image_name}, 'class_type': 'LoadImage'}
+
+    # Drop what still reads from the detector, then whatever is left unused
+    while True:
+        gone = {nid for nid, node in result.items()
+                if any(isinstance(v, list) and v[0] not in result for v in node['inputs'].values())}
+        referenced = {v[0] for node in result.values() for v in node['inputs'].values()
+                      if isinstance(v, list)}
+        gone |= {nid for nid in result if nid not in referenced and nid not in sinks
+                 and nid != load_id}
+        if not gone:
+            return result
+        for nid in gone:
+            del result[nid]
+
+
+def mask_to_png(image_bytes):
+    """Normalise a downloaded mask image to a single-channel PNG"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        mask = image.convert('L')
+    out = io.BytesIO()
+    mask.save(out, format='PNG', compress_level=1)
+    return out.getvalue()
+
+
+def mask_as_load_image(mask_png):
+    """RGBA PNG whose LoadImage MASK output is `mask` (LoadImage reads the
+    mask as 1 - alpha)"""
+    with Image.open(io.BytesIO(mask_png)) as image:
+        mask = image.convert('L')
+    black = Image.new('L', mask.size, 0)
+    out = io.BytesIO()
+    Image.merge('RGBA', (black, black, black, ImageOps.invert(mask))).save(
+        out, format='PNG', compress_level=1)
+    return out.getvalue()
+
+
+def image_loader(prompt, node_id):
+    """Id of the LoadImage a detector reads its image from, or None"""
+    image_input, _ = DETECTORS[prompt[node_id]['class_type']]
+    source = prompt[node_id]['inputs'].get(image_input)
+    if not isinstance(source, list) or prompt[source[0]]['class_type'] != 'LoadImage':
+        return None
+    return source[0]
+
+
+async def _image_digest(client, prompt, node_id, images, manifest):
+    loader = image_loader(prompt, node_id)
+    if loader is None:
+        return None
+    name = prompt[loader]['inputs']['image']
+    if images and name in images:
+        return manifest.digest(images[name])
+    subfolder, _, filename = name.rpartition('/')
+    return digest_bytes(await client.view(filename, subfolder, 'input'))
+
+
+async def apply_mask_cache(clients, prompt, cache=None, images=None, manifest=None):
+    """Return `prompt` with every detector replaced by its cached mask.
+
+    `clients` is a ComfyClient or a list of them: detection (on a miss) runs
+    on the first, and the mask is uploaded to all. `images` maps LoadImage
+    names to local files, so the image hash comes from the upload manifest
+    instead of downloading the input back from the server. Detectors whose
+    image isn't a plain LoadImage are left in place.
+    """
+    if isinstance(clients, ComfyClient):
+        clients = [clients]
+    cache = cache if cache is not None else MaskCache()
+    manifest = manifest if manifest is not None else UploadManifest()
+    uploaders = [InputUploader(client, manifest) for client in clients]
+    client = clients[0]
+
+    for node_id in detectors(prompt):
+        digest = await _image_digest(client, prompt, node_id, images, manifest)
+        if digest is None:
+            continue
+        key = cache.key(digest, detector_params(prompt, node_id))
+        mask = cache.get(key)
+        if mask is None:
+            result = await client.run(detection_prompt(prompt, node_id))
+            result.raise_for_error()
+            shown = (result.outputs.get(_PREVIEW_NODE) or {}).get('images')
+            if not shown:
+                raise ComfyError(f"Detector {node_id} produced no mask")
+            image = shown[0]
+            mask = mask_to_png(await client.view(image['filename'], image.get('subfolder', ''),
+                                                 image.get('type', 'temp')))
+            cache.put(key, mask)
+
+        data = mask_as_load_image(mask)
+        names = await asyncio.gather(*(uploader.upload_bytes(data, '.png') for uploader in uploaders))
+        prompt = substitute_mask(prompt, node_id, names[0])
+
+    manifest.save()
+    return prompt
+
+
+def cached_mask_prompt(prompt, urls, images=None, cache=None):
+    """Blocking helper for scripts; returns (prompt, cache)"""
+    if isinstance(urls, str):
+        urls = [urls]
+    cache = cache if cache is not None else MaskCache()
+
+    async def _apply():
+        clients = [ComfyClient(url) for url in urls]
+        try:
+            for client in clients:
+                await client.open()
+            return await apply_mask_cache(clients, prompt, cache, images)
+        finally:
+            for client in clients:
+                await client.close()
+    return asyncio.run(_apply()), cache
@@ -0,0 +1,212 @@
+"""
+Inpainting masks built with NumPy.
+
+Shapes (rectangles, ellipses, polygons) are rasterised with array
+operations, grow/shrink uses a van Herk max filter and feathering three box
+blurs, so every step is O(pixels) regardless of radius. Masks are written
+as single-channel 8-bit ("L") or 1-bit PNGs: a third of the bytes of the
+RGB masks create_test_mask() used to write. Load them in a workflow with
+LoadImageMask (channel "red").
+
+A shape is a small dict, so mask specs can live in JSON:
+
+    {"rect": [x0, y0, x1, y1]}
+    {"ellipse": [cx, cy, rx, ry]}
+    {"polygon": [[x, y], [x, y], ...]}
+
+Add "subtract": true to cut a shape out of the mask instead.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+def rect(height, width, box):
+    x0, y0, x1, y1 = (int(round(v)) for v in box)
+    mask = np.zeros((height, width), dtype=bool)
+    mask[max(0, y0):max(0, min(height, y1)), max(0, x0):max(0, min(width, x1))] = True
+    return mask
+
+
+def ellipse(height, width, params):
+    cx, cy, rx, ry = params
+    mask = np.zeros((height, width), dtype=bool)
+    x0, x1 = max(0, int(cx - rx)), min(width, int(np.ceil(cx + rx)) + 1)
+    y0, y1 = max(0, int(cy - ry)), min(height, int(np.ceil(cy + ry)) + 1)
+    if x0 >= x1 or y0 >= y1 or rx <= 0 or ry <= 0:
+        return mask
+    yy = (np.arange(y0, y1, dtype=np.float32)[:, None] + 0.5 - cy) / ry
+    xx = (np.arange(x0, x1, dtype=np.float32)[None, :] + 0.5 - cx) / rx
+    mask[y0:y1, x0:x1] = xx * xx + yy * yy <= 1.0
+    return mask
+
+
+def polygon(height, width, points):
+    """Even-odd fill of a polygon, evaluated only inside its bounding box"""
+    pts = np.asarray(points, dtype=np.float64)
+    mask = np.zeros((height, width), dtype=bool)
+    if len(pts) < 3:
+        return mask
+    x0, y0 = np.maximum(np.floor(pts.min(axis=0)).astype(int), 0)
+    x1 = min(width, int(np.ceil(pts[:, 0].max())) + 1)
+    y1 = min(height, int(np.ceil(pts[:, 1].max())) + 1)
+    if x0 >= x1 or y0 >= y1:
+        return mask
+
+    yy = np.arange(y0, y1, dtype=np.float64)[:, None] + 0.5
+    xx = np.arange(x0, x1, dtype=np.float64)[None, :] + 0.5
+    inside = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    for (ax, ay), (bx, by) in zip(pts, np.roll(pts, -1, axis=0)):
+        if ay == by:
+            continue
+        crosses = (ay > yy) != (by > yy)
+        x_at = ax + (yy - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (xx < x_at)
+    mask[y0:y1, x0:x1] = inside
+    return mask
+
+
+SHAPES = {'rect': rect, 'ellipse': ellipse, 'polygon': polygon}
+
+
+def _along(axis, ndim, index):
+    """Index tuple that applies `index` to one axis"""
+    key = [slice(None)] * ndim
+    key[axis] = index
+    return tuple(key)
+
+
+def _max_filter_1d(a, radius, axis):
+    """Sliding max over a window of 2*radius+1 along one axis (van Herk /
+    Gil-Werman): two cumulative maxima per block, independent of radius"""
+    k = 2 * radius + 1
+    n = a.shape[axis]
+    blocks = -(-(n + 2 * radius) // k) + 1
+    shape = list(a.shape)
+    shape[axis] = blocks * k
+    padded = np.zeros(shape, dtype=a.dtype)
+    padded[_along(axis, a.ndim, slice(radius, radius + n))] = a
+
+    split = a.shape[:axis] + (blocks, k) + a.shape[axis + 1:]
+    shaped = padded.reshape(split)
+    forward = np.maximum.accumulate(shaped, axis=axis + 1).reshape(shape)
+    backward = np.flip(np.maximum.accumulate(np.flip(shaped, axis + 1), axis=axis + 1), axis + 1)
+    backward = backward.reshape(shape)
+    return np.maximum(backward[_along(axis, a.ndim, slice(0, n))],
+                      forward[_along(axis, a.ndim, slice(k - 1, k - 1 + n))])
+
+
+def _bbox(mask, margin):
+    """Slices covering the set pixels plus `margin`, or None if empty"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    height, width = mask.shape
+    return (slice(max(0, rows[0] - margin), min(height, rows[-1] + margin + 1)),
+            slice(max(0, cols[0] - margin), min(width, cols[-1] + margin + 1)))
+
+
+def grow(mask, pixels):
+    """Dilate (pixels > 0) or erode (pixels < 0) a boolean mask by a square"""
+    if pixels == 0:
+        return mask
+    r = abs(int(pixels))
+    src = mask if pixels > 0 else ~mask
+    out = np.zeros_like(src)
+    box = _bbox(src, r)
+    if box is not None:
+        part = src[box].view(np.uint8)
+        out[box] = _max_filter_1d(_max_filter_1d(part, r, 0), r, 1).view(bool)
+    return out if pixels > 0 else ~out
+
+
+def _box_blur_1d(a, radius, axis):
+    k = 2 * radius + 1
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (radius + 1, radius)
+    csum = np.cumsum(np.pad(a, pad, mode='edge'), axis=axis, dtype=np.float32)
+    out = csum[_along(axis, a.ndim, slice(k, None))]
+    out -= csum[_along(axis, a.ndim, slice(None, -k))]
+    out /= k
+    return out
+
+
+def feather(mask, pixels):
+    """Soften mask edges over roughly `pixels`; returns float32 in [0, 1]"""
+    out = mask.astype(np.float32)
+    if pixels <= 0:
+        return out
+    radius = max(1, int(round(pixels / 3)))
+    # Only the area the blur can reach changes
+    box = _bbox(mask, 3 * radius)
+    if box is None:
+        return out
+    part = out[box]
+    for _ in range(3):  # three box passes approximate a Gaussian
+        part = _box_blur_1d(_box_blur_1d(part, radius, 0), radius, 1)
+    out[box] = part
+    return out
+
+
+def render_mask(width, height, shapes, grow_by=0, feather_by=0, invert=False):
+    """Rasterise shapes into a uint8 mask (255 = inpaint)"""
+    mask = np.zeros((height, width), dtype=bool)
+    for shape in shapes:
+        for kind, draw in SHAPES.items():
+            if kind in shape:
+                part = draw(height, width, shape[kind])
+                if shape.get('subtract'):
+                    mask &= ~part
+                else:
+                    mask |= part
+                break
+        else:
+            raise ValueError(f"Unknown mask shape: {shape}")
+
+    mask = grow(mask, grow_by)
+    if invert:
+        mask = ~mask
+    if feather_by > 0:
+        return np.round(feather(mask, feather_by) * 255).astype(np.uint8)
+    return mask.view(np.uint8) * np.uint8(255)
+
+
+def center_square(width, height, fraction=0.25):
+    """The white square create_test_mask() draws: side = 2*fraction*min(w, h)"""
+    half = int(min(width, height) * fraction)
+    cx, cy = width // 2, height // 2
+    return {'rect': [cx - half, cy - half, cx + half + 1, cy + half + 1]}
+
+
+def save_mask(mask, path, bits=8, compress_level=1):
+    """Write a uint8 mask as a grayscale (bits=8) or 1-bit (bits=1) PNG"""
+    if bits == 1:
+        image = Image.fromarray(mask >= 128)
+    elif bits == 8:
+        image = Image.fromarray(mask, mode='L')
+    else:
+        raise ValueError("bits must be 1 or 8")
+    tmp = f"{path}.tmp"
+    image.save(tmp, format='PNG', compress_level=compress_level)
+    os.replace(tmp, path)
+    return path
+
+
+def render_masks(specs, workers=None, bits=8):
+    """Render and save many masks in parallel.
+
+    Each spec is a dict with 'path', 'width', 'height', 'shapes' and
+    optionally 'grow', 'feather', 'invert'. NumPy and PNG compression both
+    release the GIL, so a thread pool keeps every core busy.
+    """
+    def one(spec):
+        mask = render_mask(spec['width'], spec['height'], spec['shapes'],
+                           spec.get('grow', 0), spec.get('feather', 0), spec.get('invert', False))
+        return save_mask(mask, spec['path'], bits)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return list(pool.map(one, specs))
@@ -0,0 +1,103 @@
+"""
+Fetch generated images from the server as each prompt finishes.
+
+Instead of globbing ComfyUI/output/ (which only works on the server machine
+and stats every file in an ever-growing folder), the collector reads the
+outputs a prompt reported (its `executed` events, or /history) and streams
+each image down through /view into a per-run directory. Every image gets a
+line in the run's index.jsonl recording the prompt and parameters that
+produced it.
+"""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+
+RUNS_DIR = Path("runs")
+INDEX_FILE = "index.jsonl"
+
+
+def new_run_dir(base=RUNS_DIR, name=None):
+    """Create runs/<timestamp> (or runs/<name>) and return it"""
+    run_dir = Path(base) / (name or time.strftime('%Y%m%d-%H%M%S'))
+    run_dir.mkdir(parents=True, exist_ok=True)
+    return run_dir
+
+
+def output_images(outputs, types=('output',)):
+    """Yield (node_id, image info) for every image in a prompt's outputs.
+
+    Preview images (type 'temp') are skipped unless asked for.
+    """
+    for node_id, output in (outputs or {}).items():
+        for image in (output or {}).get('images', []):
+            if image.get('type', 'output') in types:
+                yield node_id, image
+
+
+def server_name(image):
+    """"subfolder/filename" of an output image, as it sits on the server"""
+    subfolder = image.get('subfolder') or ''
+    return f"{subfolder}/{image['filename']}" if subfolder else image['filename']
+
+
+class OutputCollector:
+    """Download a prompt's images into a run directory with their params"""
+
+    def __init__(self, client, run_dir=None):
+        self.client = client
+        self.run_dir = Path(run_dir) if run_dir is not None else new_run_dir()
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.files = 0
+        self.bytes = 0
+
+    def local_name(self, image):
+        subfolder = image.get('subfolder') or ''
+        name = image['filename']
+        return f"{subfolder.replace('/', '_')}_{name}" if subfolder else name
+
+    async def collect(self, result, params=None, types=('output',)):
+        """Download every image of a PromptResult; returns the local paths"""
+        paths = []
+        for node_id, image in output_images(result.outputs, types):
+            dest = self.run_dir / self.local_name(image)
+            size = await self.client.download(dest, image['filename'],
+                                              image.get('subfolder', ''),
+                                              image.get('type', 'output'))
+            self.files += 1
+            self.bytes += size
+            paths.append(dest)
+            self.record({
+                'file': dest.name,
+                'prompt_id': result.prompt_id,
+                'node': node_id,
+                'host': result.host,
+                'params': params or {},
+                'bytes': size,
+                'time': time.time(),
+            })
+        return paths
+
+    def record(self, entry):
+        with open(self.run_dir / INDEX_FILE, 'a') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+
+def read_index(run_dir):
+    """Load a run's index.jsonl as a list of dicts"""
+    path = Path(run_dir) / INDEX_FILE
+    if not path.exists():
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def download_outputs(result, url, run_dir=None, params=None):
+    """Blocking helper for scripts: download one result's images"""
+    from comfykit.client import ComfyClient
+
+    async def _download():
+        async with ComfyClient(url) as client:
+            return await OutputCollector(client, run_dir).collect(result, params)
+    return asyncio.run(_download())
@@ -0,0 +1,100 @@
+"""
+Pack several parameter variants into one API prompt.
+
+Every prompt in the server queue pays for validation, cache checks and
+model management. pack_prompts() takes K rendered variants of a template,
+gives each variant's nodes their own ids and merges the nodes they have in
+common (compiler.dedupe_prompt): the checkpoint, CLIP encodes and VAE
+encode appear once and the graph fans out into K KSampler -> VAEDecode ->
+SaveImage branches, the way batch-overnight-workflow.json does by hand.
+split_outputs() maps the packed prompt's outputs back to each variant
+under its original node ids.
+
+ComfyUI keeps every node's output until the prompt finishes, so each packed
+branch holds its latent and decoded image for the whole run.
+max_variants() bounds K so those stay within a memory budget.
+"""
+
+import copy
+
+from comfykit.compiler import OUTPUT_PREFIXES, dedupe_prompt, is_link
+
+# Latent size when the prompt doesn't say (SD1.5 native resolution)
+DEFAULT_SIZE = (512, 512)
+MAX_VARIANTS = 16
+
+
+def _variant_id(node_id, k):
+    return f"{node_id}_v{k}"
+
+
+def pack_prompts(prompts):
+    """Fuse rendered prompts into one.
+
+    Returns (prompt, owners) where `owners` maps each output node of the
+    packed prompt to (variant index, original node id).
+    """
+    if len(prompts) == 1:
+        prompt = prompts[0]
+        return prompt, {nid: (0, nid) for nid, node in prompt.items()
+                        if node['class_type'].startswith(OUTPUT_PREFIXES)}
+
+    combined = {}
+    owners = {}
+    for k, prompt in enumerate(prompts):
+        for node_id, node in prompt.items():
+            inputs = {name: [_variant_id(v[0], k), v[1]] if is_link(v, prompt) else v
+                      for name, v in node['inputs'].items()}
+            new_id = _variant_id(node_id, k)
+            combined[new_id] = {**node, 'inputs': inputs}
+            if node['class_type'].startswith(OUTPUT_PREFIXES):
+                owners[new_id] = (k, node_id)
+
+    packed, _ = dedupe_prompt(combined)
+    return packed, owners
+
+
+def split_outputs(outputs, owners, count):
+    """Per-variant outputs dicts, keyed by the variants' own node ids"""
+    split = [{} for _ in range(count)]
+    for node_id, output in (outputs or {}).items():
+        owner = owners.get(node_id)
+        if owner is not None:
+            k, original = owner
+            split[k][original] = output
+    return split
+
+
+def split_result(result, owners, count):
+    """One PromptResult per variant from the packed prompt's result"""
+    results = []
+    for outputs in split_outputs(result.outputs, owners, count):
+        part = copy.copy(result)
+        part.outputs = outputs
+        results.append(part)
+    return results
+
+
+def latent_size(prompt):
+    """(width, height, batch) of the first EmptyLatentImage, else None"""
+    for node in prompt.values():
+        if node['class_type'] == 'EmptyLatentImage':
+            inputs = node['inputs']
+            return inputs.get('width', 512), inputs.get('height', 512), inputs.get('batch_size', 1)
+    return None
+
+
+def branch_bytes(width, height, batch=1):
+    """Memory a packed branch holds until the prompt ends: its float32
+    latent (4 channels at 1/8 size) and decoded image (3 channels)"""
+    latent = (width // 8) * (height // 8) * 4 * 4
+    image = width * height * 3 * 4
+    return batch * (latent + image)
+
+
+def max_variants(budget_bytes, width=None, height=None, batch=1, limit=MAX_VARIANTS):
+    """How many variants of this size fit in `budget_bytes` (at least 1)"""
+    if width is None or height is None:
+        width, height = DEFAULT_SIZE
+    return max(1, min(limit, int(budget_bytes // branch_bytes(width, height, batch))))
+
@@ -0,0 +1,269 @@
+"""
+Preprocessing of local input photos before they are uploaded.
+
+iPhone photos are 4032x3024 (12 MP) JPEGs or HEICs, stored sideways with
+an EXIF orientation tag. Sent as they are, ComfyUI's LoadImage gets the full
+sensor resolution: several MB per upload, a VAE encode of 12 MP, and on a
+6 GB card an OOM. Each input is instead:
+
+1. decoded in a process pool, JPEGs in draft mode (libjpeg's DCT scaling
+   decodes straight to 1/2, 1/4 or 1/8 size, so a 12 MP photo never exists
+   in memory at full size),
+2. rotated upright from its EXIF orientation (LoadImage does this too, but
+   only after decoding at full size),
+3. scaled so its longest side is at most INPUT_MAX_SIDE, sides a multiple
+   of 8 (the VAE's downscale factor),
+4. written to CACHE_DIR/inputs/ under the SHA-256 of the source file and
+   the settings, so the same photo is only processed once.
+
+HEIC/HEIF photos are read through pillow-heif when it is installed
+(pip install pillow-heif) and are uploaded as JPEG, so the server doesn't
+need a HEIC decoder. Masks drawn for a photo are scaled to the size the
+photo was given, so they still line up; masked() puts one into the photo's
+alpha channel for workflows that read both from one LoadImage (its MASK
+output is 1 - alpha), as run-batch.py --mask does.
+
+    pre = Preprocessor(max_side=768)
+    photo = pre.image("IMG_0076.HEIC")
+    mask = pre.mask("IMG_0076_mask.png", photo.size)
+    upload photo.path and mask.path
+
+    upload pre.masked("IMG_0076.HEIC", "IMG_0076_mask.png").path
+
+    python3 -m comfykit.preprocess [--max-side N] FILE...
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from comfykit.config import CACHE_DIR, INPUT_MAX_SIDE
+from comfykit.uploads import UploadManifest
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+PREPROCESS_DIR = CACHE_DIR / "inputs"
+HEIF_EXTENSIONS = {'.heic', '.heif'}
+JPEG_QUALITY = 95
+# Bump when the output for the same settings changes, to miss old entries
+VERSION = 1
+
+
+class PreprocessError(Exception):
+    pass
+
+
+class Prepared:
+    """A preprocessed input: the file to upload and its dimensions"""
+
+    __slots__ = ('path', 'source', 'size', 'original_size')
+
+    def __init__(self, path, source, size, original_size):
+        self.path = path                    # processed file, in the cache
+        self.source = source                # file it was made from
+        self.size = size                    # (width, height) after processing
+        self.original_size = original_size  # upright (width, height) of the source
+
+    @property
+    def scale(self):
+        return self.size[0] / self.original_size[0]
+
+    def __repr__(self):
+        return f"Prepared({self.source} → {self.path.name}, {self.size[0]}x{self.size[1]})"
+
+
+def target_size(width, height, max_side=INPUT_MAX_SIDE, multiple=8):
+    """Size an image is scaled to: longest side at most max_side (0 = no
+    limit), never enlarged, each side rounded down to a multiple"""
+    scale = min(1.0, max_side / max(width, height)) if max_side else 1.0
+    return (max(multiple, int(width * scale) // multiple * multiple),
+            max(multiple, int(height * scale) // multiple * multiple))
+
+
+def _swaps_axes(image):
+    """Whether the EXIF orientation turns the image by 90 or 270 degrees"""
+    return image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+
+
+def _save(image, dest):
+    tmp = dest.with_name(dest.name + '.tmp')
+    if dest.suffix == '.png':
+        image.save(tmp, format='PNG', compress_level=1)
+    else:
+        image.save(tmp, format='JPEG', quality=JPEG_QUALITY, subsampling=0)
+    os.replace(tmp, dest)
+
+
+def _prepare_image(src, dest_stem, max_side):
+    """Worker: decode, orient and scale one photo; returns (dest, size, original)"""
+    with Image.open(src) as image:
+        width, height = image.size
+        if _swaps_axes(image):
+            width, height = height, width
+        size = target_size(width, height, max_side)
+
+        # Decode at the smallest DCT scale still at least the target size
+        # (in the stored orientation, before the EXIF rotation)
+        stored = (size[1], size[0]) if _swaps_axes(image) else size
+        image.draft('RGB', stored)
+        image = ImageOps.exif_transpose(image)
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    dest = Path(f"{dest_stem}{'.png' if has_alpha else '.jpg'}")
+    _save(image, dest)
+    return dest, size, (width, height)
+
+
+def _prepare_mask(src, dest, size):
+    """Worker: scale a mask to the size of the photo it belongs to"""
+    with Image.open(src) as mask:
+        mask = ImageOps.exif_transpose(mask)
+        if mask.mode not in ('L', 'RGBA'):
+            mask = mask.convert('RGBA' if 'A' in mask.getbands() else 'L')
+        original = mask.size
+        if mask.size != size:
+            mask = mask.resize(size, Image.BILINEAR)
+    _save(mask, dest)
+    return dest, size, original
+
+
+class Preprocessor:
+    """Preprocess local inputs, caching the results by content hash"""
+
+    def __init__(self, max_side=INPUT_MAX_SIDE, cache_dir=PREPROCESS_DIR, workers=None,
+                 manifest=None):
+        self.max_side = max_side
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.manifest = manifest if manifest is not None else UploadManifest()
+        self.processed = 0
+        self.cached = 0
+
+    def _stem(self, path, suffix):
+        digest = self.manifest.digest(path)
+        return self.cache_dir / f"{digest[:16]}-v{VERSION}-{suffix}"
+
+    def _run(self, jobs, cached):
+        """Run (worker, source, *args) jobs in the pool; returns {source: Prepared}"""
+        results = dict(cached)
+        self.cached += len(cached)
+        if not jobs:
+            return results
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if len(jobs) > 1 and self.workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                futures = [(job[1], pool.submit(*job)) for job in jobs]
+                done = [(source, future.result()) for source, future in futures]
+        else:
+            done = [(job[1], job[0](*job[1:])) for job in jobs]
+        for source, (dest, size, original) in done:
+            results[source] = Prepared(dest, source, size, original)
+            self.processed += 1
+        return results
+
+    def images(self, paths):
+        """{path: Prepared} for photos, processing the ones not in the cache"""
+        jobs, cached = [], {}
+        for path in dict.fromkeys(paths):
+            if Path(path).suffix.lower() in HEIF_EXTENSIONS and not HEIF_SUPPORT:
+                raise PreprocessError(f"{path}: reading HEIC needs pillow-heif "
+                                      f"(pip install pillow-heif)")
+            stem = self._stem(path, self.max_side or 'full')
+            hit = next((p for p in (stem.with_suffix('.jpg'), stem.with_suffix('.png'))
+                        if p.exists()), None)
+            if hit is not None:
+                with Image.open(hit) as image:
+                    size = image.size
+                cached[path] = Prepared(hit, path, size, self._original_size(path))
+            else:
+                jobs.append((_prepare_image, path, stem, self.max_side))
+        results = self._run(jobs, cached)
+        self.manifest.save()
+        return results
+
+    def masks(self, sizes):
+        """{path: Prepared} for masks, each scaled to the (width, height)
+        given for it in `sizes`"""
+        jobs, cached = [], {}
+        for path, size in sizes.items():
+            dest = self._stem(path, f"mask{size[0]}x{size[1]}").with_suffix('.png')
+            if dest.exists():
+                cached[path] = Prepared(dest, path, tuple(size), self._original_size(path))
+            else:
+                jobs.append((_prepare_mask, path, dest, tuple(size)))
+        results = self._run(jobs, cached)
+        self.manifest.save()
+        return results
+
+    def image(self, path):
+        return self.images([path])[path]
+
+    def mask(self, path, size):
+        return self.masks({path: size})[path]
+
+    def masked(self, image_path, mask_path):
+        """The processed photo with a mask drawn for it (white = inpaint, or
+        a LoadImage-style alpha mask) scaled to match and stored as its
+        alpha channel, as an RGBA PNG"""
+        photo = self.image(image_path)
+        mask = self.mask(mask_path, photo.size)
+        suffix = f"{self.max_side or 'full'}-{self.manifest.digest(mask_path)[:16]}"
+        dest = self._stem(image_path, suffix).with_suffix('.png')
+        if dest.exists():
+            self.cached += 1
+        else:
+            with Image.open(photo.path) as image, Image.open(mask.path) as drawn:
+                # LoadImage reads the mask as 1 - alpha
+                alpha = drawn.getchannel('A') if drawn.mode == 'RGBA' else ImageOps.invert(drawn)
+                combined = image.convert('RGB')
+                combined.putalpha(alpha)
+            _save(combined, dest)
+            self.processed += 1
+        self.manifest.save()
+        return Prepared(dest, image_path, photo.size, photo.original_size)
+
+    @staticmethod
+    def _original_size(path):
+        """Upright size of a source file, from its header only"""
+        with Image.open(path) as image:
+            width, height = image.size
+            return (height, width) if _swaps_axes(image) else (width, height)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Orient and downscale photos for upload")
+    parser.add_argument("--max-side", type=int, default=INPUT_MAX_SIDE,
+                        help=f"longest side in pixels, 0 to keep it (default: {INPUT_MAX_SIDE})")
+    parser.add_argument("--mask", nargs=2, action="append", default=[], metavar=("MASK", "IMAGE"),
+                        help="also scale MASK to match IMAGE")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    pre = Preprocessor(args.max_side)
+    start = time.perf_counter()
+    try:
+        images = pre.images(args.files + [image for _, image in args.mask])
+        masks = pre.masks({mask: images[image].size for mask, image in args.mask})
+    except PreprocessError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    for prepared in [*images.values(), *masks.values()]:
+        (w, h), (ow, oh) = prepared.size, prepared.original_size
+        print(f"✅ {prepared.source}: {ow}x{oh} → {w}x{h}  {prepared.path}")
+    print(f"\n{pre.processed} processed, {pre.cached} from the cache "
+          f"in {time.perf_counter() - start:.1f}s")
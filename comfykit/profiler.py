@@ -0,0 +1,171 @@
+"""
+Per-node execution times from the /ws event stream.
+
+ComfyUI announces each node with an `executing` event when it starts, and
+the next `executing` event (node None once the prompt is done) marks the
+end of the previous one. NodeProfiler timestamps those events for every
+prompt it sees and aggregates the durations per class_type, so a slow job
+shows whether the time went to checkpoint loading, GroundingDINO, VAE
+encode or sampling. Nodes served from ComfyUI's cache are counted but take
+no time. The time between `execution_start` and the first node is reported
+as "(prompt setup)".
+
+    profiler = NodeProfiler()
+    tracker.add_listener(profiler.on_event)
+    profiler.register(prompt_id, prompt)     # for class_type names
+    ...
+    print(profiler.report())
+    profiler.save("profile.csv")             # or .json, or .folded
+
+The .folded export is the "stack count" format flamegraph.pl and
+speedscope read: workflow;class_type;node with the time in milliseconds.
+"""
+
+import csv
+import json
+import time
+
+SETUP = "(prompt setup)"
+
+
+class NodeTiming:
+    """One node execution of one prompt"""
+
+    __slots__ = ('prompt_id', 'node', 'start', 'end', 'cached')
+
+    def __init__(self, prompt_id, node, start, end=None, cached=False):
+        self.prompt_id = prompt_id
+        self.node = node
+        self.start = start
+        self.end = end
+        self.cached = cached
+
+    @property
+    def seconds(self):
+        return 0.0 if self.end is None else self.end - self.start
+
+
+class NodeProfiler:
+    """Collect node timings from tracker events and aggregate them"""
+
+    def __init__(self, name="workflow"):
+        self.name = name
+        self.timings = []
+        self.class_types = {}  # prompt_id -> {node id: class_type}
+        self._current = {}     # prompt_id -> running NodeTiming
+
+    def register(self, prompt_id, prompt):
+        """Remember a prompt's node types (events only carry node ids)"""
+        self.class_types[prompt_id] = {node_id: node['class_type'] for node_id, node in prompt.items()}
+
+    def on_event(self, event_type, data, timestamp=None):
+        """Tracker listener: call with every websocket event"""
+        if not isinstance(data, dict) or data.get('prompt_id') is None:
+            return
+        prompt_id = data['prompt_id']
+        now = timestamp if timestamp is not None else time.time()
+
+        if event_type == 'execution_start':
+            self._switch(prompt_id, SETUP, now)
+        elif event_type == 'execution_cached':
+            for node in data.get('nodes') or []:
+                self.timings.append(NodeTiming(prompt_id, str(node), now, now, cached=True))
+        elif event_type == 'executing':
+            node = data.get('node')
+            self._switch(prompt_id, None if node is None else str(node), now)
+        elif event_type in ('execution_success', 'execution_error', 'execution_interrupted'):
+            self._switch(prompt_id, None, now)
+
+    def _switch(self, prompt_id, node, now):
+        current = self._current.pop(prompt_id, None)
+        if current is not None:
+            if current.node == node:
+                self._current[prompt_id] = current  # repeated event for the same node
+                return
+            current.end = now
+            self.timings.append(current)
+        if node is not None:
+            self._current[prompt_id] = NodeTiming(prompt_id, node, now)
+
+    def class_type(self, timing):
+        if timing.node == SETUP:
+            return SETUP
+        return self.class_types.get(timing.prompt_id, {}).get(timing.node, f"node {timing.node}")
+
+    def summary(self):
+        """Per class_type totals, slowest first: list of dicts with
+        class_type, runs, cached, total, mean, max and share (of all time)"""
+        groups = {}
+        for timing in self.timings:
+            group = groups.setdefault(self.class_type(timing),
+                                      {'runs': 0, 'cached': 0, 'total': 0.0, 'max': 0.0})
+            if timing.cached:
+                group['cached'] += 1
+                continue
+            group['runs'] += 1
+            group['total'] += timing.seconds
+            group['max'] = max(group['max'], timing.seconds)
+
+        grand = sum(g['total'] for g in groups.values()) or 1.0
+        rows = []
+        for class_type, g in groups.items():
+            rows.append({
+                'class_type': class_type,
+                'runs': g['runs'],
+                'cached': g['cached'],
+                'total': g['total'],
+                'mean': g['total'] / g['runs'] if g['runs'] else 0.0,
+                'max': g['max'],
+                'share': g['total'] / grand,
+            })
+        rows.sort(key=lambda r: r['total'], reverse=True)
+        return rows
+
+    def report(self, width=30):
+        """Text report with one bar per class_type"""
+        rows = self.summary()
+        if not rows:
+            return "   (no node events recorded)"
+        prompts = len({t.prompt_id for t in self.timings})
+        name_width = max(len(r['class_type']) for r in rows)
+        lines = [f"   ⏱️  {sum(r['total'] for r in rows):.1f}s over {prompts} prompt(s)"]
+        for r in rows:
+            bar = "█" * max(1 if r['total'] else 0, round(r['share'] * width))
+            cached = f", {r['cached']} cached" if r['cached'] else ""
+            lines.append(f"   {r['class_type']:<{name_width}} {bar:<{width}} {r['share'] * 100:5.1f}% "
+                         f"{r['total']:8.2f}s  ({r['runs']}× avg {r['mean']:.2f}s{cached})")
+        return "\n".join(lines)
+
+    def folded(self):
+        """Flame graph input: one "workflow;class_type;node ms" line per node"""
+        stacks = {}
+        for timing in self.timings:
+            if timing.cached:
+                continue
+            key = f"{self.name};{self.class_type(timing)}"
+            if timing.node != SETUP:
+                key += f";{timing.node}"
+            stacks[key] = stacks.get(key, 0) + timing.seconds
+        return "\n".join(f"{key} {round(seconds * 1000)}" for key, seconds in stacks.items())
+
+    def save(self, path):
+        """Export by extension: .csv and .json hold the per-class summary
+        plus (JSON only) every timing; .folded is flame graph input"""
+        path = str(path)
+        if path.endswith('.folded'):
+            with open(path, 'w') as f:
+                f.write(self.folded() + "\n")
+        elif path.endswith('.csv'):
+            rows = self.summary()
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=['class_type', 'runs', 'cached', 'total',
+                                                       'mean', 'max', 'share'])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            timings = [{'prompt_id': t.prompt_id, 'node': t.node, 'class_type': self.class_type(t),
+                        'start': t.start, 'seconds': t.seconds, 'cached': t.cached}
+                       for t in self.timings]
+            with open(path, 'w') as f:
+                json.dump({'summary': self.summary(), 'timings': timings}, f, indent=2)
+        return path
@@ -0,0 +1,352 @@
+"""
+Reuse the images of a prompt that has already run.
+
+Queueing the same graph with the same seed and inputs again costs another
+45-60 s of GPU time for a byte-identical image. prompt_key() hashes a
+compiled prompt into a key that only changes when the result can:
+
+- every node is hashed from its class, its widget values and the hashes of
+  the nodes it reads from, so node ids and dict order don't matter, and the
+  key is built from the output nodes, so unused nodes don't either,
+- LoadImage names are replaced by the SHA-256 of the image they load, and
+  model names by the SHA-256 of the local file (comfykit.checksums), so
+  replacing example.png or a checkpoint with another under the same name
+  changes the key,
+- UI-only fields (control_after_generate, the upload button, _meta titles)
+  and SaveImage's filename_prefix are left out.
+
+ResultCache keeps the downloaded images of each key in .comfykit/results/,
+evicting the least recently used past a size limit, and counts hits and
+misses. A hit is copied into the run directory without contacting the
+server:
+
+    key = await prompt_key(client, prompt, images={'example.png': path})
+    paths = cache.restore(key, run_dir)
+    if paths is None:
+        ... run the prompt, download its images ...
+        cache.put(key, paths)
+    cache.save()
+
+    python3 -m comfykit.resultcache [--clear]
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+from comfykit.checksums import ChecksumIndex
+from comfykit.client import ComfyClient, ComfyError
+from comfykit.config import CACHE_DIR, MODELS_DIR
+from comfykit.uploads import UPLOAD_SUBFOLDER, UploadManifest, digest_bytes
+
+RESULT_DIR = CACHE_DIR / "results"
+MAX_BYTES = 2 * 1024 * 1024 * 1024
+META_FILE = "meta.json"
+STATS_FILE = "stats.json"
+
+# Inputs that never reach the server's execution, or only name its files
+UI_ONLY_INPUTS = {'control_after_generate', 'upload'}
+OUTPUT_ONLY_INPUTS = {('SaveImage', 'filename_prefix')}
+
+# Node types whose 'image' input names a file in the server's input folder
+IMAGE_LOADERS = {'LoadImage', 'LoadImageMask'}
+
+# Model-name inputs and the models/ folder their files live in
+MODEL_INPUTS = {
+    'ckpt_name': 'checkpoints',
+    'vae_name': 'vae',
+    'lora_name': 'loras',
+    'control_net_name': 'controlnet',
+    'unet_name': 'unet',
+    'clip_name': 'clip',
+}
+
+# comfykit.uploads names already carry the content hash
+_HASHED_NAME = re.compile(rf"^{UPLOAD_SUBFOLDER}/([0-9a-f]{{16}})\.\w+$")
+
+
+def _sinks(prompt):
+    referenced = {v[0] for node in prompt.values() for v in node['inputs'].values()
+                  if isinstance(v, list)}
+    return [node_id for node_id in prompt if node_id not in referenced]
+
+
+def node_hashes(prompt, identities=None):
+    """{node id: structural hash}, with widget values looked up in
+    `identities` ({(input name, value): identity}) first"""
+    identities = identities or {}
+    hashes = {}
+
+    def visit(node_id):
+        # Iterative post-order walk, so long chains don't hit the recursion limit
+        stack = [node_id]
+        while stack:
+            current = stack[-1]
+            if current in hashes:
+                stack.pop()
+                continue
+            pending = [v[0] for v in prompt[current]['inputs'].values()
+                       if isinstance(v, list) and v[0] not in hashes]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            node = prompt[current]
+            inputs = {}
+            for name, value in node['inputs'].items():
+                if name in UI_ONLY_INPUTS or (node['class_type'], name) in OUTPUT_ONLY_INPUTS:
+                    continue
+                if isinstance(value, list):
+                    inputs[name] = ['link', hashes[value[0]], value[1]]
+                elif isinstance(value, str):
+                    inputs[name] = identities.get((name, value), value)
+                else:
+                    # Identities are of file names; dict widget values aren't hashable
+                    inputs[name] = value
+            blob = json.dumps([node['class_type'], inputs], sort_keys=True, separators=(',', ':'))
+            hashes[current] = hashlib.sha256(blob.encode()).hexdigest()
+
+    for node_id in prompt:
+        visit(node_id)
+    return hashes
+
+
+def prompt_hash(prompt, identities=None):
+    """Canonical hash of a compiled prompt: its output nodes' structural
+    hashes, sorted"""
+    hashes = node_hashes(prompt, identities)
+    blob = json.dumps(sorted(hashes[node_id] for node_id in _sinks(prompt)))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _image_names(prompt):
+    return {node['inputs']['image'] for node in prompt.values()
+            if node['class_type'] in IMAGE_LOADERS and isinstance(node['inputs'].get('image'), str)}
+
+
+async def _image_identity(client, name, images, manifest):
+    match = _HASHED_NAME.match(name)
+    if match:
+        return f"sha256:{match.group(1)}"
+    if images and name in images:
+        return f"sha256:{manifest.digest(images[name])[:16]}"
+    subfolder, _, filename = name.rpartition('/')
+    try:
+        data = await client.view(filename, subfolder, 'input')
+    except ComfyError as e:
+        if e.status == 404:
+            return None
+        raise
+    return f"sha256:{digest_bytes(data)[:16]}"
+
+
+def model_identities(prompt, models_dir=MODELS_DIR, index=None):
+    """{(input name, model name): sha256} for model files present under
+    models_dir; models only the server has keep their name"""
+    models_dir = Path(models_dir)
+    wanted = {}
+    for node in prompt.values():
+        for name, value in node['inputs'].items():
+            if name in MODEL_INPUTS and isinstance(value, str):
+                path = models_dir / MODEL_INPUTS[name] / value
+                if path.is_file():
+                    wanted[(name, value)] = path
+    if not wanted:
+        return {}
+    index = index if index is not None else ChecksumIndex()
+    digests = index.digests(list(wanted.values()))
+    index.save()
+    return {item: f"sha256:{digests[path]}" for item, path in wanted.items() if path in digests}
+
+
+async def prompt_keys(client, prompts, images=None, manifest=None, index=None,
+                      models_dir=MODELS_DIR):
+    """Result cache keys of several prompts, hashing each input image and
+    model file once.
+
+    `images` maps LoadImage names to local files, so their hash comes from
+    the upload manifest; other input images are fetched from the server
+    once to hash them. A prompt whose input image can't be found gets the
+    key None: it can't be cached.
+    """
+    manifest = manifest if manifest is not None else UploadManifest()
+    merged = {f"{i}:{node_id}": node for i, prompt in enumerate(prompts)
+              for node_id, node in prompt.items()}
+    identities = model_identities(merged, models_dir, index)
+    for name in sorted(set().union(*map(_image_names, prompts))):
+        identities[('image', name)] = await _image_identity(client, name, images, manifest)
+    manifest.save()
+    return [None if any(identities[('image', name)] is None for name in _image_names(prompt))
+            else prompt_hash(prompt, identities) for prompt in prompts]
+
+
+async def prompt_key(client, prompt, images=None, manifest=None, index=None,
+                     models_dir=MODELS_DIR):
+    """Result cache key of one prompt, or None (see prompt_keys)"""
+    keys = await prompt_keys(client, [prompt], images, manifest, index, models_dir)
+    return keys[0]
+
+
+def result_key(prompt, url, images=None):
+    """Blocking helper for scripts"""
+    async def _key():
+        async with ComfyClient(url) as client:
+            return await prompt_key(client, prompt, images)
+    return asyncio.run(_key())
+
+
+class ResultCache:
+    """Output images per prompt key, evicted least-recently-used by total
+    size. Recency is the mtime of each entry's meta.json, refreshed on
+    every hit."""
+
+    def __init__(self, path=RESULT_DIR, max_bytes=MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._saved = (0, 0)
+
+    def entry_dir(self, key):
+        return self.path / key[:32]
+
+    def get(self, key):
+        """Stored image paths for a key, or None"""
+        entry = self.entry_dir(key)
+        try:
+            with open(entry / META_FILE, 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        paths = [entry / name for name in meta['files']]
+        if not all(path.exists() for path in paths):
+            self.misses += 1
+            return None
+        os.utime(entry / META_FILE)
+        self.hits += 1
+        return paths
+
+    def restore(self, key, run_dir):
+        """Copy a key's images into run_dir; returns their paths or None"""
+        stored = self.get(key)
+        if stored is None:
+            return None
+        run_dir = Path(run_dir)
+        run_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for path in stored:
+            dest = run_dir / path.name
+            shutil.copyfile(path, dest)
+            paths.append(dest)
+        return paths
+
+    def put(self, key, paths, outputs=None):
+        """Store a prompt's downloaded images under its key"""
+        if not paths:
+            return
+        entry = self.entry_dir(key)
+        tmp = entry.with_name(entry.name + '.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for path in paths:
+            shutil.copyfile(path, tmp / Path(path).name)
+        with open(tmp / META_FILE, 'w') as f:
+            json.dump({'key': key, 'files': [Path(p).name for p in paths],
+                       'outputs': outputs or {}, 'created': time.time()}, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        self.evict(keep=entry)
+
+    def _entries(self):
+        """(last used, bytes, dir) of every entry"""
+        entries = []
+        if not self.path.is_dir():
+            return entries
+        for entry in os.scandir(self.path):
+            if not entry.is_dir() or entry.name.endswith('.tmp'):
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, META_FILE)).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((used, size, entry.path))
+        return entries
+
+    def evict(self, keep=None):
+        """Delete the least recently used entries until the cache fits"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and os.path.samefile(path, keep):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _lifetime(self):
+        try:
+            with open(self.path / STATS_FILE, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'hits': 0, 'misses': 0}
+
+    def save(self):
+        """Add this session's hits and misses to the lifetime counts"""
+        new_hits, new_misses = self.hits - self._saved[0], self.misses - self._saved[1]
+        if not new_hits and not new_misses:
+            return
+        stats = self._lifetime()
+        stats['hits'] += new_hits
+        stats['misses'] += new_misses
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / (STATS_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp, self.path / STATS_FILE)
+        self._saved = (self.hits, self.misses)
+
+    def stats(self):
+        """Entries, bytes and hit/miss counts (this session and lifetime)"""
+        entries = self._entries()
+        lifetime = self._lifetime()
+        unsaved_hits, unsaved_misses = self.hits - self._saved[0], self.misses - self._saved[1]
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'lifetime_hits': lifetime['hits'] + unsaved_hits,
+            'lifetime_misses': lifetime['misses'] + unsaved_misses,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or clear the local result cache")
+    parser.add_argument("--clear", action="store_true", help="delete every cached result")
+    args = parser.parse_args()
+
+    cache = ResultCache()
+    if args.clear:
+        cache.clear()
+        print(f"🗑️  Cleared {cache.path}")
+    else:
+        stats = cache.stats()
+        lookups = stats['lifetime_hits'] + stats['lifetime_misses']
+        rate = f" ({stats['lifetime_hits'] / lookups:.0%})" if lookups else ""
+        print(f"📦 {stats['entries']} result(s), {stats['bytes'] / 1024 / 1024:.1f} MB "
+              f"of {stats['max_bytes'] / 1024 / 1024:.0f} MB in {cache.path}")
+        print(f"   {stats['lifetime_hits']} hit(s), {stats['lifetime_misses']} miss(es){rate}")
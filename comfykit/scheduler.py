@@ -0,0 +1,367 @@
+"""
+Spread prompts over several ComfyUI servers.
+
+Each prompt goes to the least-loaded live host: the one with the shortest
+queue (its /queue depth, plus what we've sent since the last refresh),
+ties broken by free VRAM from /system_stats. Hosts that already have the
+prompt's models loaded are preferred, so checkpoints aren't swapped back
+and forth. A host that stops answering is marked down and every prompt it
+was holding is resubmitted elsewhere.
+
+    async with Scheduler([url1, url2]) as scheduler:
+        result = await scheduler.run(prompt)
+        print(scheduler.report())
+
+For batches, drain() pulls jobs from an AffinityQueue: whenever a host has
+room it takes the next job using the models it has resident.
+
+Run `python3 -m comfykit.scheduler` to try the policy against fake servers
+of different speeds, no GPU needed.
+"""
+
+import asyncio
+import functools
+import time
+
+from comfykit.affinity import model_set
+from comfykit.client import ComfyClient, ComfyError
+
+
+class NoHostAvailable(ComfyError):
+    """Every host is down"""
+
+
+class HostDown(ComfyError):
+    """The host running a prompt stopped responding"""
+
+
+class Host:
+    """One server in the pool and what we know about it"""
+
+    def __init__(self, url, depth=2):
+        self.url = url.rstrip('/')
+        self.depth = depth
+        self.client = ComfyClient(self.url)
+        self.alive = True
+        self.failures = 0
+        self.queue_depth = 0
+        self.vram_free = 0
+        self.vram_total = 0
+        self.in_flight = set()
+        self.down = asyncio.Event()
+        self.resident = None  # model set of the last prompt sent here
+        self.model_switches = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.first_submit = None
+        self.last_finish = None
+
+    @property
+    def load(self):
+        """Sort key: fewer queued prompts first, then more free VRAM"""
+        return (max(self.queue_depth, len(self.in_flight)), -self.vram_free)
+
+    @property
+    def has_room(self):
+        return self.alive and len(self.in_flight) < self.depth
+
+    async def refresh(self):
+        queue, stats = await asyncio.gather(self.client.queue(), self.client.system_stats())
+        self.queue_depth = len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+        devices = stats.get('devices') or [{}]
+        self.vram_free = sum(d.get('vram_free', 0) for d in devices)
+        self.vram_total = sum(d.get('vram_total', 0) for d in devices)
+
+    def load_models(self, models):
+        """Record that prompts with `models` were sent to this host"""
+        if models != self.resident:
+            if self.resident is not None:
+                self.model_switches += 1
+            self.resident = models
+
+    def mark_down(self):
+        self.alive = False
+        self.down.set()
+
+    def mark_up(self):
+        self.alive = True
+        self.failures = 0
+        self.down = asyncio.Event()
+
+    def stats(self):
+        span = (self.last_finish or time.time()) - (self.first_submit or time.time())
+        per_hour = self.completed * 3600 / span if span > 0 else 0.0
+        return {
+            'url': self.url,
+            'alive': self.alive,
+            'completed': self.completed,
+            'failed': self.failed,
+            'model_switches': self.model_switches,
+            'prompts_per_hour': per_hour,
+            'avg_seconds': self.busy_time / self.completed if self.completed else None,
+        }
+
+
+class Scheduler:
+    """Least-loaded placement of prompts over a pool of ComfyUI servers"""
+
+    def __init__(self, urls, per_host_depth=2, refresh_interval=2.0,
+                 failures_before_down=2, max_attempts=3):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.hosts = [Host(url, per_host_depth) for url in urls]
+        self.refresh_interval = refresh_interval
+        self.failures_before_down = failures_before_down
+        self.max_attempts = max_attempts
+        self._changed = asyncio.Condition()
+        self._monitor = None
+
+    @property
+    def capacity(self):
+        """How many prompts the pool runs at once"""
+        return sum(host.depth for host in self.hosts)
+
+    async def __aenter__(self):
+        for host in self.hosts:
+            await host.client.open()
+        await self.refresh()
+        self._monitor = asyncio.ensure_future(self._watch())
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+        for host in self.hosts:
+            await host.client.close()
+
+    def client_for(self, url):
+        """The ComfyClient of the host with this url"""
+        for host in self.hosts:
+            if host.url == url:
+                return host.client
+        raise KeyError(url)
+
+    async def refresh(self):
+        """Update every host's queue depth and VRAM, marking dead hosts down"""
+        results = await asyncio.gather(*(host.refresh() for host in self.hosts),
+                                       return_exceptions=True)
+        for host, result in zip(self.hosts, results):
+            if isinstance(result, Exception):
+                host.failures += 1
+                if host.alive and host.failures >= self.failures_before_down:
+                    host.mark_down()
+            elif not host.alive:
+                host.mark_up()
+            else:
+                host.failures = 0
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def pick_host(self, hosts=None, models=None):
+        """The live host with room that has `models` resident, else the
+        least-loaded one; None if every host is full"""
+        candidates = [h for h in (hosts or self.hosts) if h.has_room]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda h: (h.resident != models, h.load))
+
+    async def acquire(self, token, hosts=None, models=None):
+        """Wait for a host with room and reserve a slot on it for `token`"""
+        async with self._changed:
+            while True:
+                if not any(h.alive for h in self.hosts):
+                    raise NoHostAvailable("All ComfyUI hosts are down")
+                host = self.pick_host(hosts, models)
+                if host is not None:
+                    host.in_flight.add(token)
+                    return host
+                await self._changed.wait()
+
+    async def release(self, host, token):
+        host.in_flight.discard(token)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def run_on(self, host, prompt, token, on_submit=None):
+        """Submit to a host reserved with acquire() and wait, raising HostDown
+        if it dies meanwhile. `on_submit(host, prompt_id)` is called once the
+        server has accepted the prompt."""
+        host.load_models(model_set(prompt))
+        host.queue_depth += 1
+        started = time.time()
+        if host.first_submit is None:
+            host.first_submit = started
+        try:
+            prompt_id = await host.client.submit(prompt)
+            if on_submit is not None:
+                on_submit(host, prompt_id)
+            waiter = asyncio.ensure_future(host.client.wait(prompt_id))
+            down = asyncio.ensure_future(host.down.wait())
+            done, _ = await asyncio.wait({waiter, down}, return_when=asyncio.FIRST_COMPLETED)
+            down.cancel()
+            if waiter not in done:
+                waiter.cancel()
+                raise HostDown(f"{host.url} went down while running {prompt_id}")
+            result = waiter.result()
+        except ComfyError:
+            host.failed += 1
+            raise
+        finally:
+            host.queue_depth = max(0, host.queue_depth - 1)
+            await self.release(host, token)
+
+        host.completed += 1
+        host.busy_time += time.time() - started
+        host.last_finish = time.time()
+        result.host = host.url
+        return result
+
+    async def run(self, prompt, hosts=None):
+        """Run a prompt on the best host, moving it if that host dies"""
+        last_error = None
+        models = model_set(prompt)
+        for _ in range(self.max_attempts):
+            token = object()
+            host = await self.acquire(token, hosts, models)
+            try:
+                return await self.run_on(host, prompt, token)
+            except HostDown as e:
+                last_error = e
+            except ComfyError as e:
+                if getattr(e, 'status', None) is not None:
+                    raise  # the server answered: resubmitting won't help
+                last_error = e
+                host.failures += 1
+                if host.failures >= self.failures_before_down:
+                    host.mark_down()
+        raise last_error
+
+    async def drain(self, queue, prompt_of, on_done, on_submit=None):
+        """Run every item of an AffinityQueue (keyed by model set).
+
+        Each host slot pulls the next item matching the host's resident
+        models. `prompt_of(item)` gives the prompt to submit and
+        `on_done(item, result, error)` is called as each item finishes, and
+        `on_submit(item, host, prompt_id)` as the server accepts it. Items
+        whose host dies go back to the front of the queue.
+        """
+        in_flight = 0
+        attempts = {}
+
+        async def slot(host):
+            nonlocal in_flight
+            while True:
+                if not host.alive:
+                    if not any(h.alive for h in self.hosts):
+                        return
+                    async with self._changed:
+                        await self._changed.wait()
+                    continue
+
+                popped = queue.pop(host.resident)
+                if popped is None:
+                    if in_flight == 0:
+                        return
+                    async with self._changed:
+                        await self._changed.wait()
+                    continue
+
+                item, key = popped
+                token = object()
+                host.in_flight.add(token)
+                in_flight += 1
+                try:
+                    submitted = functools.partial(on_submit, item) if on_submit else None
+                    result = await self.run_on(host, prompt_of(item), token, submitted)
+                except ComfyError as e:
+                    # Same retry rule as run(): only host failures move a job
+                    lost = isinstance(e, HostDown) or e.status is None
+                    if lost and not isinstance(e, HostDown):
+                        host.failures += 1
+                        if host.failures >= self.failures_before_down:
+                            host.mark_down()
+                    tries = attempts[id(item)] = attempts.get(id(item), 0) + 1
+                    if lost and tries < self.max_attempts:
+                        queue.push_front(item, key)
+                    else:
+                        on_done(item, None, e)
+                else:
+                    on_done(item, result, None)
+                finally:
+                    in_flight -= 1
+                    async with self._changed:
+                        self._changed.notify_all()
+
+        await asyncio.gather(*(slot(host) for host in self.hosts for _ in range(host.depth)))
+
+        while True:
+            popped = queue.pop()
+            if popped is None:
+                break
+            on_done(popped[0], None, NoHostAvailable("All ComfyUI hosts are down"))
+
+    def report(self):
+        return [host.stats() for host in self.hosts]
+
+
+def format_report(report):
+    lines = []
+    for stats in report:
+        state = "up" if stats['alive'] else "DOWN"
+        avg = f"{stats['avg_seconds']:.1f}s" if stats['avg_seconds'] is not None else "-"
+        lines.append(f"   {stats['url']:<28} {state:<5} {stats['completed']:>5} done "
+                     f"{stats['failed']:>3} failed  {stats['prompts_per_hour']:>8.0f}/h  avg {avg}  "
+                     f"{stats['model_switches']} model switches")
+    return "\n".join(lines)
+
+
+async def _simulate(exec_times, jobs, kill_after):
+    from comfykit.fakeserver import FakeComfyServer
+    from comfykit.template import load_template
+
+    template = load_template("img2img-workflow.json")
+    servers = [FakeComfyServer(exec_time=t) for t in exec_times]
+    for server in servers:
+        await server.start()
+
+    async def kill_later():
+        await asyncio.sleep(kill_after)
+        print(f"💥 Stopping {servers[0].url}")
+        await servers[0].stop()
+
+    try:
+        async with Scheduler([s.url for s in servers], refresh_interval=0.2) as scheduler:
+            killer = asyncio.ensure_future(kill_later()) if kill_after else None
+            results = await asyncio.gather(*(scheduler.run(template.render(seed=i))
+                                             for i in range(jobs)))
+            if killer:
+                killer.cancel()
+            print(f"✅ {sum(r.ok for r in results)}/{jobs} prompts finished")
+            print(format_report(scheduler.report()))
+    finally:
+        for server in servers[1 if kill_after else 0:]:
+            await server.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Try the scheduling policy on fake servers")
+    parser.add_argument("--exec-times", type=float, nargs="+", default=[0.05, 0.1, 0.2],
+                        help="seconds per prompt for each fake server")
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--kill-after", type=float, default=0,
+                        help="stop the first server after this many seconds")
+    args = parser.parse_args()
+    asyncio.run(_simulate(args.exec_times, args.jobs, args.kill_after))
@@ -0,0 +1,206 @@
+"""
+Widget names for every node type, taken from the node definitions the
+server publishes at /object_info.
+
+The full /object_info response is several megabytes, so only the part the
+compiler needs (widget names in widgets_values order) is kept, in one small
+JSON file per server version under CACHE_DIR. Loading is lazy: nothing is
+read or fetched until a node type is looked up, and the server is only
+contacted when a type is missing from the cache.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+import requests
+
+from comfykit.config import CACHE_DIR
+
+# Input types the web interface renders as widgets rather than sockets
+WIDGET_TYPES = {'INT', 'FLOAT', 'STRING', 'BOOLEAN', 'COMBO'}
+
+# INT inputs the web interface follows with a control_after_generate widget
+# on servers that don't flag it in /object_info yet
+SEED_INPUTS = {'seed', 'noise_seed'}
+
+# Fallback for the node types used by the bundled workflows, so they still
+# compile on a machine that has never talked to the server.
+# None marks a UI-only widget (control_after_generate, upload button).
+BUILTIN_WIDGET_NAMES = {
+    'CheckpointLoaderSimple': ['ckpt_name'],
+    'CLIPTextEncode': ['text'],
+    'LoadImage': ['image', None],
+    'SaveImage': ['filename_prefix'],
+    'PreviewImage': [],
+    'VAEEncode': [],
+    'VAEDecode': [],
+    'KSampler': ['seed', None, 'steps', 'cfg', 'sampler_name', 'scheduler', 'denoise'],
+    'VAEEncodeForInpaint': ['grow_mask_by'],
+    'GroundingDinoModelLoader (segment anything)': ['model_name'],
+    'SAMModelLoader (segment anything)': ['model_name', 'device_mode'],
+    'GroundingDinoSAMSegment (segment anything)': ['prompt', 'threshold'],
+}
+
+
+def widget_names_for(node_info):
+    """Return widget names in widgets_values order for one /object_info entry"""
+    inputs = node_info.get('input', {})
+    order = node_info.get('input_order', {})
+    names = []
+
+    for section in ('required', 'optional'):
+        specs = inputs.get(section) or {}
+        for name in order.get(section) or specs.keys():
+            spec = specs.get(name)
+            if not spec:
+                continue
+            input_type = spec[0]
+            options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+
+            if not (isinstance(input_type, list) or input_type in WIDGET_TYPES):
+                continue
+            if options.get('forceInput'):
+                continue
+
+            names.append(name)
+            if options.get('control_after_generate') or (
+                    input_type == 'INT' and name in SEED_INPUTS):
+                names.append(None)
+            if options.get('image_upload'):
+                names.append(None)
+
+    return names
+
+
+def compact_object_info(object_info):
+    """Reduce a full /object_info response to {node_type: widget names}"""
+    return {
+        node_type: widget_names_for(info)
+        for node_type, info in object_info.items()
+    }
+
+
+def _cache_path(cache_dir, version):
+    safe = "".join(c if c.isalnum() or c in '.-_' else '_' for c in version)
+    return cache_dir / f"object_info-{safe}.json"
+
+
+class NodeSchema:
+    """Lazy, cached widget-name lookup usable wherever the compiler takes
+    a widget_names mapping.
+
+    Without a url the schema only uses the on-disk cache (newest version
+    present) and BUILTIN_WIDGET_NAMES. With a url, a node type missing from
+    both triggers one sync() against the server.
+    """
+
+    def __init__(self, url=None, cache_dir=CACHE_DIR, version=None, timeout=10):
+        self.url = url.rstrip('/') if url else None
+        self.cache_dir = cache_dir
+        self.version = version
+        self.timeout = timeout
+        self._widgets = None
+        self._synced = False
+
+    def _load_cached(self):
+        if self.version is not None:
+            path = _cache_path(self.cache_dir, self.version)
+            paths = [path] if path.exists() else []
+        elif self.cache_dir.exists():
+            paths = sorted(self.cache_dir.glob("object_info-*.json"),
+                           key=os.path.getmtime, reverse=True)
+        else:
+            paths = []
+
+        if not paths:
+            return {}
+        with open(paths[0], 'r') as f:
+            data = json.load(f)
+        self.version = data.get('version', self.version)
+        return data.get('widgets', {})
+
+    @property
+    def widgets(self):
+        if self._widgets is None:
+            self._widgets = self._load_cached()
+        return self._widgets
+
+    def server_version(self):
+        """Ask the server which ComfyUI version it runs"""
+        response = requests.get(f"{self.url}/system_stats", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['system']['comfyui_version']
+
+    def sync(self, force=False):
+        """Make sure the cache holds the server's current node definitions.
+
+        Only fetches /object_info when no cache file exists for the server's
+        version (or force is set). Returns the version in use.
+        """
+        if self.url is None:
+            raise ValueError("NodeSchema.sync() needs a server url")
+
+        version = self.server_version()
+        path = _cache_path(self.cache_dir, version)
+
+        if path.exists() and not force:
+            self.version = version
+            self._widgets = None
+            self._synced = True
+            return version
+
+        response = requests.get(f"{self.url}/object_info", timeout=self.timeout)
+        response.raise_for_status()
+        widgets = compact_object_info(response.json())
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': version, 'widgets': widgets}, f,
+                      separators=(',', ':'))
+        os.replace(tmp, path)
+
+        self.version = version
+        self._widgets = widgets
+        self._synced = True
+        return version
+
+    def get(self, node_type, default=None):
+        names = self.widgets.get(node_type)
+        if names is None:
+            names = BUILTIN_WIDGET_NAMES.get(node_type)
+        if names is None and self.url and not self._synced:
+            self.sync()
+            names = self.widgets.get(node_type)
+        return default if names is None else names
+
+    def __getitem__(self, node_type):
+        names = self.get(node_type)
+        if names is None:
+            raise KeyError(node_type)
+        return names
+
+    def __contains__(self, node_type):
+        return self.get(node_type) is not None
+
+
+@lru_cache(maxsize=None)
+def default_schema():
+    """Offline schema shared by compile_workflow() calls that don't pass one"""
+    return NodeSchema()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from comfykit.config import COMFY_URL
+
+    parser = argparse.ArgumentParser(description="Refresh the cached node schema from a ComfyUI server")
+    parser.add_argument("--url", default=COMFY_URL)
+    parser.add_argument("--force", action="store_true", help="refetch even if this version is cached")
+    args = parser.parse_args()
+
+    schema = NodeSchema(args.url)
+    version = schema.sync(force=args.force)
+    print(f"✅ Cached widget names for {len(schema.widgets)} node types (ComfyUI {version})")
@@ -0,0 +1,300 @@
+"""
+Successive-halving search over a batch grid.
+
+A sweep of seeds × denoise at 30-40 steps spends most of its GPU time on
+images nobody keeps. successive_halving() instead runs every candidate as
+a cheap preview first: the same seed and settings at a few sampler steps
+(and, optionally, a downscaled input). It scores the previews and reruns only
+the best `keep` fraction at the next rung, up to the full settings:
+
+    rung 0   120 candidates ×  8 steps
+    rung 1    30 candidates × 30 steps     (keep=0.25)
+
+That is 1,860 sampler steps instead of 3,600 for the full sweep. With a
+second preview rung, or keep=0.1, the search costs several times less.
+Low-step previews with the same seed keep the composition of the final
+image, so the ranking mostly survives promotion.
+
+A scorer is a function (image, source) -> float, higher is better. Both are
+float32 HxWx3 arrays in [0, 1], with the source (the input photo, if known)
+resized to the image. Built in:
+
+    similarity   structural similarity (SSIM) to the source photo
+    sharpness    variance of the Laplacian (penalises blurry, washed-out
+                 results; needs no source)
+
+or "module:function" for your own (see load_scorer).
+
+Scores are only compared between candidates that differ in seed alone:
+each group of equal other parameters promotes its own best `keep`
+fraction. Similarity to the photo falls as denoise rises, so one ranking
+across denoise levels would promote the lowest denoise and nothing else
+(default_scorer() picks sharpness for such grids). A grid without
+repeated settings (one seed) is ranked as a whole.
+
+    result = await successive_halving(template, grid, urls, run_dir,
+                                      preview_steps=[8], keep=0.25,
+                                      scorer=similarity, source=photo)
+    for score, params, files in result.ranking[:5]:
+        print(score, params, files)
+"""
+
+import importlib
+import json
+import logging
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from comfykit.batch import BatchRunner
+
+PREVIEW_NODE = "comfykit_preview_scale"
+DEFAULT_KEEP = 0.25
+SSIM_WINDOW = 7
+
+log = logging.getLogger(__name__)
+
+
+def _box(a, size):
+    """Mean over size x size windows (valid region), from an integral image"""
+    c = np.pad(a, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    return (c[size:, size:] - c[:-size, size:] - c[size:, :-size] + c[:-size, :-size]) / (size * size)
+
+
+def _luma(image):
+    return image[..., 0] * 0.299 + image[..., 1] * 0.587 + image[..., 2] * 0.114
+
+
+def similarity(image, source):
+    """Mean SSIM of the luma channel against the source (box windows)"""
+    if source is None:
+        raise ValueError("the similarity scorer needs the source image")
+    x, y = _luma(image).astype(np.float64), _luma(source).astype(np.float64)
+    c1, c2 = 0.01 ** 2, 0.03 ** 2
+    mx, my = _box(x, SSIM_WINDOW), _box(y, SSIM_WINDOW)
+    vx = _box(x * x, SSIM_WINDOW) - mx * mx
+    vy = _box(y * y, SSIM_WINDOW) - my * my
+    cov = _box(x * y, SSIM_WINDOW) - mx * my
+    ssim = ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(ssim.mean())
+
+
+def sharpness(image, source=None):
+    """Variance of the 4-neighbour Laplacian of the luma channel"""
+    y = _luma(image)
+    lap = (y[1:-1, :-2] + y[1:-1, 2:] + y[:-2, 1:-1] + y[2:, 1:-1]) - 4 * y[1:-1, 1:-1]
+    return float(lap.var())
+
+
+SCORERS = {'similarity': similarity, 'sharpness': sharpness}
+
+
+def default_scorer(grid):
+    """Name of the scorer to use on `grid` if none is given: similarity,
+    or sharpness when the grid varies denoise (similarity to the photo
+    would just favour the lowest)"""
+    denoise = {params['denoise'] for params in grid if 'denoise' in params}
+    return 'sharpness' if len(denoise) > 1 else 'similarity'
+
+
+def load_scorer(spec):
+    """A scorer by built-in name or as "module:function" """
+    if spec in SCORERS:
+        return SCORERS[spec]
+    module, sep, name = spec.partition(':')
+    if not sep:
+        raise ValueError(f"Unknown scorer {spec!r} (built in: {', '.join(SCORERS)}, "
+                         f"or module:function)")
+    return getattr(importlib.import_module(module), name)
+
+
+def as_array(image, size=None):
+    """float32 HxWx3 in [0, 1] from a PIL image, optionally resized"""
+    image = image.convert('RGB')
+    if size is not None and image.size != size:
+        image = image.resize(size, Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def score_files(paths, scorer, source=None):
+    """Mean score of a job's images, or None if it has none or one of
+    them can't be read (a job that isn't scored isn't promoted)"""
+    scores = []
+    for path in paths:
+        try:
+            with Image.open(path) as image:
+                array = as_array(image)
+        except (OSError, ValueError) as e:
+            log.warning("Can't score %s: %s", path, e)
+            return None
+        reference = None if source is None else as_array(source, (array.shape[1], array.shape[0]))
+        scores.append(scorer(array, reference))
+    return sum(scores) / len(scores) if scores else None
+
+
+def scaled_input(template, scale):
+    """The template with its input image scaled by `scale` (ImageScaleBy
+    after LoadImage), or None where that would break the graph: no
+    LoadImage, or one whose MASK output is used (the mask would no longer
+    match)"""
+    prompt = template.prompt
+    loaders = [n for n, node in prompt.items() if node['class_type'] == 'LoadImage']
+    if len(loaders) != 1:
+        return None
+    loader = loaders[0]
+    links = [v for node in prompt.values() for v in node['inputs'].values()
+             if isinstance(v, list) and v[0] == loader]
+    if any(v[1] != 0 for v in links):
+        return None
+    scaled = {}
+    for node_id, node in prompt.items():
+        inputs = {k: ([PREVIEW_NODE, 0] if isinstance(v, list) and v == [loader, 0] else v)
+                  for k, v in node['inputs'].items()}
+        scaled[node_id] = {**node, 'inputs': inputs}
+    scaled[PREVIEW_NODE] = {'inputs': {'image': [loader, 0], 'upscale_method': 'area',
+                                       'scale_by': scale}, 'class_type': 'ImageScaleBy'}
+    return template.with_prompt(scaled)
+
+
+def _setting(params):
+    """Everything but the seed, as a hashable key"""
+    return tuple(sorted((name, repr(value)) for name, value in params.items() if name != 'seed'))
+
+
+def promote(candidates, scores, keep):
+    """The candidates that go on to the next rung: the best `keep`
+    fraction (at least one) of each group sharing all parameters but the
+    seed, in grid order. Unscored (None) candidates never go on."""
+    groups = {}
+    for i, params in enumerate(candidates):
+        groups.setdefault(_setting(params), []).append(i)
+    if all(len(group) == 1 for group in groups.values()):
+        groups = {None: list(range(len(candidates)))}  # nothing to compare within
+
+    promoted = []
+    for group in groups.values():
+        ranked = sorted((i for i in group if scores[i] is not None),
+                        key=lambda i: scores[i], reverse=True)
+        promoted += ranked[:max(1, math.ceil(len(group) * keep))]
+    return [candidates[i] for i in sorted(promoted)]
+
+
+def preview_schedule(full_steps, preview_steps=None):
+    """Sampler steps of each preview rung: the given ones below full_steps,
+    or a quarter of full_steps (at least 4)"""
+    if preview_steps is None:
+        preview_steps = [max(4, full_steps // 4)]
+    return sorted({int(s) for s in preview_steps if 0 < int(s) < full_steps})
+
+
+class Rung:
+    """One round of the search: who ran, at what cost, how they scored"""
+
+    def __init__(self, index, steps, scale, jobs, scores, cost, elapsed):
+        self.index = index
+        self.steps = steps      # preview steps, or None for the full settings
+        self.scale = scale      # input scale, or None
+        self.jobs = jobs
+        self.scores = scores    # aligned with jobs; None for failed jobs
+        self.cost = cost        # sampler step-equivalents, see _cost()
+        self.elapsed = elapsed
+
+
+class SearchResult:
+    def __init__(self, rungs, ranking, full_cost):
+        self.rungs = rungs
+        self.ranking = ranking  # [(score, params, files)] best first
+        self.full_cost = full_cost
+
+    @property
+    def cost(self):
+        """Sampler step-equivalents the search spent (steps × denoise ×
+        input area)"""
+        return sum(rung.cost for rung in self.rungs)
+
+    @property
+    def savings(self):
+        return self.full_cost / self.cost if self.cost else 0.0
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'rungs': [{'steps': r.steps, 'scale': r.scale, 'candidates': len(r.jobs),
+                           'cost': r.cost, 'elapsed': r.elapsed} for r in self.rungs],
+                'cost': self.cost,
+                'full_cost': self.full_cost,
+                'ranking': [{'score': score, 'params': params, 'files': [str(f) for f in files]}
+                            for score, params, files in self.ranking],
+            }, f, indent=2)
+
+
+def _cost(template, params, steps, scale):
+    """GPU work of one job relative to a sampler step: the sampler runs
+    steps × denoise steps, each costing about the input's area"""
+    denoise = params.get('denoise', template.get('denoise') if 'denoise' in template.slots else 1.0)
+    return steps * (denoise or 1.0) * (scale or 1.0) ** 2
+
+
+async def successive_halving(template, grid, urls, run_dir, preview_steps=None, keep=DEFAULT_KEEP,
+                             scorer=similarity, source=None, preview_scale=None, depth=2,
+                             prefix="search", pack=1, result_cache=None, images=None,
+                             on_rung=None, on_progress=None):
+    """Run `grid` as cheap previews, promoting the best `keep` fraction of
+    each rung to the next (per setting, see promote()), and the survivors
+    of the last preview rung to the full settings. Returns a SearchResult
+    ranked by the final scores.
+
+    `source` is a PIL image handed to the scorer. Images land in
+    run_dir/rung<N>/; `on_rung(rung)` is called as each rung is scored.
+    """
+    run_dir = Path(run_dir)
+    has_steps = 'steps' in template.slots
+
+    def steps_of(params):
+        return params.get('steps', template.get('steps') if has_steps else None)
+
+    steps_known = has_steps and all(steps_of(p) for p in grid)
+    schedule = preview_schedule(min(steps_of(p) for p in grid), preview_steps) if steps_known else []
+    preview_template = template
+    if preview_scale:
+        preview_template = scaled_input(template, preview_scale) or template
+        if preview_template is template:
+            preview_scale = None
+    if not schedule and preview_scale:
+        schedule = [None]  # one preview rung at full steps, lower resolution
+
+    candidates = [dict(params) for params in grid]
+    full_cost = sum(_cost(template, p, steps_of(p) or 1, None) for p in candidates)
+    rungs = []
+    for index, steps in enumerate([*schedule, 'full']):
+        final = steps == 'full'
+        rung_template = template if final else preview_template
+        rung_params = candidates if final or steps is None else [
+            {**params, 'steps': min(steps, steps_of(params))} for params in candidates]
+
+        start = time.time()
+        runner = BatchRunner(rung_template, rung_params, urls, depth=depth,
+                             prefix=f"{prefix}/r{index}", on_progress=on_progress,
+                             download_dir=run_dir / f"rung{index}", pack=pack,
+                             result_cache=result_cache, images=images)
+        jobs = await runner.run()
+        scores = [score_files(job.files, scorer, source) if job.error is None else None
+                  for job in jobs]
+        scale = None if final else preview_scale
+        cost = sum(_cost(template, params, steps_of(params) or 1, scale) for params in rung_params)
+        rung = Rung(index, None if final else steps, scale, jobs, scores, cost, time.time() - start)
+        rungs.append(rung)
+        if on_rung is not None:
+            on_rung(rung)
+
+        if final:
+            ranked = sorted(((score, i) for i, score in enumerate(scores) if score is not None),
+                            reverse=True)
+            ranking = [(score, candidates[i], jobs[i].files) for score, i in ranked]
+            return SearchResult(rungs, ranking, full_cost)
+        candidates = promote(candidates, scores, keep)
+        if not candidates:
+            return SearchResult(rungs, [], full_cost)
@@ -0,0 +1,187 @@
+"""
+Compile a workflow once, then patch a few inputs per submission.
+
+A PromptTemplate holds the compiled API prompt plus named parameter slots
+(image, seed, denoise, positive, ...) that point at node inputs. render()
+copies only the nodes a patch touches and shares every other node dict
+with the template, so producing a prompt costs a handful of dict copies
+instead of a full workflow conversion.
+
+Rendered prompts share untouched node dicts with the template: treat them
+as read-only, or json.dumps() them straight into the request.
+
+Identical nodes are merged in the rendered prompt, not the template
+(BatchRunner and pack_prompts run compiler.dedupe_prompt before submitting):
+two CLIPTextEncode nodes that only hold the same placeholder text in the
+workflow are different slots once rendered. from_workflow(dedupe=True)
+merges at build time anyway, but never a node a slot writes to; a
+"node_id.input" parameter naming a merged node patches the node it was
+merged into.
+"""
+
+import os
+
+from comfykit.compiler import compile_workflow, dedupe_prompt, load_workflow
+
+# Slots discovered automatically: slot name -> (class_type, input name)
+DEFAULT_SLOTS = {
+    'image': ('LoadImage', 'image'),
+    'ckpt_name': ('CheckpointLoaderSimple', 'ckpt_name'),
+    'seed': ('KSampler', 'seed'),
+    'steps': ('KSampler', 'steps'),
+    'cfg': ('KSampler', 'cfg'),
+    'sampler_name': ('KSampler', 'sampler_name'),
+    'scheduler': ('KSampler', 'scheduler'),
+    'denoise': ('KSampler', 'denoise'),
+    'grow_mask_by': ('VAEEncodeForInpaint', 'grow_mask_by'),
+    'filename_prefix': ('SaveImage', 'filename_prefix'),
+}
+
+# Text slots found by following KSampler conditioning inputs upstream
+CONDITIONING_SLOTS = {'positive': 'positive', 'negative': 'negative'}
+
+
+def discover_slots(prompt):
+    """Map slot names to lists of (node_id, input name) in a compiled prompt"""
+    slots = {}
+    for node_id, node in prompt.items():
+        for slot, (class_type, input_name) in DEFAULT_SLOTS.items():
+            if node['class_type'] == class_type and input_name in node['inputs']:
+                slots.setdefault(slot, []).append((node_id, input_name))
+
+        if node['class_type'] != 'KSampler':
+            continue
+        for slot, input_name in CONDITIONING_SLOTS.items():
+            source = node['inputs'].get(input_name)
+            if not isinstance(source, list):
+                continue
+            encoder = prompt.get(source[0])
+            if encoder and encoder['class_type'] == 'CLIPTextEncode' and 'text' in encoder['inputs']:
+                target = (source[0], 'text')
+                if target not in slots.get(slot, []):
+                    slots.setdefault(slot, []).append(target)
+    return slots
+
+
+def _id_order(node_id):
+    return (0, int(node_id), '') if node_id.isdigit() else (1, 0, node_id)
+
+
+class PromptTemplate:
+    """A compiled API prompt with named parameter slots"""
+
+    def __init__(self, prompt, slots=None, aliases=None):
+        self.prompt = prompt
+        self.slots = discover_slots(prompt) if slots is None else dict(slots)
+        self.aliases = dict(aliases or {})
+
+    @classmethod
+    def from_workflow(cls, workflow, widget_names=None, slots=None, dedupe=False):
+        prompt = compile_workflow(workflow, widget_names)
+        aliases = None
+        if dedupe:
+            if slots is None:
+                slots = discover_slots(prompt)
+            # Merging a slot's node into another would patch both with one value
+            targets = {node_id for pairs in slots.values() for node_id, _ in pairs}
+            prompt, aliases = dedupe_prompt(prompt, keep=targets)
+        return cls(prompt, slots, aliases)
+
+    def add_slot(self, name, node_id, input_name):
+        """Expose another node input under `name`"""
+        node_id = self.aliases.get(str(node_id), str(node_id))
+        if node_id not in self.prompt:
+            raise KeyError(f"No node {node_id} in template")
+        self.slots.setdefault(name, []).append((node_id, input_name))
+
+    def with_prompt(self, prompt):
+        """A template over a rewritten prompt, keeping the slot targets whose
+        nodes are still in it"""
+        slots = {}
+        for name, targets in self.slots.items():
+            kept = [t for t in targets if t[0] in prompt]
+            if kept:
+                slots[name] = kept
+        return PromptTemplate(prompt, slots, self.aliases)
+
+    def outputs(self):
+        """Ids of the SaveImage nodes, in node id order"""
+        return sorted((node_id for node_id, node in self.prompt.items()
+                       if node['class_type'] == 'SaveImage'), key=_id_order)
+
+    def branch(self, output_id):
+        """A template of only the nodes SaveImage `output_id` reads from
+        (itself included), e.g. one KSampler -> VAEDecode -> SaveImage
+        branch of a workflow that has several"""
+        output_id = str(output_id)
+        if output_id not in self.prompt:
+            raise KeyError(f"No node {output_id} in template")
+        kept = set()
+        stack = [output_id]
+        while stack:
+            node_id = stack.pop()
+            if node_id in kept:
+                continue
+            kept.add(node_id)
+            stack.extend(v[0] for v in self.prompt[node_id]['inputs'].values()
+                         if isinstance(v, list) and v and v[0] in self.prompt)
+        return self.with_prompt({node_id: node for node_id, node in self.prompt.items()
+                                 if node_id in kept})
+
+    def targets(self, name):
+        """Return the (node_id, input name) pairs a parameter writes to.
+
+        `name` is either a slot name or a direct "node_id.input" reference.
+        """
+        if name in self.slots:
+            return self.slots[name]
+        node_id, sep, input_name = name.partition('.')
+        node_id = self.aliases.get(node_id, node_id)
+        if sep and node_id in self.prompt:
+            return [(node_id, input_name)]
+        raise KeyError(f"Unknown template parameter: {name}")
+
+    def get(self, name):
+        """Current template value of a parameter (first target)"""
+        node_id, input_name = self.targets(name)[0]
+        return self.prompt[node_id]['inputs'].get(input_name)
+
+    def render(self, params=None, **kwargs):
+        """Return a prompt with the given parameters patched in.
+
+        Parameters can be passed as a dict (needed for "node_id.input" keys)
+        and/or keyword arguments.
+        """
+        if params:
+            kwargs = {**params, **kwargs}
+        if not kwargs:
+            return dict(self.prompt)
+
+        prompt = dict(self.prompt)
+        copied = {}
+        for name, value in kwargs.items():
+            for node_id, input_name in self.targets(name):
+                inputs = copied.get(node_id)
+                if inputs is None:
+                    node = self.prompt[node_id]
+                    inputs = dict(node['inputs'])
+                    prompt[node_id] = {**node, 'inputs': inputs}
+                    copied[node_id] = inputs
+                inputs[input_name] = value
+        return prompt
+
+
+_templates = {}
+
+
+def load_template(path, widget_names=None):
+    """Load and compile a workflow file, reusing the compiled template until
+    the file changes on disk"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size, id(widget_names))
+    cached = _templates.get(path)
+    if cached is None or cached[0] != stamp:
+        template = PromptTemplate.from_workflow(load_workflow(path), widget_names)
+        cached = _templates[path] = (stamp, template)
+    return cached[1]
@@ -0,0 +1,309 @@
+"""
+Prompt completion tracking over ComfyUI's /ws event stream.
+
+The server pushes `executing`, `progress`, `executed`, `execution_success`
+and `execution_error` events as it works; a prompt is finished when an
+`executing` event arrives with node None (or success/error is reported).
+Each watched prompt gets an asyncio future that resolves the moment that
+event arrives.
+
+If the socket drops, the tracker polls /history for the prompts it is still
+waiting on, backing off exponentially, and keeps trying to reconnect. After
+every (re)connect it checks /history once so nothing finished during the
+gap is missed.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+import aiohttp
+
+from comfykit.config import COMFY_URL
+
+# How many finished prompts to remember for watch() calls that arrive late
+FINISHED_MEMORY = 1024
+
+log = logging.getLogger(__name__)
+
+
+class PromptFailed(Exception):
+    """Raised by PromptResult.raise_for_error() for failed prompts"""
+
+
+class PromptResult:
+    """Outcome of one prompt as seen by the tracker"""
+
+    def __init__(self, prompt_id):
+        self.prompt_id = prompt_id
+        self.host = None
+        self.outputs = {}
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def elapsed(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def raise_for_error(self):
+        if self.error is not None:
+            raise PromptFailed(f"Prompt {self.prompt_id}: {self.error}")
+        return self
+
+
+def _history_error(entry):
+    status = entry.get('status') or {}
+    if status.get('status_str') != 'error':
+        return None
+    for kind, data in status.get('messages', []):
+        if kind == 'execution_error':
+            return f"{data.get('node_type')}: {data.get('exception_message')}"
+    return "execution error"
+
+
+def history_result(prompt_id, entry):
+    """PromptResult for a /history entry, or None if it hasn't finished"""
+    status = (entry or {}).get('status') or {}
+    if not status.get('completed') and status.get('status_str') != 'error':
+        return None
+    result = PromptResult(prompt_id)
+    result.outputs = dict(entry.get('outputs') or {})
+    result.error = _history_error(entry)
+    return result
+
+
+class CompletionTracker:
+    """Resolve per-prompt futures from the server's websocket events.
+
+    Usage:
+        async with CompletionTracker(url) as tracker:
+            ... POST /prompt with client_id=tracker.client_id ...
+            result = await tracker.wait(prompt_id)
+    """
+
+    def __init__(self, url=COMFY_URL, client_id=None, session=None,
+                 poll_initial=0.5, poll_max=10.0, reconnect_max=30.0):
+        self.url = url.rstrip('/')
+        self.client_id = client_id or uuid.uuid4().hex
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.reconnect_max = reconnect_max
+
+        self._session = session
+        self._own_session = session is None
+        self._futures = {}
+        self._results = {}
+        self._finished = OrderedDict()
+        self._listeners = []
+        self._task = None
+        self._connected = asyncio.Event()
+        self._closed = False
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def start(self, wait_connected=5.0):
+        """Start listening. Waits up to `wait_connected` seconds for the
+        socket so prompts submitted right after are tracked by events."""
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        self._task = asyncio.ensure_future(self._run())
+        if wait_connected:
+            try:
+                await asyncio.wait_for(self._connected.wait(), wait_connected)
+            except asyncio.TimeoutError:
+                pass  # polling fallback is already running
+
+    async def close(self):
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._own_session and self._session is not None:
+            await self._session.close()
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+
+    def add_listener(self, callback):
+        """Call `callback(event_type, data, timestamp)` for every event"""
+        self._listeners.append(callback)
+
+    def watch(self, prompt_id):
+        """Return a future resolving to the PromptResult of `prompt_id`"""
+        future = self._futures.get(prompt_id)
+        if future is not None:
+            return future
+        future = asyncio.get_running_loop().create_future()
+        finished = self._finished.get(prompt_id)
+        if finished is not None:
+            future.set_result(finished)
+        else:
+            self._futures[prompt_id] = future
+            self._results.setdefault(prompt_id, PromptResult(prompt_id))
+        return future
+
+    async def wait(self, prompt_id, timeout=None):
+        return await asyncio.wait_for(asyncio.shield(self.watch(prompt_id)), timeout)
+
+    # -- event handling ---------------------------------------------------
+
+    def _result(self, prompt_id):
+        result = self._results.get(prompt_id)
+        if result is None:
+            result = self._results[prompt_id] = PromptResult(prompt_id)
+        return result
+
+    def _finish(self, prompt_id, error=None):
+        result = self._results.pop(prompt_id, None) or PromptResult(prompt_id)
+        if prompt_id in self._finished:
+            return
+        result.finished_at = time.time()
+        if error is not None:
+            result.error = error
+
+        self._finished[prompt_id] = result
+        while len(self._finished) > FINISHED_MEMORY:
+            self._finished.popitem(last=False)
+
+        future = self._futures.pop(prompt_id, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def handle_event(self, event_type, data):
+        """Apply one websocket event"""
+        now = time.time()
+        for callback in self._listeners:
+            # A broken listener must not take the tracker down with it
+            try:
+                callback(event_type, data, now)
+            except Exception:
+                log.exception("Tracker listener %r failed on a %s event", callback, event_type)
+
+        prompt_id = data.get('prompt_id') if isinstance(data, dict) else None
+        if prompt_id is None or prompt_id in self._finished:
+            return
+
+        if event_type == 'execution_start':
+            self._result(prompt_id).started_at = now
+        elif event_type == 'executing':
+            result = self._result(prompt_id)
+            if result.started_at is None:
+                result.started_at = now
+            if data.get('node') is None:
+                self._finish(prompt_id)
+        elif event_type == 'executed':
+            self._result(prompt_id).outputs[str(data.get('node'))] = data.get('output')
+        elif event_type == 'execution_success':
+            self._finish(prompt_id)
+        elif event_type == 'execution_error':
+            self._finish(prompt_id, f"{data.get('node_type')}: {data.get('exception_message')}")
+        elif event_type == 'execution_interrupted':
+            self._finish(prompt_id, "interrupted")
+
+    # -- connection loop --------------------------------------------------
+
+    def _ws_url(self):
+        base = self.url.replace('https://', 'wss://').replace('http://', 'ws://')
+        return f"{base}/ws?clientId={self.client_id}"
+
+    async def _run(self):
+        delay = self.poll_initial
+        while not self._closed:
+            try:
+                async with self._session.ws_connect(self._ws_url(), heartbeat=30) as ws:
+                    self._connected.set()
+                    delay = self.poll_initial
+                    await self.poll_history()
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._handle_message(msg.data)
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                        # binary frames are latent previews, not needed here
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                pass
+            except Exception:
+                # Whatever went wrong, the reconnect / polling loop must go on:
+                # every wait() depends on it
+                log.exception("Tracker connection to %s failed", self.url)
+            finally:
+                self._connected.clear()
+
+            if self._closed:
+                break
+
+            # Socket is down: poll what we're waiting on, then retry
+            try:
+                await self.poll_history()
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                pass
+            except Exception:
+                log.exception("Polling %s/history failed", self.url)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.poll_max if self._futures else self.reconnect_max)
+
+    def _handle_message(self, text):
+        """Apply one text frame; frames that aren't event JSON are skipped"""
+        try:
+            event = json.loads(text)
+        except ValueError:
+            log.warning("Ignoring a non-JSON websocket frame from %s: %.80r", self.url, text)
+            return
+        if not isinstance(event, dict):
+            return
+        data = event.get('data')
+        self.handle_event(event.get('type'), data if isinstance(data, dict) else {})
+
+    async def poll_history(self):
+        """Check /history for every prompt still being waited on"""
+        for prompt_id in list(self._futures):
+            async with self._session.get(f"{self.url}/history/{prompt_id}",
+                                         timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status != 200:
+                    continue
+                history = await response.json()
+            finished = history_result(prompt_id, history.get(prompt_id))
+            if finished is None:
+                continue
+            result = self._result(prompt_id)
+            result.outputs.update(finished.outputs)
+            self._finish(prompt_id, finished.error)
+
+
+def wait_for_prompt(prompt_id, url=COMFY_URL, client_id=None, timeout=None, on_event=None):
+    """Blocking helper for scripts: wait for one prompt and return its result.
+
+    Pass the client_id the prompt was queued with, or its events go to
+    another socket and only /history tells when it is done (to queue and
+    wait in one go, see comfykit.client.run_prompt).
+    `on_event(event_type, data, timestamp)` is called for every event.
+    """
+    async def _wait():
+        tracker = CompletionTracker(url, client_id)
+        if on_event is not None:
+            tracker.add_listener(on_event)
+        async with tracker:
+            return await tracker.wait(prompt_id, timeout)
+    return asyncio.run(_wait())
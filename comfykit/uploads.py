@@ -0,0 +1,159 @@
+"""
+Content-addressed uploads of input images and masks.
+
+Files are uploaded through /upload/image under a name derived from their
+SHA-256 (comfykit/<hash16>.png), so the same bytes always get the same
+LoadImage name and are only transferred once per server. A local manifest
+remembers which hashes each server already has, and caches file digests by
+(path, size, mtime) so unchanged source photos aren't even re-hashed.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from comfykit.client import ComfyClient, ComfyError
+from comfykit.config import CACHE_DIR
+
+UPLOAD_SUBFOLDER = "comfykit"
+MANIFEST_FILE = CACHE_DIR / "uploads.json"
+CHUNK_SIZE = 1024 * 1024
+
+
+def digest_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def digest_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hashed_name(digest, ext):
+    """Server-side file name for content with this digest"""
+    return f"{digest[:16]}{ext.lower()}"
+
+
+class UploadManifest:
+    """hash -> server filename per server, plus cached file digests"""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = Path(path)
+        self.files = {}
+        self.servers = {}
+        self._dirty = False
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.files = data.get('files', {})
+            self.servers = data.get('servers', {})
+
+    def digest(self, path):
+        """SHA-256 of a file, reusing the cached value if size/mtime match"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = digest_file(path)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._dirty = True
+        return digest
+
+    def lookup(self, url, digest):
+        return self.servers.get(url, {}).get(digest)
+
+    def record(self, url, digest, name):
+        self.servers.setdefault(url, {})[digest] = name
+        self._dirty = True
+
+    def forget(self, url, digest):
+        if self.servers.get(url, {}).pop(digest, None) is not None:
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'files': self.files, 'servers': self.servers}, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+class InputUploader:
+    """Upload inputs to one server, skipping content it already has"""
+
+    def __init__(self, client, manifest=None):
+        self.client = client
+        self.manifest = manifest if manifest is not None else UploadManifest()
+        self.uploaded = 0
+        self.skipped = 0
+
+    async def exists(self, name):
+        """Ask the server whether an input file is present (HEAD /view)"""
+        subfolder, _, filename = name.rpartition('/')
+        try:
+            await self.client.request('HEAD', '/view', read='text', params={
+                'filename': filename, 'subfolder': subfolder, 'type': 'input'})
+        except ComfyError as e:
+            if e.status == 404:
+                return False
+            raise
+        return True
+
+    async def upload_bytes(self, data, ext='.png', digest=None, verify=False):
+        """Upload bytes if needed; returns the LoadImage name to use.
+
+        With verify=True a manifest hit is double-checked against the server
+        (for servers whose input folder may have been cleaned).
+        """
+        digest = digest or digest_bytes(data)
+        url = self.client.url
+        name = self.manifest.lookup(url, digest)
+        if name is not None and (not verify or await self.exists(name)):
+            self.skipped += 1
+            return name
+
+        name = f"{UPLOAD_SUBFOLDER}/{hashed_name(digest, ext)}"
+        if await self.exists(name):
+            self.skipped += 1
+        else:
+            reply = await self.client.upload_image(data, name.rpartition('/')[2],
+                                                   subfolder=UPLOAD_SUBFOLDER, overwrite=True)
+            name = f"{reply['subfolder']}/{reply['name']}" if reply.get('subfolder') else reply['name']
+            self.uploaded += 1
+        self.manifest.record(url, digest, name)
+        return name
+
+    async def upload_file(self, path, verify=False):
+        """Upload a local image file if needed; returns the LoadImage name"""
+        digest = self.manifest.digest(path)
+        name = self.manifest.lookup(self.client.url, digest)
+        if name is not None and not verify:
+            self.skipped += 1
+            return name
+        with open(path, 'rb') as f:
+            data = f.read()
+        return await self.upload_bytes(data, Path(path).suffix or '.png', digest, verify)
+
+
+async def ensure_uploaded(urls, paths, manifest=None):
+    """Make sure every host has every file; returns {path: LoadImage name}.
+
+    Names are content-derived, so they are the same on every host.
+    """
+    manifest = manifest if manifest is not None else UploadManifest()
+    names = {}
+    for url in urls:
+        async with ComfyClient(url) as client:
+            uploader = InputUploader(client, manifest)
+            for path in paths:
+                names[path] = await uploader.upload_file(path)
+    manifest.save()
+    return names
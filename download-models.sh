@@ -10,20 +10,14 @@ echo "  ComfyUI Model Downloader"
 echo "========================================="
 echo ""
 
-# Function to download with progress
+# Parallel ranged download, resumable, SHA-256 checked before the file
+# gets its final name (URLs and hashes: model-checksums.json)
 download_model() {
-    local url=$1
-    local output=$2
-    local name=$3
-
-    if [ -f "$output" ]; then
-        echo "  ✓ $name already exists, skipping"
-        return
-    fi
+    local file=$1
+    local name=$2
 
     echo "  Downloading $name..."
-    wget -c "$url" -O "$output" --progress=bar:force 2>&1 | tail -n 1
-    echo "  ✓ Downloaded $name"
+    (cd "$(dirname "$0")" && python3 -m comfykit.downloads --models-dir "$MODELS_DIR" "$file")
 }
 
 echo "This script will help you download essential models."
@@ -38,9 +32,7 @@ echo ""
 
 # VAE (smaller, download first)
 echo "Downloading VAE..."
-mkdir -p "$MODELS_DIR/vae"
-VAE_URL="https://huggingface.co/stabilityai/sd-vae-ft-mse-original/resolve/main/vae-ft-mse-840000-ema-pruned.safetensors"
-download_model "$VAE_URL" "$MODELS_DIR/vae/vae-ft-mse-840000-ema-pruned.safetensors" "VAE"
+download_model vae-ft-mse-840000-ema-pruned.safetensors "VAE"
 echo ""
 
 echo "========================================="
@@ -76,4 +68,5 @@ echo "Next steps:"
 echo "  1. Download models to the directories shown above"
 echo "  2. Start ComfyUI: ~/Projects/comfy/start-comfyui.sh"
 echo "  3. Load your first workflow!"
+echo "  4. Check the downloads: python3 -m comfykit.checksums"
 echo ""
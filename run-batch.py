@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Overnight batch runner
+Queues a parameter grid from batch-overnight-workflow.json (or any workflow)
+and keeps the ComfyUI queue topped up until every combination has run
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from comfykit.batch import BatchRunner, expand_grid
+from comfykit.client import ComfyClient
+from comfykit.config import COMFY_URL, INPUT_MAX_SIDE
+from comfykit.crop import input_image
+from comfykit.journal import DONE, JobJournal
+from comfykit.maskcache import cached_mask_prompt, detectors
+from comfykit.outputs import new_run_dir
+from comfykit.packing import latent_size, max_variants
+from comfykit.preprocess import PreprocessError, Preprocessor
+from comfykit.profiler import NodeProfiler
+from comfykit.resultcache import ResultCache
+from comfykit.scheduler import format_report
+from comfykit.schema import NodeSchema
+from comfykit.search import DEFAULT_KEEP, default_scorer, load_scorer, successive_halving
+from comfykit.template import load_template
+from comfykit.uploads import ensure_uploaded
+
+WORKFLOW_FILE = "batch-overnight-workflow.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Queue a grid of seeds × denoise × cfg × steps × prompts",
+        epilog="Example: ./run-batch.py --seeds 20 --denoise 0.2 0.3 0.4 0.5",
+    )
+    parser.add_argument("--workflow", default=WORKFLOW_FILE)
+    parser.add_argument("--output", metavar="NODE",
+                        help="SaveImage node to batch when the workflow has several "
+                             "(default: the first); only the nodes it reads from run")
+    parser.add_argument("--url", nargs="+", default=[COMFY_URL],
+                        help="ComfyUI server(s); jobs go to the least-loaded one")
+    parser.add_argument("--image", help="input image: a name in ComfyUI/input/ or a local "
+                                        "file, which is uploaded once (by content hash)")
+    parser.add_argument("--mask", help="local mask drawn for a local --image (white = inpaint): "
+                                       "scaled to match the photo and sent as its alpha channel")
+    parser.add_argument("--max-side", type=int, default=INPUT_MAX_SIDE, metavar="PX",
+                        help="scale a local --image down to this longest side before "
+                             f"uploading, 0 to keep it (default: {INPUT_MAX_SIDE})")
+    parser.add_argument("--seeds", type=int, default=1, help="number of seeds to try")
+    parser.add_argument("--seed-start", type=int, default=1000)
+    parser.add_argument("--denoise", type=float, nargs="+")
+    parser.add_argument("--cfg", type=float, nargs="+")
+    parser.add_argument("--steps", type=int, nargs="+")
+    parser.add_argument("--prompt", action="append", dest="prompts",
+                        help="positive prompt (repeat for several)")
+    parser.add_argument("--ckpt", nargs="+", dest="checkpoints",
+                        help="checkpoint(s) to compare; jobs are grouped per checkpoint")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="prompts to keep in each server's queue (default: 2)")
+    parser.add_argument("--pack", type=int, default=1, metavar="K",
+                        help="fuse up to K jobs that share models into one prompt")
+    parser.add_argument("--pack-budget", type=int, default=1024, metavar="MB",
+                        help="memory the packed branches of one prompt may hold (default: 1024)")
+    parser.add_argument("--prefix", default="batch", help="output filename prefix")
+    parser.add_argument("--download", nargs="?", const="", metavar="DIR",
+                        help="fetch each image as it finishes into DIR "
+                             "(default: runs/<timestamp>/), with an index of its parameters")
+    parser.add_argument("--no-result-cache", action="store_true",
+                        help="with --download, run jobs even if the same prompt has run before")
+    parser.add_argument("--no-mask-cache", action="store_true",
+                        help="run GroundingDINO + SAM in every job instead of once per image")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="time every node and save the totals per node type "
+                             "(.csv, .json or .folded for flame graphs)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignore what the journal recorded for this batch and run all of it")
+    parser.add_argument("--dry-run", action="store_true", help="only print the grid")
+
+    search = parser.add_argument_group(
+        "search", "run the grid as cheap previews first and only the best at full settings")
+    search.add_argument("--search", action="store_true", help="successive-halving search")
+    search.add_argument("--preview-steps", type=int, nargs="+", metavar="N",
+                        help="sampler steps of the preview rung(s) (default: a quarter of steps)")
+    search.add_argument("--preview-scale", type=float, metavar="S",
+                        help="also scale the input image by S for the previews (e.g. 0.5)")
+    search.add_argument("--keep", type=float, default=DEFAULT_KEEP,
+                        help=f"fraction promoted from each rung (default: {DEFAULT_KEEP})")
+    search.add_argument("--scorer",
+                        help="similarity (to the input photo), sharpness, or module:function "
+                             "(default: similarity, or sharpness if the grid varies denoise)")
+    return parser.parse_args()
+
+
+def print_progress(job, progress):
+    icon = "❌" if job.error else "✅"
+    # Jobs left over when every host died were never submitted
+    took = f" ({job.finished_at - job.submitted_at:.0f}s)" if job.submitted_at is not None else ""
+    print(f"   {icon} #{job.index} done{took} - {progress.summary()}")
+
+
+async def _fetch_input(url, name):
+    async with ComfyClient(url) as client:
+        return await input_image(client, name)
+
+
+def run_search(args, template, grid, pack, download_dir, local_file, local_images):
+    """--search: successive halving over the grid, then the ranking"""
+    try:
+        scorer_name = args.scorer or default_scorer(grid)
+        scorer = load_scorer(scorer_name)
+    except (ValueError, ImportError, AttributeError) as e:
+        print(f"❌ Scorer: {e}")
+        return 1
+
+    source = None
+    if local_file is not None:
+        with Image.open(local_file) as image:
+            source = image.copy()
+    elif 'image' in template.slots:
+        name = grid[0].get('image') or template.get('image')
+        try:
+            source = asyncio.run(_fetch_input(args.url[0], name))
+        except Exception as e:
+            print(f"⚠️  Could not fetch {name} to score against: {e}")
+
+    def show_rung(rung):
+        label = f"{rung.steps} steps" if rung.steps else "full settings"
+        if rung.scale:
+            label += f", input at {rung.scale:g}×"
+        scores = [score for score in rung.scores if score is not None]
+        best = f", best score {max(scores):.4f}" if scores else ""
+        print(f"\n🔎 Rung {rung.index}: {len(rung.jobs)} candidate(s) at {label} "
+              f"in {time.strftime('%H:%M:%S', time.gmtime(rung.elapsed))}{best}\n")
+
+    print(f"🔎 Searching {len(grid)} candidate(s), keeping the best {args.keep:.0%} of each rung "
+          f"(scorer: {scorer_name})")
+    result_cache = None if args.no_result_cache else ResultCache()
+    try:
+        result = asyncio.run(successive_halving(
+            template, grid, args.url, download_dir, preview_steps=args.preview_steps,
+            keep=args.keep, scorer=scorer, source=source, preview_scale=args.preview_scale,
+            depth=args.depth, prefix=args.prefix, pack=pack, result_cache=result_cache,
+            images=local_images, on_rung=show_rung, on_progress=print_progress))
+    except KeyboardInterrupt:
+        print("\n⚠️  Stopped - run the same command again to reuse the finished images")
+        return 1
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    result.save(download_dir / "search.json")
+    print("=" * 60)
+    print(f"🏆 Best of {len(grid)}:")
+    for score, params, files in result.ranking[:5]:
+        print(f"   {score:.4f}  {params}")
+        for path in files:
+            print(f"           {path}")
+    print(f"   GPU work: {result.cost:,.0f} step-equivalents vs {result.full_cost:,.0f} "
+          f"for the full grid ({result.savings:.1f}× less)")
+    print(f"   Ranking saved to {download_dir / 'search.json'}")
+    print("=" * 60)
+    return 0 if result.ranking else 1
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("ComfyUI Overnight Batch Runner")
+    print("=" * 60)
+
+    grid = expand_grid(
+        seeds=range(args.seed_start, args.seed_start + args.seeds),
+        denoise=args.denoise or (None,),
+        cfg=args.cfg or (None,),
+        steps=args.steps or (None,),
+        prompts=args.prompts or (None,),
+        checkpoints=args.checkpoints or (None,),
+    )
+    local_images = {}
+    local_file = None
+    if args.mask and not (args.image and Path(args.image).is_file()):
+        print("❌ --mask needs a local --image file to go with")
+        return 1
+    if args.image:
+        image = args.image
+        if Path(image).is_file():
+            pre = Preprocessor(args.max_side)
+            try:
+                prepared = pre.masked(args.image, args.mask) if args.mask else pre.image(args.image)
+            except (PreprocessError, OSError) as e:
+                print(f"❌ {e}")
+                return 1
+            (w, h), (ow, oh) = prepared.size, prepared.original_size
+            if (w, h) != (ow, oh):
+                print(f"📐 {args.image}: {ow}x{oh} → {w}x{h}")
+            local_file = prepared.path
+            image = asyncio.run(ensure_uploaded(args.url, [local_file]))[local_file]
+            local_images[image] = local_file
+            print(f"📤 {args.image} → {image}")
+        for params in grid:
+            params['image'] = image
+
+    print(f"\n📋 Workflow: {args.workflow}")
+    template = load_template(args.workflow, NodeSchema(args.url[0]))
+    outputs = template.outputs()
+    if args.output is not None or len(outputs) > 1:
+        output = args.output or outputs[0]
+        if output not in outputs:
+            print(f"❌ No SaveImage node {output} in {args.workflow} "
+                  f"(SaveImage nodes: {', '.join(outputs) or 'none'})")
+            return 1
+        template = template.branch(output)
+        if len(outputs) > 1:
+            print(f"🌿 The workflow has {len(outputs)} SaveImage branches ({', '.join(outputs)}); "
+                  f"batching node {output}'s (pick another with --output)")
+    print(f"✅ {len(grid)} job(s) in the grid")
+
+    if args.dry_run:
+        for i, params in enumerate(grid):
+            print(f"   {i:5d}  {params}")
+        return 0
+
+    if detectors(template.prompt) and not args.no_mask_cache:
+        base = template.render(image=grid[0]['image']) if args.image else template.prompt
+        prompt, cache = cached_mask_prompt(base, args.url, images=local_images)
+        template = template.with_prompt(prompt)
+        print(f"🎭 Mask {'reused from cache' if cache.hits else 'detected once'}; "
+              f"detector removed from every job")
+
+    pack = 1
+    if args.pack > 1:
+        size = latent_size(template.prompt)
+        if size is None and local_file is not None:
+            with Image.open(local_file) as img:
+                size = (*img.size, 1)
+        pack = min(args.pack, max_variants(args.pack_budget * 1024 * 1024, *(size or (None, None))))
+        print(f"📦 Packing up to {pack} job(s) per prompt")
+
+    download_dir = None
+    if args.download is not None or args.search:
+        download_dir = Path(args.download) if args.download else new_run_dir()
+        print(f"📁 Saving images to {download_dir}/")
+
+    if args.search:
+        return run_search(args, template, grid, pack, download_dir, local_file, local_images)
+
+    journal = JobJournal()
+    profiler = NodeProfiler(Path(args.workflow).stem) if args.profile else None
+    result_cache = ResultCache() if download_dir is not None and not args.no_result_cache else None
+    runner = BatchRunner(template, grid, args.url, depth=args.depth,
+                         prefix=args.prefix, on_progress=print_progress,
+                         download_dir=download_dir, pack=pack, journal=journal,
+                         profiler=profiler, result_cache=result_cache, images=local_images)
+    if args.fresh:
+        journal.reset(runner.batch_id)
+    done = journal.status(runner.batch_id).get(runner.batch_id, {}).get(DONE, 0)
+    if done:
+        print(f"↩️  Resuming batch {runner.batch_id}: {done} job(s) already done")
+    print(f"🚀 Queueing to {', '.join(args.url)} (queue depth {runner.depth} per server)...\n")
+
+    try:
+        jobs = asyncio.run(runner.run())
+    except KeyboardInterrupt:
+        print("\n⚠️  Stopped - jobs already in the server queue will still run")
+        print("   Run the same command again to resume")
+        return 1
+    finally:
+        journal.close()
+
+    failed = [job for job in jobs if job.error]
+    print("\n" + "=" * 60)
+    if runner.resumed:
+        print(f"↩️  {runner.resumed} job(s) were done by an earlier run")
+    if runner.cached:
+        print(f"♻️  {runner.cached} job(s) reused images of identical earlier prompts")
+    print(f"🎉 Batch complete: {runner.progress.summary()}")
+    print(f"   Took {time.strftime('%H:%M:%S', time.gmtime(runner.progress.elapsed))}")
+    for job in failed:
+        print(f"   ❌ #{job.index} {job.params}: {job.error}")
+    if len(args.url) > 1:
+        print(format_report(runner.report))
+    if profiler is not None:
+        print("\n📊 Time per node type:")
+        print(profiler.report())
+        print(f"   Saved to {profiler.save(args.profile)}")
+    print("=" * 60)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
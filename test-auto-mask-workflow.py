@@ -4,20 +4,30 @@ Test the auto-mask inpainting workflow
 Detects and removes a person from example.png
 """
 
-import json
-import requests
+import sys
 import time
-from pathlib import Path
 
-COMFY_URL = "http://10.0.0.21:8188"
+from PIL import Image
+
+import comfykit
+from comfykit import WorkflowError, compile_workflow
+from comfykit.client import PromptRejected, run_prompt
+from comfykit.config import COMFY_URL
+from comfykit.crop import cropped_prompt, fetch_inputs, stitch
+from comfykit.maskcache import cached_mask_prompt, detectors, image_loader, mask_loader
+from comfykit.outputs import download_outputs
+from comfykit.profiler import NodeProfiler
+from comfykit.schema import NodeSchema
+
 WORKFLOW_FILE = "auto-mask-inpainting-workflow.json"
 TEST_IMAGE = "example.png"
+# --crop: inpaint only around the detected mask and paste it back
+CROP_TO_MASK = "--crop" in sys.argv
 
 def load_workflow():
     """Load the workflow JSON"""
     print("📋 Loading workflow...")
-    with open(WORKFLOW_FILE, 'r') as f:
-        workflow = json.load(f)
+    workflow = comfykit.load_workflow(WORKFLOW_FILE)
     print(f"✅ Workflow loaded: {len(workflow['nodes'])} nodes")
     return workflow
 
@@ -25,189 +35,122 @@ def convert_to_api_format(workflow):
     """Convert workflow to ComfyUI API format"""
     print("\n🔄 Converting to API format...")
 
-    prompt = {}
-
-    # Map node types to their widget parameter names
-    widget_mappings = {
-        'LoadImage': ['image'],
-        'GroundingDinoModelLoader (SegmentAnything)': ['model_name'],
-        'SAMModelLoader (SegmentAnything)': ['model_name', 'device_mode'],
-        'GroundingDinoSAMSegment (SegmentAnything)': ['prompt', 'threshold'],
-        'CheckpointLoaderSimple': ['ckpt_name'],
-        'CLIPTextEncode': ['text'],
-        'VAEEncodeForInpaint': ['grow_mask_by'],
-        'KSampler': ['seed', 'control_after_generate', 'steps', 'cfg', 'sampler_name', 'scheduler', 'denoise'],
-        'SaveImage': ['filename_prefix'],
-    }
-
-    for node in workflow['nodes']:
-        node_id = str(node['id'])
-        node_type = node['type']
-
-        prompt[node_id] = {
-            "inputs": {},
-            "class_type": node_type
-        }
-
-        # Add widget values
-        if 'widgets_values' in node and node_type in widget_mappings:
-            param_names = widget_mappings[node_type]
-            for i, param_name in enumerate(param_names):
-                if i < len(node['widgets_values']):
-                    prompt[node_id]['inputs'][param_name] = node['widgets_values'][i]
-
-    # Add connections from links
-    for link in workflow['links']:
-        link_id, source_node, source_slot, target_node, target_slot, link_type = link
-
-        # Find the target node's input name
-        target_node_data = next(n for n in workflow['nodes'] if n['id'] == target_node)
-        if 'inputs' in target_node_data and target_slot < len(target_node_data['inputs']):
-            input_name = target_node_data['inputs'][target_slot]['name']
-            prompt[str(target_node)]['inputs'][input_name] = [str(source_node), source_slot]
+    try:
+        prompt = compile_workflow(workflow, NodeSchema(COMFY_URL))
+    except WorkflowError as e:
+        print(f"❌ {e}")
+        return None
 
     print(f"✅ API format ready: {len(prompt)} nodes")
     return prompt
 
-def queue_workflow(prompt):
-    """Queue the workflow via API"""
+def reuse_detection(prompt):
+    """Swap GroundingDINO + SAM for the cached mask of this image"""
+    print("\n🎭 Looking up detected mask...")
+
+    try:
+        masked, cache = cached_mask_prompt(prompt, COMFY_URL)
+    except Exception as e:
+        print(f"⚠️  Mask cache unavailable ({e}), detecting in the workflow")
+        return prompt
+
+    if cache.hits:
+        print("✅ Cached mask reused - detection skipped")
+    else:
+        print("✅ Mask detected and cached for later runs")
+    return masked
+
+def crop_to_mask(prompt, detector, image_node):
+    """Send only the detected mask's bounding box (plus context) through
+    the model; returns (prompt, plan, image, mask)"""
+    print("\n✂️  Cropping to the detected mask...")
+
+    mask_node = mask_loader(detector)
+    if image_node is None or mask_node not in prompt:
+        print("⚠️  Mask not cached - sending the whole image")
+        return prompt, None, None, None
+
+    image, mask = fetch_inputs(COMFY_URL, prompt, image_node, mask_node)
+    prompt, plan = cropped_prompt(prompt, COMFY_URL, image, mask, image_node, mask_node)
+    if plan is None:
+        print("⚠️  Nothing detected - sending the whole image")
+    else:
+        (w, h), (gw, gh) = plan.crop_size, plan.size
+        print(f"✅ Cropped {w}x{h} of {image.width}x{image.height}, generating at {gw}x{gh}")
+    return prompt, plan, image, mask
+
+def queue_and_monitor(prompt):
+    """Queue the workflow via the API and monitor its progress"""
     print(f"\n🚀 Queueing workflow to {COMFY_URL}...")
 
+    start_time = time.time()
+    profiler = NodeProfiler()
+
+    def queued(prompt_id):
+        profiler.register(prompt_id, prompt)
+        print(f"✅ Workflow queued!")
+        print(f"   Prompt ID: {prompt_id}")
+        print(f"\n⏳ Monitoring progress...")
+        print("   This may take a while on first run (model loading)...")
+
+    def show(event_type, data, timestamp):
+        # Only this script's prompt reports to its client_id
+        profiler.on_event(event_type, data, timestamp)
+        elapsed = timestamp - start_time
+        if event_type == 'execution_start':
+            print(f"   🔄 Running... (elapsed: {elapsed:.1f}s)")
+        elif event_type == 'progress':
+            print(f"   📝 Node {data.get('node')}: step {data.get('value')}/{data.get('max')}")
+
     try:
-        response = requests.post(
-            f"{COMFY_URL}/prompt",
-            json={"prompt": prompt}
-        )
-
-        if response.status_code == 200:
-            result = response.json()
-            prompt_id = result.get('prompt_id')
-            print(f"✅ Workflow queued!")
-            print(f"   Prompt ID: {prompt_id}")
-            return prompt_id
-        else:
-            print(f"❌ Failed to queue: {response.status_code}")
-            print(f"   Response: {response.text}")
-            return None
+        result = run_prompt(prompt, COMFY_URL, on_event=show, on_queued=queued)
+    except PromptRejected as e:
+        print(f"❌ Failed to queue workflow: HTTP {e.status}")
+        print(f"   Response: {e.body}")
+        return None
+    except KeyboardInterrupt:
+        print("\n⚠️  Monitoring interrupted")
+        return None
     except Exception as e:
         print(f"❌ Error: {e}")
         return None
 
-def monitor_progress(prompt_id):
-    """Monitor workflow execution"""
-    print(f"\n⏳ Monitoring progress...")
-    print("   This may take a while on first run (model loading)...")
+    elapsed = time.time() - start_time
+    if not result.ok:
+        print(f"\n❌ Generation failed after {elapsed:.1f}s: {result.error}")
+        return None
 
-    start_time = time.time()
-    last_status = None
-
-    while True:
-        try:
-            response = requests.get(f"{COMFY_URL}/history/{prompt_id}")
-            if response.status_code == 200:
-                history = response.json()
-
-                if prompt_id in history:
-                    prompt_info = history[prompt_id]
-
-                    # Check status
-                    if 'status' in prompt_info:
-                        status_info = prompt_info['status']
-                        if 'completed' in status_info and status_info['completed']:
-                            elapsed = time.time() - start_time
-                            print(f"\n✅ Complete! (took {elapsed:.1f}s)")
-                            return True
-                        elif 'messages' in status_info:
-                            for msg in status_info['messages']:
-                                if msg != last_status:
-                                    print(f"   📝 {msg}")
-                                    last_status = msg
-
-                    # Check outputs
-                    if 'outputs' in prompt_info:
-                        elapsed = time.time() - start_time
-                        print(f"\n✅ Generation complete! (took {elapsed:.1f}s)")
-                        return True
-
-            # Check queue status
-            response = requests.get(f"{COMFY_URL}/queue")
-            if response.status_code == 200:
-                queue_data = response.json()
-                running = queue_data.get('queue_running', [])
-                pending = queue_data.get('queue_pending', [])
-
-                is_running = any(str(item[1]) == str(prompt_id) for item in running)
-                is_pending = any(str(item[1]) == str(prompt_id) for item in pending)
-
-                if not is_running and not is_pending:
-                    elapsed = time.time() - start_time
-
-                    # Check if it completed via history
-                    response = requests.get(f"{COMFY_URL}/history/{prompt_id}")
-                    if response.status_code == 200:
-                        history = response.json()
-                        if prompt_id in history and 'outputs' in history[prompt_id]:
-                            print(f"\n✅ Generation complete! (took {elapsed:.1f}s)")
-                            return True
-
-                    print(f"\n⚠️  No longer in queue after {elapsed:.1f}s")
-                    print("   Check ComfyUI web interface for results")
-                    return True
-
-            time.sleep(2)
-
-        except KeyboardInterrupt:
-            print("\n⚠️  Monitoring interrupted")
-            return False
-        except Exception as e:
-            print(f"❌ Error monitoring: {e}")
-            time.sleep(2)
-
-def check_output():
-    """Check for generated output"""
-    print(f"\n📁 Checking outputs...")
-
-    output_dir = Path("ComfyUI/output")
-    auto_inpainted = sorted(
-        output_dir.glob("auto_inpainted_*.png"),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True
-    )
-
-    if auto_inpainted:
-        latest = auto_inpainted[0]
-        size_mb = latest.stat().st_size / 1024 / 1024
-        mtime = time.strftime('%H:%M:%S', time.localtime(latest.stat().st_mtime))
-
-        print(f"✅ Latest output: {latest.name}")
-        print(f"   Size: {size_mb:.2f} MB")
-        print(f"   Time: {mtime}")
-        print(f"   Path: {latest}")
+    print(f"\n✅ Generation complete! (took {elapsed:.1f}s)")
+    print("\n📊 Time per node type:")
+    print(profiler.report())
+    return result
 
-        if len(auto_inpainted) > 1:
-            print(f"\n   Recent outputs ({len(auto_inpainted)} total):")
-            for f in auto_inpainted[:5]:
-                t = time.strftime('%H:%M:%S', time.localtime(f.stat().st_mtime))
-                print(f"   • {f.name} ({t})")
+def check_output(result):
+    """Download the generated outputs from the server"""
+    print(f"\n📁 Fetching outputs from {COMFY_URL}...")
 
-        return True
-    else:
-        print("❌ No auto_inpainted outputs found")
+    if result is None or not result.outputs:
+        print("❌ No outputs reported for this prompt")
+        print(f"   Check the ComfyUI web interface: {COMFY_URL}")
+        return []
 
-        # Check for any recent outputs
-        all_outputs = sorted(
-            output_dir.glob("*.png"),
-            key=lambda p: p.stat().st_mtime,
-            reverse=True
-        )[:5]
+    try:
+        paths = download_outputs(result, COMFY_URL)
+    except Exception as e:
+        print(f"❌ Error downloading outputs: {e}")
+        return []
+
+    if not paths:
+        print("❌ No saved images in the outputs")
+        return []
 
-        if all_outputs:
-            print(f"\n   Recent outputs in ComfyUI/output/:")
-            for f in all_outputs:
-                t = time.strftime('%H:%M:%S', time.localtime(f.stat().st_mtime))
-                print(f"   • {f.name} ({t})")
+    for path in paths:
+        size_mb = path.stat().st_size / 1024 / 1024
+        print(f"✅ Output: {path.name}")
+        print(f"   Size: {size_mb:.2f} MB")
+        print(f"   Path: {path}")
 
-        return False
+    return paths
 
 def main():
     print("="*60)
@@ -220,18 +163,28 @@ def main():
     # Load and convert workflow
     workflow = load_workflow()
     prompt = convert_to_api_format(workflow)
-
-    # Queue workflow
-    prompt_id = queue_workflow(prompt)
-    if not prompt_id:
-        print("\n❌ Failed to queue workflow")
+    if prompt is None:
         return
 
-    # Monitor progress
-    success = monitor_progress(prompt_id)
-
-    # Check output
-    check_output()
+    # Run detection once per image and detection prompt
+    detected = [(node_id, image_loader(prompt, node_id)) for node_id in detectors(prompt)]
+    prompt = reuse_detection(prompt)
+
+    plan = None
+    if CROP_TO_MASK and detected:
+        prompt, plan, image, mask = crop_to_mask(prompt, *detected[0])
+
+    # Queue workflow and monitor progress
+    result = queue_and_monitor(prompt)
+
+    # Download output
+    paths = check_output(result)
+    if plan is not None:
+        for path in paths:
+            with Image.open(path) as generated:
+                full_path = path.with_name(f"{path.stem}_full.png")
+                stitch(image, generated, mask, plan).save(full_path)
+            print(f"🧩 Stitched into the original: {full_path}")
 
     print("\n" + "="*60)
     print("🎉 Test complete!")
@@ -4,16 +4,29 @@ Test the inpainting workflow via ComfyUI API
 Creates a test mask and queues the workflow
 """
 
-import json
-import requests
+import sys
 import time
 from pathlib import Path
-from PIL import Image, ImageDraw
+from PIL import Image
+
+from comfykit.client import PromptRejected, run_prompt
+from comfykit.config import COMFY_URL
+from comfykit.crop import cropped_prompt, stitch
+from comfykit.masks import center_square, render_mask, save_mask
+from comfykit.outputs import download_outputs, new_run_dir
+from comfykit.profiler import NodeProfiler
+from comfykit.resultcache import ResultCache, result_key
+from comfykit.schema import NodeSchema
+from comfykit.template import load_template
 
 # Configuration
-COMFY_URL = "http://10.0.0.21:8188"
 INPUT_IMAGE = "example.png"
+MASK_IMAGE = "example_mask.png"
 WORKFLOW_FILE = "inpainting-workflow.json"
+# --crop: inpaint only the masked region (plus context) and paste it back
+CROP_TO_MASK = "--crop" in sys.argv
+# --no-cache: run on the server even if this exact prompt has run before
+USE_CACHE = "--no-cache" not in sys.argv
 
 def create_test_mask():
     """Create a simple test mask (white square in center)"""
@@ -25,30 +38,13 @@ def create_test_mask():
         print(f"❌ Input image not found: {input_path}")
         return False
 
-    img = Image.open(input_path)
-    width, height = img.size
+    with Image.open(input_path) as img:
+        width, height = img.size
 
-    # Create black mask
-    mask = Image.new('RGB', (width, height), 'black')
-    draw = ImageDraw.Draw(mask)
-
-    # Draw white square in center (this is the area to inpaint)
-    center_x, center_y = width // 2, height // 2
+    # Single-channel mask, white square in center (this is the area to inpaint)
     square_size = min(width, height) // 4
-
-    draw.rectangle(
-        [
-            center_x - square_size,
-            center_y - square_size,
-            center_x + square_size,
-            center_y + square_size
-        ],
-        fill='white'
-    )
-
-    # Save mask
-    mask_path = Path("ComfyUI/input") / "example_mask.png"
-    mask.save(mask_path)
+    mask_path = Path("ComfyUI/input") / MASK_IMAGE
+    save_mask(render_mask(width, height, [center_square(width, height)]), mask_path)
 
     print(f"✅ Test mask created: {mask_path}")
     print(f"   Image size: {width}x{height}")
@@ -60,157 +56,136 @@ def load_workflow():
     """Load and prepare the workflow"""
     print(f"\n📋 Loading workflow from {WORKFLOW_FILE}...")
 
-    with open(WORKFLOW_FILE, 'r') as f:
-        workflow = json.load(f)
+    # Compiled once; only the LoadImage input is patched per run
+    template = load_template(WORKFLOW_FILE, NodeSchema(COMFY_URL))
+    print(f"✅ Workflow loaded - using image: {INPUT_IMAGE}")
 
-    # Update the LoadImage node to use our test image
-    for node in workflow['nodes']:
-        if node['type'] == 'LoadImage':
-            node['widgets_values'] = [INPUT_IMAGE]
-            print(f"✅ Workflow loaded - using image: {INPUT_IMAGE}")
-            break
+    return template
 
-    return workflow
+def crop_to_mask(prompt, template):
+    """Send only the mask's bounding box (plus context) through the model"""
+    print("\n✂️  Cropping to the mask...")
 
-def queue_prompt(workflow):
-    """Queue the workflow via ComfyUI API"""
-    print(f"\n🚀 Queueing workflow to {COMFY_URL}...")
+    input_dir = Path("ComfyUI/input")
+    with Image.open(input_dir / INPUT_IMAGE) as image, Image.open(input_dir / MASK_IMAGE) as mask:
+        image_node = template.targets('image')[0][0]
+        prompt, plan = cropped_prompt(prompt, COMFY_URL, image, mask, image_node)
 
-    # Convert workflow to API format
-    prompt = {}
-    for node in workflow['nodes']:
-        node_id = str(node['id'])
-        prompt[node_id] = {
-            "inputs": {},
-            "class_type": node['type']
-        }
-
-        # Add inputs from links
-        if 'inputs' in node:
-            for inp in node['inputs']:
-                if 'link' in inp:
-                    # Find the source node
-                    for link in workflow['links']:
-                        if link[0] == inp['link']:
-                            source_node_id = str(link[1])
-                            source_output_index = link[2]
-                            prompt[node_id]['inputs'][inp['name']] = [source_node_id, source_output_index]
-
-        # Add widget values
-        if 'widgets_values' in node:
-            widget_names = {
-                'CheckpointLoaderSimple': ['ckpt_name'],
-                'CLIPTextEncode': ['text'],
-                'LoadImage': ['image'],
-                'SaveImage': ['filename_prefix'],
-                'KSampler': ['seed', 'control_after_generate', 'steps', 'cfg', 'sampler_name', 'scheduler', 'denoise'],
-                'VAEEncodeForInpaint': ['grow_mask_by']
-            }
-
-            if node['type'] in widget_names:
-                for i, name in enumerate(widget_names[node['type']]):
-                    if i < len(node['widgets_values']):
-                        prompt[node_id]['inputs'][name] = node['widgets_values'][i]
-
-    # Queue the prompt
+    if plan is None:
+        print("⚠️  Mask is empty - sending the whole image")
+    else:
+        (w, h), (gw, gh) = plan.crop_size, plan.size
+        print(f"✅ Cropped {w}x{h} at {plan.box[:2]}, generating at {gw}x{gh}")
+    return prompt, plan
+
+def stitch_outputs(paths, plan):
+    """Paste the generated crops back into the full image"""
+    print("\n🧩 Stitching into the original...")
+
+    input_dir = Path("ComfyUI/input")
+    with Image.open(input_dir / INPUT_IMAGE) as image, Image.open(input_dir / MASK_IMAGE) as mask:
+        for path in paths:
+            with Image.open(path) as generated:
+                full = stitch(image, generated, mask, plan)
+            full_path = path.with_name(f"{path.stem}_full.png")
+            full.save(full_path)
+            print(f"✅ Full image: {full_path}")
+
+def cached_result(prompt, cache):
+    """Images from an identical earlier run; returns (key, paths or None)"""
+    print("\n🔑 Checking the result cache...")
+
+    input_dir = Path("ComfyUI/input")
+    images = {name: input_dir / name for name in (INPUT_IMAGE, MASK_IMAGE)
+              if (input_dir / name).exists()}
     try:
-        response = requests.post(
-            f"{COMFY_URL}/prompt",
-            json={"prompt": prompt}
-        )
-
-        if response.status_code == 200:
-            result = response.json()
-            prompt_id = result.get('prompt_id')
-            print(f"✅ Workflow queued successfully!")
-            print(f"   Prompt ID: {prompt_id}")
-            return prompt_id
-        else:
-            print(f"❌ Failed to queue workflow: {response.status_code}")
-            print(f"   Response: {response.text}")
-            return None
+        key = result_key(prompt, COMFY_URL, images)
+    except Exception as e:
+        print(f"⚠️  Could not hash the prompt ({e}) - running it")
+        return None, None
+
+    if key is None:
+        print("⚠️  Input image not found on the server - running without the cache")
+        return None, None
+    paths = cache.restore(key, new_run_dir())
+    if paths is None:
+        print(f"   Not run before (key {key[:12]})")
+        return key, None
+    for path in paths:
+        print(f"✅ Reused: {path}")
+    return key, paths
+
+def queue_and_monitor(prompt):
+    """Queue the workflow via the API and monitor its progress"""
+    print(f"\n🚀 Queueing workflow to {COMFY_URL}...")
 
+    start_time = time.time()
+    profiler = NodeProfiler()
+
+    def queued(prompt_id):
+        profiler.register(prompt_id, prompt)
+        print(f"✅ Workflow queued successfully!")
+        print(f"   Prompt ID: {prompt_id}")
+        print(f"\n⏳ Monitoring progress...")
+
+    def show(event_type, data, timestamp):
+        # Only this script's prompt reports to its client_id
+        profiler.on_event(event_type, data, timestamp)
+        elapsed = timestamp - start_time
+        if event_type == 'execution_start':
+            print(f"   🔄 Running... (elapsed: {elapsed:.1f}s)")
+        elif event_type == 'progress':
+            print(f"   📝 Node {data.get('node')}: step {data.get('value')}/{data.get('max')}")
+
+    try:
+        result = run_prompt(prompt, COMFY_URL, on_event=show, on_queued=queued)
+    except PromptRejected as e:
+        print(f"❌ Failed to queue workflow: HTTP {e.status}")
+        print(f"   Response: {e.body}")
+        return None
+    except KeyboardInterrupt:
+        print("\n⚠️  Monitoring interrupted")
+        return None
     except Exception as e:
-        print(f"❌ Error queueing workflow: {e}")
+        print(f"❌ Error: {e}")
         return None
 
-def monitor_progress(prompt_id):
-    """Monitor the generation progress"""
-    print(f"\n⏳ Monitoring progress...")
+    elapsed = time.time() - start_time
+    if not result.ok:
+        print(f"\n❌ Generation failed after {elapsed:.1f}s: {result.error}")
+        return None
 
-    start_time = time.time()
-    last_status = None
-
-    while True:
-        try:
-            # Check queue status
-            response = requests.get(f"{COMFY_URL}/queue")
-            if response.status_code == 200:
-                queue_data = response.json()
-
-                # Check if prompt is still running
-                running = queue_data.get('queue_running', [])
-                pending = queue_data.get('queue_pending', [])
-
-                is_running = any(item[1] == prompt_id for item in running)
-                is_pending = any(item[1] == prompt_id for item in pending)
-
-                if is_running:
-                    status = "🔄 Running..."
-                elif is_pending:
-                    status = "⏸️  Pending in queue..."
-                else:
-                    status = "✅ Complete!"
-
-                if status != last_status:
-                    elapsed = time.time() - start_time
-                    print(f"   {status} (elapsed: {elapsed:.1f}s)")
-                    last_status = status
-
-                if not is_running and not is_pending:
-                    print(f"\n✅ Generation complete! (took {elapsed:.1f}s)")
-                    return True
-
-            time.sleep(1)
-
-        except KeyboardInterrupt:
-            print("\n⚠️  Monitoring interrupted")
-            return False
-        except Exception as e:
-            print(f"❌ Error monitoring: {e}")
-            return False
-
-def check_outputs():
-    """Check the generated outputs"""
-    print(f"\n📁 Checking outputs in ComfyUI/output/...")
-
-    output_dir = Path("ComfyUI/output")
-
-    # Find recent inpainted images
-    inpainted_files = sorted(
-        output_dir.glob("inpainted_*.png"),
-        key=lambda p: p.stat().st_mtime,
-        reverse=True
-    )
-
-    if inpainted_files:
-        latest = inpainted_files[0]
-        size_mb = latest.stat().st_size / 1024 / 1024
-        print(f"✅ Latest output: {latest.name}")
-        print(f"   Size: {size_mb:.2f} MB")
-        print(f"   Path: {latest}")
+    print(f"\n✅ Generation complete! (took {elapsed:.1f}s)")
+    print("\n📊 Time per node type:")
+    print(profiler.report())
+    return result
 
-        # Show a few recent outputs
-        if len(inpainted_files) > 1:
-            print(f"\n   Recent outputs:")
-            for f in inpainted_files[:5]:
-                mtime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(f.stat().st_mtime))
-                print(f"   • {f.name} ({mtime})")
+def check_outputs(result):
+    """Download the generated outputs from the server"""
+    print(f"\n📁 Fetching outputs from {COMFY_URL}...")
 
-        return True
-    else:
-        print("❌ No inpainted outputs found")
-        return False
+    if result is None or not result.outputs:
+        print("❌ No outputs reported for this prompt")
+        print(f"   Check the ComfyUI web interface: {COMFY_URL}")
+        return []
+
+    try:
+        paths = download_outputs(result, COMFY_URL)
+    except Exception as e:
+        print(f"❌ Error downloading outputs: {e}")
+        return []
+
+    if not paths:
+        print("❌ No saved images in the outputs")
+        return []
+
+    for path in paths:
+        size_mb = path.stat().st_size / 1024 / 1024
+        print(f"✅ Output: {path.name}")
+        print(f"   Size: {size_mb:.2f} MB")
+        print(f"   Path: {path}")
+
+    return paths
 
 def main():
     print("="*60)
@@ -223,25 +198,36 @@ def main():
 
     # Step 2: Load workflow
     try:
-        workflow = load_workflow()
+        template = load_workflow()
     except Exception as e:
         print(f"❌ Failed to load workflow: {e}")
         return
 
-    # Step 3: Queue workflow
-    prompt_id = queue_prompt(workflow)
-    if not prompt_id:
-        return
-
-    # Step 4: Monitor progress
-    if not monitor_progress(prompt_id):
-        print("\n⚠️  Could not confirm completion, check manually")
-
-    # Step 5: Check outputs
-    check_outputs()
+    # Step 3: Queue workflow with our test image in the LoadImage node
+    prompt = template.render(image=INPUT_IMAGE)
+    plan = None
+    if CROP_TO_MASK:
+        prompt, plan = crop_to_mask(prompt, template)
+
+    cache = ResultCache()
+    key, paths = cached_result(prompt, cache) if USE_CACHE else (None, None)
+    if paths is None:
+        # Step 4: Queue and monitor progress
+        result = queue_and_monitor(prompt)
+        if not result:
+            print("\n⚠️  Could not confirm completion, check manually")
+
+        # Step 5: Download outputs
+        paths = check_outputs(result)
+        if key is not None and paths:
+            cache.put(key, paths, result.outputs)
+    cache.save()
+
+    if plan is not None and paths:
+        stitch_outputs(paths, plan)
 
     print("\n" + "="*60)
-    print("🎉 Test complete! Check the output in ComfyUI/output/")
+    print("🎉 Test complete! Check the output in runs/")
     print(f"   Web UI: {COMFY_URL}")
     print("="*60)
 
@@ -0,0 +1,97 @@
+"""
+comfykit.broker in front of a FakeComfyServer: interactive prompts jump the
+batch backlog, and events reach clients that didn't send a client_id.
+"""
+
+import asyncio
+from pathlib import Path
+
+import aiohttp
+
+from comfykit.broker import BATCH, INTERACTIVE, PromptBroker
+from comfykit.fakeserver import FakeComfyServer
+from comfykit.template import load_template
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def prompt(seed):
+    return load_template(ROOT / "img2img-workflow.json").render(seed=seed)
+
+
+async def post(session, url, body):
+    async with session.post(url, json=body) as response:
+        assert response.status == 200
+        return (await response.json())['prompt_id']
+
+
+def test_interactive_prompt_is_dispatched_before_withdrawn_batch():
+    dispatched = []
+
+    async def main():
+        async with FakeComfyServer(exec_time=0.2) as server:
+            broker = PromptBroker(server.url, port=0, depth=2,
+                                  on_dispatch=lambda job: dispatched.append(job.priority))
+            withdraw = broker.withdraw
+
+            async def slow_withdraw(jobs):
+                # A prompt finishing while the broker talks to the server
+                # wakes the feeder with a slot free
+                withdrawn = await withdraw(jobs)
+                await broker._notify()
+                await asyncio.sleep(0.05)
+                return withdrawn
+
+            broker.withdraw = slow_withdraw
+            async with broker, aiohttp.ClientSession() as session:
+                for seed in range(6):
+                    await post(session, f"{broker.url}/batch/prompt", {'prompt': prompt(seed)})
+                while len(dispatched) < 2 or broker.running is None:
+                    await asyncio.sleep(0.01)
+                await post(session, f"{broker.url}/prompt", {'prompt': prompt(100)})
+                while len(dispatched) < 3:
+                    await asyncio.sleep(0.01)
+                return broker.stats
+
+    stats = asyncio.run(main())
+    assert dispatched[:3] == [BATCH, BATCH, INTERACTIVE]
+    assert stats[BATCH]['preempted'] == 1
+
+
+def test_events_without_client_id_are_broadcast():
+    async def main():
+        async with FakeComfyServer() as server, PromptBroker(server.url, port=0) as broker:
+            async with aiohttp.ClientSession() as session:
+                async with session.ws_connect(f"{broker.url}/ws?clientId=portal") as ws:
+                    prompt_id = await post(session, f"{broker.url}/prompt", {'prompt': prompt(1)})
+                    async for msg in ws:
+                        event = msg.json()
+                        data = event['data']
+                        if (event['type'] == 'executing' and data.get('node') is None
+                                and data.get('prompt_id') == prompt_id):
+                            return True
+
+    assert asyncio.run(asyncio.wait_for(main(), 10))
+
+
+def test_preempt_during_a_submit_does_not_run_the_prompt_twice():
+    dispatched = []
+
+    async def main():
+        async with FakeComfyServer(exec_time=0.05, submit_latency=0.3) as server:
+            broker = PromptBroker(server.url, port=0, depth=1,
+                                  on_dispatch=lambda job: dispatched.append(job.prompt_id))
+            async with broker, aiohttp.ClientSession() as session:
+                batch = await post(session, f"{broker.url}/batch/prompt", {'prompt': prompt(1)})
+                while batch not in broker.in_flight:
+                    await asyncio.sleep(0.01)
+                assert server.submitted == 0
+                # The batch prompt's POST to the server is still under way
+                await post(session, f"{broker.url}/prompt", {'prompt': prompt(2)})
+                while sum(stats['finished'] for stats in broker.stats.values()) < 2:
+                    await asyncio.sleep(0.01)
+                return server.submitted
+
+    submitted = asyncio.run(asyncio.wait_for(main(), 10))
+    assert submitted == 2
+    assert len(dispatched) == len(set(dispatched)) == 2
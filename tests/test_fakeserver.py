@@ -0,0 +1,244 @@
+"""
+comfykit's client pipeline against the in-process stand-ins
+(comfykit.fakeserver): submission and tracking, batch runs with downloads,
+multi-host scheduling and resumable model downloads.
+"""
+
+import asyncio
+import hashlib
+import io
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+from PIL import Image
+
+from comfykit.batch import BatchRunner
+from comfykit.checksums import ChecksumIndex
+from comfykit.client import ComfyClient
+from comfykit.downloads import DOWNLOADED, PRESENT, Download, download_models
+from comfykit.fakeserver import DEFAULT_SHADE, FakeComfyServer, FakeFileServer
+from comfykit.journal import DONE, FAILED, JobJournal
+from comfykit.resultcache import ResultCache
+from comfykit.scheduler import Scheduler
+from comfykit.template import load_template
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def img2img():
+    return load_template(ROOT / "img2img-workflow.json")
+
+
+def decode(data):
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        return image.convert('RGB')
+
+
+def test_client_runs_prompt_and_views_decodable_output():
+    async def main():
+        async with FakeComfyServer() as server:
+            async with ComfyClient(server.url) as client:
+                result = await client.run(img2img().render(seed=300), timeout=10)
+                image = result.outputs['8']['images'][0]
+                return result, await client.view(image['filename'], image['subfolder'])
+
+    result, data = asyncio.run(main())
+    assert result.ok
+    assert decode(data).getpixel((0, 0)) == (300 % 256,) * 3
+
+
+def test_view_serves_about_image_bytes():
+    server = FakeComfyServer(image_bytes=200 * 1024)
+    data = server.filler()
+    assert decode(data).getpixel((0, 0)) == (DEFAULT_SHADE,) * 3
+    assert abs(len(data) - 200 * 1024) < 0.05 * 200 * 1024
+
+
+def test_batch_runner_downloads_one_image_per_job(tmp_path):
+    grid = [{'seed': seed} for seed in (1, 2, 3, 4)]
+
+    async def main():
+        async with FakeComfyServer() as server:
+            runner = BatchRunner(img2img(), grid, server.url, download_dir=tmp_path)
+            return await runner.run(), runner
+
+    jobs, runner = asyncio.run(main())
+    assert [job.error for job in jobs] == [None] * 4
+    assert runner.progress.completed == 4
+    for job in jobs:
+        assert len(job.files) == 1
+        assert decode(job.files[0].read_bytes()).getpixel((0, 0)) == (job.params['seed'],) * 3
+
+
+def test_packed_batch_splits_outputs_back_per_job(tmp_path):
+    grid = [{'seed': seed} for seed in range(10, 15)]
+
+    async def main():
+        async with FakeComfyServer() as server:
+            runner = BatchRunner(img2img(), grid, server.url, download_dir=tmp_path, pack=2)
+            return await runner.run(), server.submitted
+
+    jobs, submitted = asyncio.run(main())
+    assert submitted == 3
+    for job in jobs:
+        assert job.error is None
+        assert len(job.files) == 1
+        assert decode(job.files[0].read_bytes()).getpixel((0, 0)) == (job.params['seed'],) * 3
+
+
+def test_batch_runner_reports_failed_jobs():
+    async def main():
+        async with FakeComfyServer(fail_types={'VAEDecode'}) as server:
+            return await BatchRunner(img2img(), [{'seed': 1}], server.url).run()
+
+    jobs = asyncio.run(main())
+    assert jobs[0].error.startswith('VAEDecode')
+
+
+def test_failed_download_fails_the_job_in_journal_and_progress(tmp_path):
+    grid = [{'seed': 1}, {'seed': 2}]
+
+    async def broken_view(request):
+        return web.Response(status=500)
+
+    async def main():
+        server = FakeComfyServer()
+        server.get_view = broken_view
+        with JobJournal(tmp_path / "journal.sqlite") as journal:
+            async with server:
+                runner = BatchRunner(img2img(), grid, server.url,
+                                     download_dir=tmp_path / "out", journal=journal)
+                jobs = await runner.run()
+            return jobs, runner.progress, journal.status(runner.batch_id)[runner.batch_id]
+
+    jobs, progress, status = asyncio.run(main())
+    assert all(job.error.startswith("download failed") for job in jobs)
+    assert (progress.completed, progress.failed) == (0, 2)
+    assert status == {FAILED: 2}
+
+
+def test_resume_fetches_images_of_jobs_done_without_them(tmp_path):
+    grid = [{'seed': 1}, {'seed': 2}]
+
+    def runner(journal, url, **kwargs):
+        return BatchRunner(img2img(), grid, url, journal=journal, **kwargs)
+
+    async def main():
+        with JobJournal(tmp_path / "journal.sqlite") as journal:
+            async with FakeComfyServer() as server:
+                await runner(journal, server.url).run()
+                fetch = runner(journal, server.url, download_dir=tmp_path / "out")
+                jobs = await fetch.run()
+                again = runner(journal, server.url, download_dir=tmp_path / "out")
+                await again.run()
+            status = journal.status(fetch.batch_id)[fetch.batch_id]
+            return jobs, fetch.progress, again.resumed, server.submitted, status
+
+    jobs, progress, resumed, submitted, status = asyncio.run(main())
+    assert submitted == 2  # the images came from the server's history
+    assert progress.completed == 2
+    assert all(len(job.files) == 1 and job.files[0].exists() for job in jobs)
+    assert resumed == 2
+    assert status == {DONE: 2}
+
+
+def test_cached_jobs_leave_resumed_progress_intact(tmp_path):
+    grid = [{'seed': 1}, {'seed': 2}, {'seed': 3}]
+    cache = ResultCache(tmp_path / "results")
+
+    async def main():
+        with JobJournal(tmp_path / "journal.sqlite") as journal:
+            async with FakeComfyServer() as server:
+                server.files[('input', '', img2img().get('image'))] = server.filler()
+                # Seed 3 has run before, in another batch
+                await BatchRunner(img2img(), grid[2:], server.url, prefix="warm",
+                                  download_dir=tmp_path / "warm", result_cache=cache).run()
+                # Seeds 1 and 2 ran without downloads; seed 3 never did
+                first = BatchRunner(img2img(), grid, server.url, journal=journal)
+                await first.run()
+                journal.requeued(first.batch_id, 2)
+
+                runner = BatchRunner(img2img(), grid, server.url, journal=journal,
+                                     download_dir=tmp_path / "out", result_cache=cache)
+                jobs = await runner.run()
+                return jobs, runner, server.submitted
+
+    jobs, runner, submitted = asyncio.run(main())
+    assert submitted == 4
+    assert runner.cached == 1 and jobs[2].host == 'cache'
+    assert (runner.progress.total_jobs, runner.progress.completed) == (2, 2)
+
+
+def test_scheduler_moves_work_off_a_dead_host():
+    template = img2img()
+
+    async def main():
+        fast, slow = FakeComfyServer(exec_time=0.02), FakeComfyServer(exec_time=0.05)
+        await fast.start()
+        await slow.start()
+        try:
+            async with Scheduler([fast.url, slow.url], refresh_interval=0.1) as scheduler:
+                runs = [asyncio.ensure_future(scheduler.run(template.render(seed=i)))
+                        for i in range(12)]
+                await asyncio.sleep(0.05)
+                await slow.stop()
+                results = await asyncio.gather(*runs)
+                return results, scheduler.report()
+        finally:
+            await fast.stop()
+
+    results, report = asyncio.run(main())
+    assert all(result.ok for result in results)
+    assert sum(row['completed'] for row in report) == 12
+    assert [row['alive'] for row in report] == [True, False]
+
+
+def test_fake_file_server_etag_is_a_content_digest():
+    data = b"model weights" * 1000
+
+    async def etag():
+        async with FakeFileServer({'/m.bin': data}) as server:
+            async with aiohttp.ClientSession() as session:
+                async with session.head(f"{server.url}/m.bin") as response:
+                    return response.headers['ETag']
+
+    first, second = asyncio.run(etag()), asyncio.run(etag())
+    assert first == second == f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+
+
+def test_download_resumes_after_a_cut_off_response(tmp_path):
+    data = bytes(range(256)) * 4096  # 1 MiB
+    digest = hashlib.sha256(data).hexdigest()
+
+    async def main():
+        async with FakeFileServer({'/m.bin': data}, fail_after=1000, failures=2) as server:
+            async with aiohttp.ClientSession() as session:
+                download = Download(session, f"{server.url}/m.bin", tmp_path / "m.bin", digest,
+                                    chunk_size=256 * 1024, workers=2, backoff=0.01)
+                return await download.run(), server.requests
+
+    result, requests = asyncio.run(main())
+    assert result == digest
+    assert (tmp_path / "m.bin").read_bytes() == data
+    assert not (tmp_path / "m.bin.part").exists()
+    assert any(r[2] for r in requests)  # fetched in ranges
+
+
+def test_download_models_without_range_support(tmp_path):
+    data = b"x" * 300_000
+    digest = hashlib.sha256(data).hexdigest()
+    index = ChecksumIndex(tmp_path / "index.json")
+
+    async def main():
+        async with FakeFileServer({'/ckpt.safetensors': data}, ranges=False) as server:
+            models = {'checkpoints/ckpt.safetensors': {'url': f"{server.url}/ckpt.safetensors",
+                                                      'sha256': digest}}
+            first = await download_models(models, tmp_path / "models", index=index)
+            second = await download_models(models, tmp_path / "models", index=index)
+            return first, second
+
+    first, second = asyncio.run(main())
+    assert first['checkpoints/ckpt.safetensors'] == (DOWNLOADED, digest)
+    assert second['checkpoints/ckpt.safetensors'] == (PRESENT, digest)
@@ -0,0 +1,59 @@
+"""
+comfykit.search rungs against a FakeComfyServer, whose outputs are gray at
+the seed's level: a brightness scorer ranks candidates by seed.
+"""
+
+import asyncio
+from pathlib import Path
+
+from PIL import Image
+
+from comfykit.fakeserver import FakeComfyServer
+from comfykit.search import default_scorer, promote, score_files, successive_halving
+from comfykit.template import load_template
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def brightness(image, source=None):
+    return float(image.mean())
+
+
+def test_search_promotes_the_best_seeds_of_each_setting(tmp_path):
+    # Globally every denoise 0.3 candidate outscores every 0.5 one
+    grid = ([{'seed': seed, 'denoise': 0.3} for seed in range(100, 108)] +
+            [{'seed': seed, 'denoise': 0.5} for seed in range(1, 9)])
+    template = load_template(ROOT / "img2img-workflow.json")
+
+    async def main():
+        async with FakeComfyServer(exec_time=0.01) as server:
+            return await successive_halving(template, grid, [server.url], tmp_path,
+                                            preview_steps=[4], keep=0.25, scorer=brightness)
+
+    result = asyncio.run(main())
+    preview, full = result.rungs
+    assert preview.steps == 4 and len(preview.jobs) == 16
+    assert [job.params['steps'] for job in preview.jobs] == [4] * 16
+    assert sorted(job.params['seed'] for job in full.jobs) == [7, 8, 106, 107]
+    assert [params['seed'] for _, params, _ in result.ranking] == [107, 106, 8, 7]
+    assert result.cost < result.full_cost
+
+
+def test_promote_skips_unscored_and_ranks_single_settings_together():
+    candidates = [{'seed': 1, 'cfg': cfg} for cfg in (5, 6, 7, 8)]
+    assert promote(candidates, [0.1, None, 0.9, 0.5], 0.5) == [candidates[2], candidates[3]]
+    assert promote(candidates, [None] * 4, 0.5) == []
+
+
+def test_unreadable_image_scores_none(tmp_path):
+    good, bad = tmp_path / "good.png", tmp_path / "bad.png"
+    Image.new('RGB', (8, 8), (51, 51, 51)).save(good)
+    bad.write_bytes(b"not a png")
+    assert abs(score_files([good], brightness) - 0.2) < 1e-6
+    assert score_files([good, bad], brightness) is None
+    assert score_files([tmp_path / "missing.png"], brightness) is None
+
+
+def test_default_scorer_avoids_similarity_across_denoise():
+    assert default_scorer([{'seed': 1, 'denoise': 0.3}, {'seed': 2, 'denoise': 0.3}]) == 'similarity'
+    assert default_scorer([{'seed': 1, 'denoise': 0.3}, {'seed': 1, 'denoise': 0.4}]) == 'sharpness'
@@ -0,0 +1,82 @@
+"""
+comfykit.tracker against a FakeComfyServer whose /ws goes away: prompts
+still resolve, by reconnecting or by polling /history.
+"""
+
+import asyncio
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from comfykit.fakeserver import FakeComfyServer
+from comfykit.template import load_template
+from comfykit.tracker import CompletionTracker
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def prompt(seed=1):
+    return load_template(ROOT / "img2img-workflow.json").render(seed=seed)
+
+
+async def submit(server, client_id):
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{server.url}/prompt",
+                                json={'prompt': prompt(), 'client_id': client_id}) as response:
+            return (await response.json())['prompt_id']
+
+
+def test_wait_resolves_after_the_socket_drops_mid_prompt():
+    async def main():
+        async with FakeComfyServer(exec_time=0.5) as server:
+            tracker = CompletionTracker(server.url, poll_initial=0.05, poll_max=0.2)
+            started = asyncio.Event()
+            tracker.add_listener(lambda event, data, ts: event == 'execution_start' and started.set())
+            async with tracker:
+                prompt_id = await submit(server, tracker.client_id)
+                await asyncio.wait_for(started.wait(), 5)
+                await server.drop_websockets()
+                result = await tracker.wait(prompt_id, timeout=10)
+                return result, tracker.connected
+
+    result, connected = asyncio.run(main())
+    assert result.ok
+    assert '8' in result.outputs
+    assert connected  # and back on the socket
+
+
+def test_wait_resolves_from_history_without_a_socket():
+    async def no_websocket(request):
+        return web.Response(status=404)
+
+    async def main():
+        server = FakeComfyServer(exec_time=0.1)
+        server.websocket = no_websocket
+        async with server:
+            tracker = CompletionTracker(server.url, poll_initial=0.05, poll_max=0.2)
+            await tracker.start(wait_connected=0)
+            try:
+                prompt_id = await submit(server, tracker.client_id)
+                result = await tracker.wait(prompt_id, timeout=10)
+                return result, tracker.connected
+            finally:
+                await tracker.close()
+
+    result, connected = asyncio.run(main())
+    assert result.ok
+    assert '8' in result.outputs
+    assert not connected
+
+
+def test_bad_frames_and_listeners_do_not_stop_the_tracker():
+    async def main():
+        tracker = CompletionTracker("http://127.0.0.1:9")
+        tracker.add_listener(lambda event, data, ts: 1 / 0)
+        future = tracker.watch('p1')
+        tracker._handle_message("not json")
+        tracker._handle_message('["not", "an", "event"]')
+        tracker._handle_message('{"type": "executing", "data": {"node": null, "prompt_id": "p1"}}')
+        return await asyncio.wait_for(future, 1)
+
+    assert asyncio.run(main()).ok
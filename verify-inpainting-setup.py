@@ -10,6 +10,9 @@ import json
 from pathlib import Path
 from datetime import datetime
 
+from comfykit.checksums import CORRUPT, UNPINNED, verify_models
+from comfykit.inventory import ModelInventory, model_label
+
 # Color codes for terminal output
 class Colors:
     GREEN = '\033[92m'
@@ -72,47 +75,46 @@ def check_pytorch_cuda():
         return False
 
 def check_models():
-    """Check for available models"""
+    """Check for available models (architecture read from the file headers)"""
     print_header("Model Files")
 
-    base_dir = Path("ComfyUI/models")
+    inventory = ModelInventory("ComfyUI/models")
+    models = inventory.scan(['checkpoints', 'inpaint', 'vae', 'loras'])
+    inventory.save()
+
+    def found(folder, extensions=('.safetensors',)):
+        return [m for m in models if m['folder'] == folder and Path(m['path']).suffix in extensions]
+
     results = {
-        'checkpoints': [],
-        'inpaint': [],
-        'vae': [],
-        'loras': []
+        'checkpoints': found('checkpoints'),
+        'inpaint': found('inpaint', ('.safetensors', '.pth')),
+        'vae': found('vae', ('.safetensors', '.pth')),
+        'loras': found('loras'),
     }
 
     # Check checkpoints
-    checkpoint_dir = base_dir / "checkpoints"
-    if checkpoint_dir.exists():
-        results['checkpoints'] = list(checkpoint_dir.glob("*.safetensors"))
+    if Path("ComfyUI/models/checkpoints").exists():
         if results['checkpoints']:
             print_check(True, f"Found {len(results['checkpoints'])} checkpoint model(s):")
             for model in results['checkpoints']:
-                size_gb = model.stat().st_size / 1024**3
-                model_type = "SDXL" if size_gb > 5 else "SD1.5"
-                print(f"  • {model.name} ({size_gb:.1f}GB - {model_type})")
+                print(f"  • {model['name']} ({model['size'] / 1024**3:.1f}GB - {model_label(model)})")
         else:
             print_check(False, "No checkpoint models found",
                        "Download from civitai.com or run ./download-models.sh")
 
-    # Check inpaint models
-    inpaint_dir = base_dir / "inpaint"
-    if inpaint_dir.exists():
-        results['inpaint'] = list(inpaint_dir.glob("*.safetensors")) + list(inpaint_dir.glob("*.pth"))
+    # Inpainting UNets (9 input channels) count whichever folder they are in
+    results['inpaint'] += [m for m in results['checkpoints'] if m['inpaint']]
+    if Path("ComfyUI/models/inpaint").exists() or results['inpaint']:
         if results['inpaint']:
             print_check(True, f"Found {len(results['inpaint'])} inpainting model(s)")
             for model in results['inpaint']:
-                print(f"  • {model.name}")
+                print(f"  • {model['name']}")
         else:
             print_check(False, "No dedicated inpainting models found",
                        "Standard checkpoints can still do inpainting using VAEEncodeForInpaint")
 
     # Check VAE
-    vae_dir = base_dir / "vae"
-    if vae_dir.exists():
-        results['vae'] = list(vae_dir.glob("*.safetensors")) + list(vae_dir.glob("*.pth"))
+    if Path("ComfyUI/models/vae").exists():
         if results['vae']:
             print_check(True, f"Found {len(results['vae'])} VAE model(s)")
         else:
@@ -120,14 +122,32 @@ def check_models():
                        "Built-in VAE from checkpoints will be used")
 
     # Check LoRAs
-    lora_dir = base_dir / "loras"
-    if lora_dir.exists():
-        results['loras'] = list(lora_dir.glob("*.safetensors"))
-        if results['loras']:
-            print_check(True, f"Found {len(results['loras'])} LoRA model(s)")
+    if results['loras']:
+        print_check(True, f"Found {len(results['loras'])} LoRA model(s)")
+        for model in results['loras']:
+            print(f"  • {model['name']} ({model_label(model)})")
 
     return results
 
+def check_model_integrity():
+    """Compare downloaded models with their expected SHA-256 (only files
+    that changed since the last run are hashed again)"""
+    print_header("Model Integrity")
+
+    results = verify_models("ComfyUI/models")
+    if not results:
+        print_check(True, "No models with known checksums to verify")
+        return []
+    for r in results:
+        if r['status'] == CORRUPT:
+            print_check(False, f"{r['name']}: checksum mismatch",
+                       "Incomplete or corrupted download - delete it and download again")
+        elif r['status'] == UNPINNED:
+            print_check(True, f"{r['name']}: no expected checksum to compare with")
+        else:
+            print_check(True, f"{r['name']}: checksum OK")
+    return [r['name'] for r in results if r['status'] == CORRUPT]
+
 def check_workflow_json():
     """Check if workflow JSON files are valid"""
     print_header("Workflow Files")
@@ -204,7 +224,7 @@ def check_input_output_dirs():
 
     return all_exist
 
-def generate_recommendations(model_results, workflow_valid):
+def generate_recommendations(model_results, workflow_valid, corrupt_models=()):
     """Generate recommendations based on checks"""
     print_header("Recommendations")
 
@@ -218,6 +238,13 @@ def generate_recommendations(model_results, workflow_valid):
             "   Or: ./download-models.sh"
         )
 
+    # Corrupted downloads
+    for name in corrupt_models:
+        recommendations.append(
+            f"🩹 Re-download ComfyUI/models/{name}:\n"
+            "   Its checksum doesn't match - the download is incomplete or corrupted"
+        )
+
     # Check for inpainting models
     if not model_results['inpaint']:
         recommendations.append(
@@ -229,7 +256,7 @@ def generate_recommendations(model_results, workflow_valid):
 
     # Check for VAE
     if not model_results['vae'] and model_results['checkpoints']:
-        has_vae_model = any('vae' in str(m).lower() for m in model_results['checkpoints'])
+        has_vae_model = any('vae' in m['name'].lower() for m in model_results['checkpoints'])
         if not has_vae_model:
             recommendations.append(
                 "🔧 Optional - Download VAE for better quality:\n"
@@ -270,17 +297,19 @@ def main():
     python_ok = check_python_version()
     cuda_ok = check_pytorch_cuda()
     model_results = check_models()
+    corrupt_models = check_model_integrity()
     workflow_valid = check_workflow_json()
     dirs_ok = check_input_output_dirs()
 
     # Summary
     print_header("Summary")
 
-    total_checks = 5
+    total_checks = 6
     passed_checks = sum([
         python_ok,
         cuda_ok,
         len(model_results['checkpoints']) > 0,
+        not corrupt_models,
         len(workflow_valid) > 0,
         dirs_ok
     ])
@@ -295,7 +324,7 @@ def main():
         print(f"\n{Colors.RED}❌ Several issues need to be resolved before inpainting will work.{Colors.RESET}\n")
 
     # Generate recommendations
-    generate_recommendations(model_results, len(workflow_valid) > 0)
+    generate_recommendations(model_results, len(workflow_valid) > 0, corrupt_models)
 
     return passed_checks == total_checks
 
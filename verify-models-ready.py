@@ -4,7 +4,9 @@
 from pathlib import Path
 import requests
 
-COMFY_URL = "http://10.0.0.21:8188"
+from comfykit.config import COMFY_URL
+from comfykit.checksums import CORRUPT, verify_models
+from comfykit.inventory import ModelInventory, model_label
 
 print("="*60)
 print("Auto-Mask Workflow - Model Verification")
@@ -46,14 +48,27 @@ else:
 
 # Check checkpoint
 print("\n📦 AI Checkpoint:")
-checkpoint_dir = Path("ComfyUI/models/checkpoints")
-rv_model = checkpoint_dir / "realisticVisionV60B1_v51HyperVAE.safetensors"
+rv_name = "realisticVisionV60B1_v51HyperVAE.safetensors"
+inventory = ModelInventory("ComfyUI/models")
+checkpoints = {m['name']: m for m in inventory.scan(['checkpoints'])}
+inventory.save()
 
-if rv_model.exists():
-    size_gb = rv_model.stat().st_size / 1024 / 1024 / 1024
-    print(f"  ✅ Model: {rv_model.name} ({size_gb:.1f} GB)")
+if rv_name in checkpoints:
+    model = checkpoints[rv_name]
+    print(f"  ✅ Model: {rv_name} ({model['size'] / 1024**3:.1f} GB - {model_label(model)})")
 else:
     print(f"  ❌ Realistic Vision model missing")
+    others = [m for m in checkpoints.values() if m['arch'] == 'SD1.5']
+    for model in others:
+        print(f"  ⚠️  SD1.5 alternative: {model['name']} ({model_label(model)})")
+
+# Check for incomplete or corrupted downloads
+print("\n🔒 Model Integrity:")
+corrupt = [r['name'] for r in verify_models("ComfyUI/models") if r['status'] == CORRUPT]
+for name in corrupt:
+    print(f"  ❌ {name}: checksum mismatch - download it again")
+if not corrupt:
+    print("  ✅ No corrupted models found")
 
 # Check ComfyUI is running
 print("\n🌐 ComfyUI Status:")
@@ -90,7 +105,7 @@ print("\n" + "="*60)
 print("✅ READY TO TEST!")
 print("="*60)
 print("\nManual Test Steps:")
-print("1. Open: http://10.0.0.21:8188")
+print(f"1. Open: {COMFY_URL}")
 print("2. Click 'Workflows' → 'auto-mask-inpainting-workflow.json'")
 print("3. Node 4: Keep prompt='person' or change to detect something else")
 print("4. Click 'Queue Prompt'")